@@ -3,8 +3,7 @@ Functions for the AI opponent, including thoes facilitating a level of performan
 marginally worse than the player
 """
 
-from game_engine import check_win, outflanked
-from components import legal_move
+from game_engine import count_flipped, legal_moves
 
 def number_flipped(board:list, colour:str, coords:tuple[int,int]) -> int:
     """
@@ -20,23 +19,8 @@ def number_flipped(board:list, colour:str, coords:tuple[int,int]) -> int:
     :rtype: int
     """
 
-    # We can count the amount of flipped tokens by using the outflanked() function
-    # First, see how many of the opponent's tokens there are before the token is placed
-    # We already do this in check_win(), we can repurpose it here
-    before_token_score = check_win(board)
-
-    # Create a 'theoretical board' where the token is placed
-    theoretical_board = [row.copy() for row in board]
-    after_token_board = outflanked(theoretical_board, colour, coords)
-    after_token_score = check_win(after_token_board)
-
-    # check_win scores are given as (light, dark)
-    score_index = 0 if colour == "Light" else 1
-
-    # Calculate number of tokens flipped
-    tokens_flipped = after_token_score[0][score_index] - before_token_score[0][score_index]
-
-    return tokens_flipped
+    # Count straight from the lines, rather than copying the board and recounting the score
+    return count_flipped(board, colour, coords)
 
 def possible_flip_counts(board:list, colour:str) -> dict:
     """
@@ -49,16 +33,8 @@ def possible_flip_counts(board:list, colour:str) -> dict:
     :return: dictionary containing coordinates, and number of tokens flipped
     :rtype: dict
     """
-    return_dict = {}
-
-    for x in range(len(board)):
-        for y in range(len(board)):
-            # For performance reasons, only check the moves that are legal
-            if legal_move(colour, (x,y), board):
-                tokens_flipepd = number_flipped(board, colour, (x,y))
-                return_dict[(x,y)] = tokens_flipepd
-
-    return return_dict
+    # Each legal move already comes with the tokens it flips
+    return {coords: len(flipped) for coords, flipped in legal_moves(board, colour)}
 
 def choose_move(previous_flipped:int, possible_flips:dict) -> tuple | None:
     """
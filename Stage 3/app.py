@@ -2,129 +2,242 @@
 Module containing flask logic
 """
 
-import json
 import os
-
-from flask import Flask, render_template, request
-from components import initialise_board, legal_move, print_board
-from game_engine import GameState, outflanked, has_legal_move, check_win
-from ai_opponent import number_flipped, possible_flip_counts, choose_move
+import time
+
+from flask import Flask, make_response, render_template, request
+from game_engine import GameState, play_move
+from ai_opponent import choose_move
+from search_opponent import DEFAULT_TIME_LIMIT, search_move
+from parallel_search import ParallelSearcher
+from opening_book import default_book
+from game_store import GameStore, JsonFileBackend
+from sqlite_backend import SqliteBackend
+from journal_backend import JournalBackend
+from ponder import Ponderer
 
 app = Flask(__name__)
 
+# Amount of games each process keeps in memory. Set OTHELLO_MAX_LIVE=0 when several
+# processes serve the same games, so that each request reads the latest save instead of
+# a copy another process has since moved on from.
+MAX_LIVE = int(os.environ.get("OTHELLO_MAX_LIVE", "1000"))
+
+# Every user's game. OTHELLO_STORE=sqlite keeps them in the OTHELLO_DB database,
+# OTHELLO_STORE=journal appends each game's moves to its own file in OTHELLO_SAVE_DIR,
+# otherwise each is saved as its own JSON file in OTHELLO_SAVE_DIR
+if os.environ.get("OTHELLO_STORE") == "sqlite":
+    game_store = GameStore(SqliteBackend(os.environ.get("OTHELLO_DB", "othello.db")), MAX_LIVE)
+elif os.environ.get("OTHELLO_STORE") == "journal":
+    game_store = GameStore(JournalBackend(os.environ.get("OTHELLO_SAVE_DIR", "saves")), MAX_LIVE)
+else:
+    game_store = GameStore(JsonFileBackend(os.environ.get("OTHELLO_SAVE_DIR", "saves")), MAX_LIVE)
+
+# Number of processes the hard AI may search with. 1 keeps it inside the Flask worker.
+AI_WORKERS = int(os.environ.get("OTHELLO_AI_WORKERS", "1"))
+parallel_searcher = None
+
+# Number of processes searching the hard AI's replies while the user thinks. 0 turns it off.
+PONDER_WORKERS = int(os.environ.get("OTHELLO_PONDER_WORKERS", "1"))
+ponderer = Ponderer(PONDER_WORKERS) if PONDER_WORKERS > 0 else None
+
 @app.route("/")
 def index():
     """
     Ran when the user first opens the page. 
-    Load the game, and present it to the user.
+    Load the user's game (found from their game_id cookie), and present it to the user.
     """
-    # board = initialise_board()
-    # return render_template("board.html", game_board=board)
-    global game_state
+    game_id = request.cookies.get("game_id")
+    game_state = game_store.get(game_id)
 
     # If the game is finished, delete the game state so we can make a new one
-    try:
-        if game_state.finished:
-            os.remove("game_state.json")
-    except NameError:
-        pass
-    
-    # If we don't already have a game_state.json file make one:
-    if not os.path.exists("game_state.json"):
-        game_state = GameState(board=initialise_board(), cur_player="Dark ")
-        with open("game_state.json", "w", encoding="UTF-8") as f:
-            json_str = json.dumps(game_state.to_dict(), indent=4)
-            f.write(json_str)
-
-    # If it does exist, load the game state
-    elif os.path.exists("game_state.json"):
-        with open("game_state.json", "r", encoding="UTF-8") as f:
-            game_state = GameState.from_dict(json.load(f))
-
-    return render_template(
+    if game_state is not None and game_state.finished:
+        game_store.delete(game_id)
+        game_state = None
+
+    # If the user doesn't already have a game make one:
+    if game_state is None:
+        game_id, game_state = game_store.new_game()
+
+    response = make_response(render_template(
         "board.html",
         game_board=game_state.board,
-        cur_player = game_state.cur_player
-    )
+        cur_player = game_state.cur_player,
+        version = game_state.version
+    ))
+    response.set_cookie("game_id", game_id, httponly=True, samesite="Lax")
+    return response
+
+
+@app.route("/board")
+def full_board():
+    """
+    Return the whole board for the user's game. The page asks for this when the changes
+    it has been sent don't follow on from the board it is showing.
+    """
+    game_state = game_store.get(request.cookies.get("game_id"))
+    if game_state is None:
+        return {"status" : "fail", "message" : "No game found, refresh to start a new game"}
+    return {
+        "status" : "success",
+        "board" : game_state.board,
+        "version" : game_state.version,
+        "player" : game_state.cur_player,
+        "finished" : game_state.finished
+    }
 
+def ai_choose_move(game_state:GameState, move_flips:int, difficulty:str,
+                   game_id:str | None = None) -> tuple | None:
+    """
+    Pick the AI's move for the current board. The hard AI takes at most
+    DEFAULT_TIME_LIMIT seconds, including any time spent waiting on pondering.
+
+    :param game_state: the game the AI is playing
+    :type game_state: GameState
+    :param move_flips: amount of tokens flipped by the user's last move
+    :type move_flips: int
+    :param difficulty: "hard" for the search based AI, anything else for the normal AI.
+        The hard AI runs across OTHELLO_AI_WORKERS processes if that is more than one.
+    :type difficulty: str
+    :param game_id: id of the game, so pondering can drop the moves the user didn't make
+    :type game_id: str | None
+    :return: the coordinates of the AI's move
+    :rtype: tuple | None
+    """
+    global parallel_searcher
+    start = time.perf_counter()
+    if difficulty == "hard" and ponderer is not None:
+        # Answer at once if this position was searched on the user's time
+        ai_move = ponderer.take(game_state, game_id, DEFAULT_TIME_LIMIT)
+        if ai_move is not None:
+            return ai_move
+    # Whatever time was spent waiting on pondering comes out of the search's budget
+    time_left = max(0.0, DEFAULT_TIME_LIMIT - (time.perf_counter() - start))
+    if difficulty == "hard" and AI_WORKERS > 1:
+        # Only start the worker processes the first time they are needed
+        if parallel_searcher is None:
+            parallel_searcher = ParallelSearcher(AI_WORKERS, book=default_book())
+        return parallel_searcher.search_state(game_state, "Light", time_limit=time_left)
+    if difficulty == "hard":
+        return search_move(game_state, "Light", time_left)
+    return choose_move(move_flips, game_state.flip_counts("Light"))
 
 @app.route("/move", methods=["GET", "POST"])
 def move():
     """
     Where the user has made a move, update game state if it's a legal move. 
-    Then get the AI to make a move. Update game state, and pass back to player.
+    Then get the AI to make a move. Update game state, and pass back to player
+    only the tokens that were placed and flipped, and the version of the board they
+    apply to.
+    Passing difficulty=hard uses the search based AI.
     """
     x = request.args.get("x", type=int)
     y = request.args.get("y", type=int)
+    difficulty = request.args.get("difficulty", "normal")
+
+    game_id = request.cookies.get("game_id")
+    # One move at a time for each game, as every request for it shares the same GameState
+    with game_store.game_lock(game_id):
+        return play_turn(game_id, x, y, difficulty)
+
+def play_turn(game_id:str | None, x:int, y:int, difficulty:str) -> dict:
+    """
+    Play the user's move and the AI's replies in a game, and describe the result for /move
+
+    :param game_id: id of the user's game
+    :type game_id: str | None
+    :param x: x coordinate of the user's move
+    :type x: int
+    :param y: y coordinate of the user's move
+    :type y: int
+    :param difficulty: "hard" for the search based AI, anything else for the normal AI
+    :type difficulty: str
+    :return: the /move response
+    :rtype: dict
+    """
+    game_state = game_store.get(game_id)
+    if game_state is None:
+        return {
+            "status" : "fail",
+            "finished" : False,
+            "player" : "n/a",
+            "version" : None,
+            "message" : "No game found, refresh to start a new game"
+        }
 
     # If the requested move is legal:
-    if legal_move(game_state.cur_player, (x,y), game_state.board):
+    if game_state.legal_move(game_state.cur_player, (x,y)):
         # Store how many tokens the move flips
-        move_flips = number_flipped(game_state.board, game_state.cur_player, (x,y))
-        # Mutate board
-        game_state.board[y][x] = game_state.cur_player
-        game_state.board = outflanked(game_state.board, game_state.cur_player, (x,y))
+        move_flips = game_state.count_flipped(game_state.cur_player, (x,y))
+        # Mutate board, keeping track of every change for the page
+        base_version = game_state.version
+        changes = [play_move(game_state, (x,y), game_state.cur_player)]
 
         # Check who can go
-        dark_has_legal = has_legal_move(game_state.board, "Dark ")
-        light_has_legal = has_legal_move(game_state.board, "Light")
+        dark_has_legal = game_state.has_legal_move("Dark ")
+        light_has_legal = game_state.has_legal_move("Light")
 
         # AI takes a move if it can
         if light_has_legal:
             # AI takes its turn
-            ai_move = choose_move(move_flips, possible_flip_counts(game_state.board, "Light"))
-            game_state.board[ai_move[1]][ai_move[0]] = "Light"
-            game_state.board = outflanked(game_state.board, "Light", ai_move)
+            ai_move = ai_choose_move(game_state, move_flips, difficulty, game_id)
+            changes.append(play_move(game_state, ai_move, "Light"))
 
         # Make the AI go until it's not their turn anymore
         while True:
             # Calculate legal moves
-            dark_has_legal = has_legal_move(game_state.board, "Dark ")
-            light_has_legal = has_legal_move(game_state.board, "Light")
+            dark_has_legal = game_state.has_legal_move("Dark ")
+            light_has_legal = game_state.has_legal_move("Light")
 
             # Game ends if neither player can go
             if not dark_has_legal and not light_has_legal:
                 print("Game is finished")
-                check_winner = check_win(game_state.board)
+                check_winner = game_state.score()
                 if check_winner[1] != "Draw":
                     message = f"{check_winner[1]} has won {check_winner[0][0]}:{check_winner[0][1]}"
                 else:
                     message = f"Draw at {check_winner[0][0]}!"
                 game_state.finished = True
+                game_store.save(game_id, game_state)
                 message = message + "\nRefresh to start new game"
                 return {
                     "status" : "n/a",
                     "player" : "n/a",
-                    "board" : game_state.board,
+                    "base_version" : base_version,
+                    "version" : game_state.version,
+                    "changes" : changes,
                     "finished" : message
                 }
 
             if light_has_legal and not dark_has_legal:
                 # AI takes its turn
-                ai_move = choose_move(move_flips, possible_flip_counts(game_state.board, "Light"))
-                game_state.board[ai_move[1]][ai_move[0]] = "Light"
-                game_state.board = outflanked(game_state.board, "Light", ai_move)
+                ai_move = ai_choose_move(game_state, move_flips, difficulty, game_id)
+                changes.append(play_move(game_state, ai_move, "Light"))
                 continue # Go back to top of while True to recheck game state
 
             break
 
-        # Update the json file
-        with open("game_state.json", "w", encoding="UTF-8") as f:
-            json_str = json.dumps(game_state.to_dict(), indent=4)
-            f.write(json_str)
+        # Save the game
+        game_store.save(game_id, game_state)
+
+        # Think about the next reply while the user thinks about their move
+        if difficulty == "hard" and ponderer is not None:
+            ponderer.ponder(game_id, game_state)
 
         # Return statement:
         return {
             "status" : "success",
             "finished" : game_state.finished,
-            "board" : game_state.board,
+            "base_version" : base_version,
+            "version" : game_state.version,
+            "changes" : changes,
             "player" : game_state.cur_player
         }
 
     # If the move is illegal:
     message = None
     # No changes to make - based on why move is illegal
-    if game_state.board[y][x] is not None:
+    if game_state.cell((x,y)) is not None:
         message = "Cell already occupied"
     else:
         message = "No outflanked peices"
@@ -132,7 +245,7 @@ def move():
     return {
         "status" : "fail",
         "finished" : game_state.finished,
-        "board" : game_state.board,
+        "version" : game_state.version,
         "player" : game_state.cur_player,
         "message" : message
     }
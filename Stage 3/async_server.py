@@ -0,0 +1,395 @@
+"""
+Module containing an asyncio game server with a WebSocket endpoint. Moves are accepted
+as soon as they arrive, the AI thinks in an executor so the event loop never waits for
+it, and the AI's reply and game over messages are pushed to the client when ready
+
+Run with:
+    python async_server.py --port 8765 --workers 4
+
+Messages are JSON objects. The client sends:
+    {"type": "new"}                                  start a new game
+    {"type": "resume", "game_id": "..."}             carry on a saved game
+    {"type": "move", "x": 2, "y": 3, "difficulty": "normal"}
+and the server sends back "game", "move", "ai_move", "game_over" and "error" messages.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from ai_opponent import choose_move
+from game_engine import GameState, play_move
+from game_store import GameStore, JsonFileBackend
+from search_opponent import search_move
+
+# Fixed string from the WebSocket standard (RFC 6455) used in the handshake
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Largest message accepted from a client
+MAX_MESSAGE_BYTES = 64 * 1024
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+class WebSocketClosed(Exception):
+    """
+    Raised when the other end closes the connection
+    """
+
+def accept_key(key:str) -> str:
+    """
+    Return the Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key
+    """
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+def encode_frame(payload:bytes, opcode:int = OPCODE_TEXT, mask:bytes | None = None) -> bytes:
+    """
+    Build a single WebSocket frame. Servers send unmasked frames, clients must mask theirs.
+
+    :param payload: message body
+    :type payload: bytes
+    :param opcode: frame type
+    :type opcode: int
+    :param mask: 4 byte masking key, or None for no masking
+    :type mask: bytes | None
+    :return: the frame
+    :rtype: bytes
+    """
+    mask_bit = 0x80 if mask is not None else 0
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+    if mask is None:
+        return header + payload
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return header + mask + masked
+
+async def read_frame(reader:asyncio.StreamReader) -> tuple:
+    """
+    Read a single WebSocket frame
+
+    :param reader: stream to read from
+    :type reader: asyncio.StreamReader
+    :return: (fin flag, opcode, unmasked payload)
+    :rtype: tuple
+    """
+    first, second = await reader.readexactly(2)
+    fin = bool(first & 0x80)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE_BYTES:
+        raise WebSocketClosed("Message too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return (fin, opcode, payload)
+
+class WebSocket:
+    """
+    Server side of a WebSocket connection
+    """
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.send_lock = asyncio.Lock()
+
+    async def receive(self) -> str:
+        """
+        Wait for the next text message, answering pings on the way
+
+        :return: the message
+        :rtype: str
+        """
+        parts = []
+        while True:
+            fin, opcode, payload = await read_frame(self.reader)
+            if opcode == OPCODE_CLOSE:
+                await self.send_frame(payload[:2], OPCODE_CLOSE)
+                raise WebSocketClosed()
+            if opcode == OPCODE_PING:
+                await self.send_frame(payload, OPCODE_PONG)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode not in (OPCODE_TEXT, OPCODE_CONTINUATION):
+                raise WebSocketClosed("Unsupported frame type")
+            parts.append(payload)
+            if sum(len(part) for part in parts) > MAX_MESSAGE_BYTES:
+                raise WebSocketClosed("Message too large")
+            if fin:
+                return b"".join(parts).decode()
+
+    async def send_frame(self, payload:bytes, opcode:int) -> None:
+        """
+        Send one frame, never interleaving with another sender
+        """
+        async with self.send_lock:
+            self.writer.write(encode_frame(payload, opcode))
+            await self.writer.drain()
+
+    async def send_json(self, message:dict) -> None:
+        """
+        Send a message as JSON text
+        """
+        await self.send_frame(json.dumps(message).encode(), OPCODE_TEXT)
+
+async def handshake(reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> bool:
+    """
+    Read the HTTP upgrade request and answer it
+
+    :return: whether the connection is now a WebSocket
+    :rtype: bool
+    """
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return False
+    lines = request.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    request_line = lines[0].split()
+    if (len(request_line) < 2 or request_line[0] != "GET" or request_line[1] != "/ws"
+            or headers.get("upgrade", "").lower() != "websocket"
+            or "sec-websocket-key" not in headers):
+        writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        return False
+
+    writer.write((
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n"
+    ).encode())
+    await writer.drain()
+    return True
+
+def compute_ai_move(cells:bytes, size:int, move_flips:int, difficulty:str) -> tuple | None:
+    """
+    Choose the AI's move. Runs in the executor, so it only takes plain data.
+
+    :param cells: cells of the board, see cells.py
+    :type cells: bytes
+    :param size: board dimension
+    :type size: int
+    :param move_flips: amount of tokens flipped by the user's last move
+    :type move_flips: int
+    :param difficulty: "hard" for the search based AI, anything else for the normal AI
+    :type difficulty: str
+    :return: the coordinates of the AI's move
+    :rtype: tuple | None
+    """
+    game_state = GameState.from_cells(cells, size, "Light")
+    if difficulty == "hard":
+        return search_move(game_state, "Light")
+    return choose_move(move_flips, game_state.flip_counts("Light"))
+
+class GameServer:
+    """
+    Asyncio server holding many WebSocket connections, each playing its own game.
+    Several connections may resume the same game, so only one turn at a time is played
+    in each game.
+    """
+    def __init__(self, store:GameStore, executor:Executor) -> None:
+        self.store = store
+        self.executor = executor
+        # Ids of the games with a turn being played
+        self.busy = set()
+
+    async def save(self, game_id:str, game_state:GameState) -> None:
+        """
+        Save a game without holding up the event loop on disk writes
+        """
+        await asyncio.to_thread(self.store.save, game_id, game_state)
+
+    async def play_turn(self, websocket:WebSocket, game_id:str, game_state:GameState,
+                        coords:tuple, difficulty:str) -> None:
+        """
+        Play the user's move, then push each AI move and the end of the game as they happen.
+        The game must already be marked busy, and is freed once the turn is over.
+        """
+        try:
+            await self.play_moves(websocket, game_id, game_state, coords, difficulty)
+        finally:
+            self.busy.discard(game_id)
+
+    async def play_moves(self, websocket:WebSocket, game_id:str, game_state:GameState,
+                         coords:tuple, difficulty:str) -> None:
+        """
+        The moves of one turn, for play_turn
+        """
+        loop = asyncio.get_running_loop()
+        move_flips = game_state.count_flipped("Dark ", coords)
+        base_version = game_state.version
+        change = play_move(game_state, coords, "Dark ")
+        await websocket.send_json({"type" : "move", "base_version" : base_version,
+                                   "version" : game_state.version, "changes" : [change]})
+
+        user_just_moved = True
+        while True:
+            dark_has_legal = game_state.has_legal_move("Dark ")
+            light_has_legal = game_state.has_legal_move("Light")
+
+            # Game ends if neither player can go
+            if not dark_has_legal and not light_has_legal:
+                game_state.finished = True
+                await self.save(game_id, game_state)
+                (light_score, dark_score), winner = game_state.score()
+                await websocket.send_json({"type" : "game_over", "winner" : winner,
+                                           "score" : [light_score, dark_score]})
+                return
+
+            # The AI goes after the user, and again for as long as the user can't go
+            if light_has_legal and (user_just_moved or not dark_has_legal):
+                ai_move = await loop.run_in_executor(self.executor, compute_ai_move,
+                                                     bytes(game_state.cells), game_state.size,
+                                                     move_flips, difficulty)
+                # apply_move doesn't check moves, so make sure the board hasn't changed
+                # under the AI while it was thinking
+                if not game_state.legal_move("Light", ai_move):
+                    continue
+                base_version = game_state.version
+                change = play_move(game_state, tuple(ai_move), "Light")
+                await websocket.send_json({"type" : "ai_move", "base_version" : base_version,
+                                           "version" : game_state.version, "changes" : [change]})
+                user_just_moved = False
+                continue
+
+            break
+
+        await self.save(game_id, game_state)
+        await websocket.send_json({"type" : "your_turn", "version" : game_state.version})
+
+    async def handle_connection(self, reader:asyncio.StreamReader,
+                                writer:asyncio.StreamWriter) -> None:
+        """
+        Serve one client until it disconnects
+        """
+        if not await handshake(reader, writer):
+            writer.close()
+            return
+
+        websocket = WebSocket(reader, writer)
+        game_id, game_state = None, None
+        turn = None
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive())
+                except json.JSONDecodeError:
+                    await websocket.send_json({"type" : "error", "message" : "Invalid JSON"})
+                    continue
+                if not isinstance(message, dict):
+                    await websocket.send_json({"type" : "error",
+                                               "message" : "Messages must be JSON objects"})
+                    continue
+
+                if turn is not None and not turn.done():
+                    await websocket.send_json({"type" : "error", "message" : "AI is thinking"})
+                    continue
+
+                message_type = message.get("type")
+                if message_type in ("new", "resume"):
+                    game_state = None
+                    if message_type == "resume":
+                        game_id = message.get("game_id")
+                        game_state = await asyncio.to_thread(self.store.get, game_id)
+                    if game_state is None or game_state.finished:
+                        game_id, game_state = await asyncio.to_thread(self.store.new_game)
+                    await websocket.send_json({
+                        "type" : "game",
+                        "game_id" : game_id,
+                        "board" : game_state.board,
+                        "version" : game_state.version,
+                        "player" : game_state.cur_player
+                    })
+
+                elif message_type == "move":
+                    if game_state is None or game_state.finished:
+                        await websocket.send_json({"type" : "error",
+                                                   "message" : "No game in progress"})
+                        continue
+                    if game_id in self.busy:
+                        # Another connection to the same game is waiting on the AI
+                        await websocket.send_json({"type" : "error", "message" : "AI is thinking"})
+                        continue
+                    try:
+                        coords = (int(message["x"]), int(message["y"]))
+                        legal = game_state.legal_move("Dark ", coords)
+                    except (KeyError, TypeError, ValueError, IndexError):
+                        await websocket.send_json({"type" : "error", "message" : "Invalid move"})
+                        continue
+                    if not legal:
+                        await websocket.send_json({"type" : "error", "message" : "Illegal move"})
+                        continue
+                    # Run the turn in the background so pings and closes are still answered
+                    self.busy.add(game_id)
+                    turn = asyncio.create_task(self.play_turn(
+                        websocket, game_id, game_state, coords,
+                        message.get("difficulty", "normal")))
+
+                else:
+                    await websocket.send_json({"type" : "error",
+                                               "message" : "Unknown message type"})
+        except (WebSocketClosed, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # Let a turn in progress finish and save, even though nobody is listening
+            if turn is not None and not turn.done():
+                try:
+                    await turn
+                except ConnectionError:
+                    pass
+            writer.close()
+
+    async def serve(self, host:str, port:int) -> asyncio.Server:
+        """
+        Start listening for connections
+
+        :return: the running server
+        :rtype: asyncio.Server
+        """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+async def main() -> None:
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(description="Async Othello server with a WebSocket endpoint")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="AI processes")
+    parser.add_argument("--save-dir", default="saves", help="directory to save games in")
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(args.workers) as executor:
+        server = GameServer(GameStore(JsonFileBackend(args.save_dir)), executor)
+        listener = await server.serve(args.host, args.port)
+        print(f"Listening on ws://{args.host}:{args.port}/ws")
+        async with listener:
+            await listener.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+Module for finding legal moves and flip counts for many boards at once with NumPy, for
+analysis and training where thousands of positions are looked at together.
+NumPy is only needed by this module, the game itself runs without it.
+
+Boards are int8 arrays of shape (boards, size, size), indexed [board, y, x] like the 2D
+lists, with DARK, LIGHT and EMPTY cell values. 8x8 boards can also be given as uint64
+bitboard arrays, laid out like bitboard.py.
+"""
+
+try:
+    import numpy as np
+except ImportError: # pragma: no cover
+    np = None
+
+from bitboard import board_masks, directions
+from board_tables import DIRECTIONS
+
+EMPTY = 0
+DARK = 1
+LIGHT = -1
+
+def require_numpy() -> None:
+    """
+    Raise a helpful error if NumPy isn't installed
+    """
+    if np is None:
+        raise ImportError("batch_moves needs NumPy, install it with: pip install numpy")
+
+def encode_boards(boards:list):
+    """
+    Convert 2D list boards into one int8 array
+
+    :param boards: list of 2D list boards, all the same size
+    :type boards: list
+    :return: int8 array of shape (boards, size, size)
+    """
+    require_numpy()
+    cell_values = {"Dark " : DARK, "Light" : LIGHT, None : EMPTY}
+    return np.array([[[cell_values[cell] for cell in row] for row in board] for board in boards],
+                    dtype=np.int8)
+
+def shifted(cells, dx:int, dy:int, distance:int):
+    """
+    Return the cells distance steps away in a direction, with cells off the board empty
+
+    :param cells: array of shape (boards, size, size)
+    :param dx: x step
+    :type dx: int
+    :param dy: y step
+    :type dy: int
+    :param distance: amount of steps
+    :type distance: int
+    :return: array where [n, y, x] holds cells[n, y + dy * distance, x + dx * distance]
+    """
+    size = cells.shape[1]
+    out = np.zeros_like(cells)
+    step_x, step_y = dx * distance, dy * distance
+    if abs(step_x) >= size or abs(step_y) >= size:
+        return out
+    # Slices of the output that have a cell to copy, and where that cell comes from
+    out_y = slice(max(0, -step_y), size - max(0, step_y))
+    out_x = slice(max(0, -step_x), size - max(0, step_x))
+    in_y = slice(max(0, step_y), size - max(0, -step_y))
+    in_x = slice(max(0, step_x), size - max(0, -step_x))
+    out[:, out_y, out_x] = cells[:, in_y, in_x]
+    return out
+
+def batch_flip_counts(cells, colour:str):
+    """
+    Count the tokens each cell would flip for the player to move, on every board at once
+
+    :param cells: int8 array of shape (boards, size, size) from encode_boards
+    :param colour: player to move, either "Dark " or "Light"
+    :type colour: str
+    :return: int array of shape (boards, size, size), 0 wherever the move isn't legal
+    """
+    require_numpy()
+    cells = np.asarray(cells, dtype=np.int8)
+    player = DARK if colour == "Dark " else LIGHT
+    size = cells.shape[1]
+    mine = cells == player
+    theirs = cells == -player
+    counts = np.zeros(cells.shape, dtype=np.int16)
+
+    for dx, dy in DIRECTIONS:
+        # Cells whose line in this direction has been all opponent tokens so far
+        run = np.ones(cells.shape, dtype=bool)
+        for distance in range(1, size):
+            if not run.any():
+                break
+            mine_there = shifted(mine, dx, dy, distance)
+            # A line of at least one opponent token ended by one of ours is flipped
+            if distance > 1:
+                counts += (run & mine_there) * np.int16(distance - 1)
+            run &= shifted(theirs, dx, dy, distance)
+
+    # Only empty cells can be played
+    counts[cells != EMPTY] = 0
+    return counts
+
+def batch_legal_moves(cells, colour:str):
+    """
+    Find every legal move for the player to move, on every board at once
+
+    :param cells: int8 array of shape (boards, size, size) from encode_boards
+    :param colour: player to move, either "Dark " or "Light"
+    :type colour: str
+    :return: bool array of shape (boards, size, size), True on each legal move
+    """
+    return batch_flip_counts(cells, colour) > 0
+
+def batch_legal_masks(player, opponent):
+    """
+    Find the legal moves on many 8x8 bitboard positions at once, with the same
+    shift-and-mask steps as bitboard.legal_moves_mask
+
+    :param player: uint64 array of the bitboards of the player to move
+    :param opponent: uint64 array of the other player's bitboards
+    :return: uint64 array with a bit set on each legal move
+    """
+    require_numpy()
+    size = 8
+    player = np.asarray(player, dtype=np.uint64)
+    opponent = np.asarray(opponent, dtype=np.uint64)
+    empty = ~(player | opponent)
+    moves = np.zeros_like(player)
+
+    def shift(bits, amount, mask):
+        # Bits shifted past either end of the 64 bits are dropped, like off the board
+        if amount > 0:
+            return (bits & mask) << np.uint64(amount)
+        return (bits & mask) >> np.uint64(-amount)
+
+    for amount, mask in directions(size):
+        mask = np.uint64(mask & board_masks(size)[0])
+        run = shift(player, amount, mask) & opponent
+        for _ in range(size - 3):
+            run |= shift(run, amount, mask) & opponent
+        moves |= shift(run, amount, mask) & empty
+    return moves
+
+def bitboards_to_cells(dark, light):
+    """
+    Convert arrays of 8x8 dark and light bitboards into an int8 array of boards
+
+    :param dark: uint64 array of dark bitboards
+    :param light: uint64 array of light bitboards
+    :return: int8 array of shape (boards, 8, 8)
+    """
+    require_numpy()
+
+    def unpack(bits):
+        # Bit x * 8 + y of each bitboard becomes [board, x, y], then swap to [board, y, x]
+        as_bytes = np.asarray(bits, dtype="<u8").view(np.uint8).reshape(-1, 8)
+        unpacked = np.unpackbits(as_bytes, axis=1, bitorder="little")
+        return unpacked.reshape(-1, 8, 8).transpose(0, 2, 1)
+
+    return (unpack(dark).astype(np.int8) * DARK + unpack(light).astype(np.int8) * LIGHT)
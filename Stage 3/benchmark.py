@@ -0,0 +1,452 @@
+"""
+Module containing benchmarks for the game engine: a suite timing the hot paths over fixed
+position corpora, with results saved as JSON and compared against a baseline, and some
+one-off before/after comparisons
+
+Run the suite with:
+    python benchmark.py --out results.json --baseline baseline.json --threshold 0.1
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+from ai_opponent import number_flipped, possible_flip_counts
+from components import initialise_board, legal_move
+from game_engine import GameState, check_win, count_flipped, has_legal_move, legal_moves, outflanked
+from cells import CELL_VALUES, encode_board, flipped_cells, legal_cell
+from parallel_search import ParallelSearcher
+from perft import perft
+
+# Corpus name to (board size, fewest random moves played, most random moves played, positions)
+CORPORA = {
+    "opening" : (8, 2, 12, 40),
+    "midgame" : (8, 20, 36, 40),
+    "endgame" : (8, 46, 56, 40),
+    "large16" : (16, 60, 160, 10),
+    "large32" : (32, 200, 600, 4)
+}
+
+# Seed all corpora are generated from, so every run times the same positions
+CORPUS_SEED = 1234
+
+def random_position(moves:int, seed:int = 0, size:int = 8) -> tuple:
+    """
+    Play random legal moves from the starting board to get a test position
+
+    :param moves: amount of moves to play
+    :type moves: int
+    :param seed: seed for the random moves, so positions are repeatable
+    :type seed: int
+    :param size: board dimension
+    :type size: int
+    :return: (board, colour to move)
+    :rtype: tuple
+    """
+    rng = random.Random(seed)
+    board = initialise_board(size)
+    colour = "Dark "
+    for _ in range(moves):
+        possible_moves = list(legal_moves(board, colour))
+        if not possible_moves:
+            # Pass, and stop if the other player can't go either
+            colour = "Dark " if colour == "Light" else "Light"
+            possible_moves = list(legal_moves(board, colour))
+            if not possible_moves:
+                break
+        (x, y), flipped = rng.choice(possible_moves)
+        for fx, fy in [(x, y)] + flipped:
+            board[fy][fx] = colour
+        colour = "Dark " if colour == "Light" else "Light"
+    return (board, colour)
+
+def copy_and_recount(board:list, colour:str, coords:tuple) -> int:
+    """
+    The original number_flipped: copy the board, flip the tokens and compare scores.
+    Kept only as the 'before' case of the benchmark.
+    """
+    before_token_score = check_win(board)
+    theoretical_board = [row.copy() for row in board]
+    after_token_board = outflanked(theoretical_board, colour, coords)
+    after_token_score = check_win(after_token_board)
+    score_index = 0 if colour == "Light" else 1
+    return after_token_score[0][score_index] - before_token_score[0][score_index]
+
+def time_per_call(func, cases:list, repeat:int = 5, number:int = 200) -> float:
+    """
+    Time a function over a list of argument tuples
+
+    :param func: function to time
+    :param cases: list of argument tuples to call func with
+    :type cases: list
+    :param repeat: amount of timing runs, the fastest is kept
+    :type repeat: int
+    :param number: amount of passes over the cases per timing run
+    :type number: int
+    :return: seconds per call
+    :rtype: float
+    """
+    def run():
+        for args in cases:
+            func(*args)
+    best = min(timeit.repeat(run, repeat=repeat, number=number))
+    return best / (number * len(cases))
+
+def bench_flip_count() -> dict:
+    """
+    Compare the per-move cost of counting flips before and after the flip-count kernel
+
+    :return: microseconds per move for each method
+    :rtype: dict
+    """
+    cases = []
+    for seed in range(20):
+        board, colour = random_position(20, seed)
+        for coords, _ in legal_moves(board, colour):
+            cases.append((board, colour, coords))
+
+    return {
+        "copy_and_recount" : time_per_call(copy_and_recount, cases) * 1e6,
+        "count_flipped" : time_per_call(count_flipped, cases) * 1e6
+    }
+
+def bench_serialisation() -> dict:
+    """
+    Compare the size and encode/decode speed of the JSON save format and the binary format
+
+    :return: dictionary of format to (bytes, microseconds to encode, microseconds to decode)
+    :rtype: dict
+    """
+    states = [GameState(*random_position(moves, seed))
+              for seed in range(10) for moves in (10, 30, 50)]
+
+    def to_json(game_state):
+        return json.dumps(game_state.to_dict(), indent=4)
+
+    def from_json(data):
+        return GameState.from_dict(json.loads(data))
+
+    results = {}
+    for name, encode, decode in [("json", to_json, from_json),
+                                 ("binary", GameState.to_bytes, GameState.from_bytes)]:
+        encoded = [encode(game_state) for game_state in states]
+        size = sum(len(data) for data in encoded) / len(encoded)
+        encode_time = time_per_call(encode, [(game_state,) for game_state in states], number=50)
+        decode_time = time_per_call(decode, [(data,) for data in encoded], number=50)
+        results[name] = (size, encode_time * 1e6, decode_time * 1e6)
+    return results
+
+def bench_parallel_scaling(max_workers:int | None = None, depth:int = 5) -> dict:
+    """
+    Measure nodes per second of a fixed-depth root-split search for 1 to max_workers processes
+
+    :param max_workers: largest pool to try (defaults to the number of cores)
+    :type max_workers: int | None
+    :param depth: depth to search each position to
+    :type depth: int
+    :return: dictionary of worker count to nodes per second
+    :rtype: dict
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    positions = [random_position(16, seed) for seed in range(3)]
+    results = {}
+    for workers in range(1, max_workers + 1):
+        searcher = ParallelSearcher(workers)
+        # Warm up the pool so process start-up isn't timed
+        searcher.search(*positions[0], depth=1)
+        nodes = 0
+        start = time.perf_counter()
+        for board, colour in positions:
+            searcher.search(board, colour, depth=depth)
+            nodes += searcher.nodes
+        results[workers] = nodes / (time.perf_counter() - start)
+        searcher.close()
+    return results
+
+def bench_large_boards(sizes:tuple = (8, 16, 32, 64, 128), moves:int = 20) -> dict:
+    """
+    Time move generation on boards of growing size with the same amount of moves played,
+    so the frontier stays about the same size while the area grows. GameState.legal_moves
+    is what the AI and the server use. The 2D list legal_moves goes through the bitboard
+    generator, which switches to the frontier from FRONTIER_MIN_SIZE up.
+
+    :param sizes: board dimensions to try
+    :type sizes: tuple
+    :param moves: random moves played on each board
+    :type moves: int
+    :return: dictionary of size to (frontier cells, microseconds for GameState.legal_moves,
+        microseconds for the 2D list legal_moves)
+    :rtype: dict
+    """
+    results = {}
+    for size in sizes:
+        state_cases = []
+        board_cases = []
+        for seed in range(5):
+            board, colour = random_position(moves, seed, size)
+            state_cases.append((GameState(board, colour), colour))
+            board_cases.append((board, colour))
+
+        def state_moves(game_state, colour):
+            list(game_state.legal_moves(colour))
+
+        def board_moves(board, colour):
+            list(legal_moves(board, colour))
+
+        frontier_cells = sum(len(game_state.frontier) for game_state, _ in state_cases)
+        results[size] = (frontier_cells / len(state_cases),
+                         time_per_call(state_moves, state_cases, number=10) * 1e6,
+                         time_per_call(board_moves, board_cases, number=10) * 1e6)
+    return results
+
+def board_bytes(board:list) -> int:
+    """
+    Memory used by a 2D list board: the outer list and each row. The strings themselves
+    are shared by every board, so they aren't counted.
+    """
+    return sys.getsizeof(board) + sum(sys.getsizeof(row) for row in board)
+
+def outflank_cells_copy(cells:bytearray, size:int, player:int, index:int) -> bytearray:
+    """
+    The cell encoding's version of outflank_copy: copy the cells and flip the outflanked ones
+    """
+    cells = bytearray(cells)
+    for flip in flipped_cells(cells, size, player, index):
+        cells[flip] = player
+    return cells
+
+def bench_cell_encoding(sizes:tuple = (8, 64)) -> dict:
+    """
+    Compare the 2D list of strings board against the flat bytearray cells used inside
+    GameState, for memory and for the speed of legal_move and outflanked
+
+    :param sizes: board dimensions to try
+    :type sizes: tuple
+    :return: dictionary of size to dictionary of measurement to (list value, cells value),
+        with bytes per board and microseconds per call
+    :rtype: dict
+    """
+    results = {}
+    for size in sizes:
+        positions = [random_position(size * size // 3, seed, size) for seed in range(5)]
+        list_cases, cell_cases, list_moves, cell_moves = [], [], [], []
+        for board, colour in positions:
+            cells = encode_board(board)
+            player = CELL_VALUES[colour]
+            for x in range(size):
+                for y in range(size):
+                    if board[y][x] is None:
+                        list_cases.append((colour, (x, y), board))
+                        cell_cases.append((cells, size, player, x * size + y))
+            for (x, y), _ in legal_moves(board, colour):
+                list_moves.append((board, colour, (x, y)))
+                cell_moves.append((cells, size, player, x * size + y))
+
+        board, _ = positions[0]
+        number = 20 if size <= 16 else 1
+        results[size] = {
+            "bytes" : (board_bytes(board), sys.getsizeof(encode_board(board))),
+            "legal_move" : (time_per_call(legal_move, list_cases, number=number) * 1e6,
+                            time_per_call(legal_cell, cell_cases, number=number) * 1e6),
+            "outflanked" : (time_per_call(outflank_copy, list_moves, number=number) * 1e6,
+                            time_per_call(outflank_cells_copy, cell_moves, number=number) * 1e6)
+        }
+    return results
+
+def position_corpus(name:str) -> list:
+    """
+    Build one of the fixed position corpora
+
+    :param name: key of CORPORA
+    :type name: str
+    :return: list of (board, colour to move)
+    :rtype: list
+    """
+    size, fewest, most, count = CORPORA[name]
+    rng = random.Random(f"{CORPUS_SEED}-{name}")
+    return [random_position(rng.randint(fewest, most), rng.randrange(1 << 30), size)
+            for _ in range(count)]
+
+def outflank_copy(board:list, colour:str, coords:tuple) -> list:
+    """
+    outflanked on a copy of the board, as outflanked changes the board it is given
+    """
+    return outflanked([row.copy() for row in board], colour, coords)
+
+def hot_path_cases(positions:list) -> dict:
+    """
+    Build the argument tuples for each hot path function over a corpus
+
+    :param positions: list of (board, colour to move)
+    :type positions: list
+    :return: dictionary of name to (function, list of argument tuples)
+    :rtype: dict
+    """
+    empty_cells = []
+    moves = []
+    for board, colour in positions:
+        size = len(board)
+        empty_cells.extend((colour, (x, y), board) for x in range(size) for y in range(size)
+                           if board[y][x] is None)
+        moves.extend((board, colour, coords) for coords, _ in legal_moves(board, colour))
+    return {
+        "legal_move" : (legal_move, empty_cells),
+        "outflanked" : (outflank_copy, moves),
+        "has_legal_move" : (has_legal_move, positions),
+        "possible_flip_counts" : (possible_flip_counts, positions),
+        "number_flipped" : (number_flipped, moves)
+    }
+
+def peak_memory(func, cases:list) -> int:
+    """
+    Largest amount of memory allocated at once while calling a function over a list of
+    argument tuples
+
+    :return: peak bytes allocated
+    :rtype: int
+    """
+    tracemalloc.start()
+    try:
+        for args in cases:
+            func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_suite(repeat:int = 3, number:int = 5, perft_depth:int = 6,
+              corpora:tuple = tuple(CORPORA)) -> dict:
+    """
+    Time each hot path over each corpus, measure its peak memory, and run perft
+
+    :param repeat: amount of timing runs, the fastest is kept
+    :type repeat: int
+    :param number: amount of passes over a corpus per timing run
+    :type number: int
+    :param perft_depth: deepest perft to run from the starting board
+    :type perft_depth: int
+    :param corpora: names of the corpora to use
+    :type corpora: tuple
+    :return: dictionary of ops per second and peak bytes for each corpus and function,
+        and perft node counts and nodes per second for each depth
+    :rtype: dict
+    """
+    results = {"ops_per_second" : {}, "peak_bytes" : {}, "perft" : {}}
+    for name in corpora:
+        results["ops_per_second"][name] = {}
+        results["peak_bytes"][name] = {}
+        for function_name, (func, cases) in hot_path_cases(position_corpus(name)).items():
+            if not cases:
+                continue
+            seconds = time_per_call(func, cases, repeat, number)
+            results["ops_per_second"][name][function_name] = 1 / seconds
+            results["peak_bytes"][name][function_name] = peak_memory(func, cases)
+
+    for depth in range(1, perft_depth + 1):
+        game_state = GameState(initialise_board(8), "Dark ")
+        start = time.perf_counter()
+        # No subtree cache, so this measures the engine rather than the cache
+        nodes = perft(game_state, "Dark ", depth)
+        seconds = time.perf_counter() - start
+        results["perft"][str(depth)] = {
+            "nodes" : nodes,
+            "nodes_per_second" : nodes / seconds if seconds > 0 else 0.0
+        }
+    return results
+
+def compare(results:dict, baseline:dict, threshold:float = 0.1) -> list:
+    """
+    Find where results are worse than a baseline: a hot path more than threshold slower,
+    or a perft count that has changed at all
+
+    :param results: results from run_suite
+    :type results: dict
+    :param baseline: earlier results from run_suite
+    :type baseline: dict
+    :param threshold: fraction of speed that may be lost before it counts as a regression
+    :type threshold: float
+    :return: list of messages describing each regression
+    :rtype: list
+    """
+    regressions = []
+    for name, functions in baseline.get("ops_per_second", {}).items():
+        for function_name, old_ops in functions.items():
+            new_ops = results["ops_per_second"].get(name, {}).get(function_name)
+            if new_ops is not None and new_ops < old_ops * (1 - threshold):
+                regressions.append(f"{function_name} on {name}: {new_ops:.0f} ops/s, "
+                                   f"was {old_ops:.0f} ({new_ops / old_ops - 1:+.0%})")
+    for depth, old in baseline.get("perft", {}).items():
+        new = results["perft"].get(depth)
+        if new is not None and new["nodes"] != old["nodes"]:
+            regressions.append(f"perft {depth}: {new['nodes']} nodes, was {old['nodes']}")
+    return regressions
+
+def print_suite(results:dict) -> None:
+    """
+    Print suite results as a table
+    """
+    for name, functions in results["ops_per_second"].items():
+        print(name)
+        for function_name, ops in functions.items():
+            peak = results["peak_bytes"][name][function_name]
+            print(f"    {function_name:<22}{ops:>14,.0f} ops/s{peak / 1024:>10,.1f} KiB peak")
+    for depth, perft_result in results["perft"].items():
+        print(f"perft {depth}: {perft_result['nodes']:,} nodes, "
+              f"{perft_result['nodes_per_second']:,.0f} nodes/s")
+
+def main() -> None:
+    """
+    Command line entry point for the benchmark suite
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Othello engine")
+    parser.add_argument("--out", default=None, help="file to save results to as JSON")
+    parser.add_argument("--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fraction slower than the baseline that counts as a regression")
+    parser.add_argument("--perft-depth", type=int, default=6, help="deepest perft to run")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per function")
+    parser.add_argument("--comparisons", action="store_true",
+                        help="also run the before/after comparisons and parallel scaling")
+    args = parser.parse_args()
+
+    results = run_suite(args.repeat, perft_depth=args.perft_depth)
+    print_suite(results)
+    if args.out is not None:
+        with open(args.out, "w", encoding="UTF-8") as f:
+            json.dump(results, f, indent=4)
+
+    if args.comparisons:
+        run_comparisons()
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="UTF-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+def run_comparisons() -> None:
+    """
+    Print the before/after comparisons and the parallel search scaling
+    """
+    for name, micro_seconds in bench_flip_count().items():
+        print(f"{name}: {micro_seconds:.2f} us/move")
+    for name, (size, encode_time, decode_time) in bench_serialisation().items():
+        print(f"{name}: {size:.0f} bytes, encode {encode_time:.2f} us, decode {decode_time:.2f} us")
+    for workers, nodes_per_second in bench_parallel_scaling().items():
+        print(f"{workers} workers: {nodes_per_second:.0f} nodes/s")
+    for size, (frontier_cells, state_time, board_time) in bench_large_boards().items():
+        print(f"{size}x{size}: frontier {frontier_cells:.0f} cells, "
+              f"GameState {state_time:.0f} us, 2D list {board_time:.0f} us")
+    for size, measurements in bench_cell_encoding().items():
+        for name, (list_value, cells_value) in measurements.items():
+            print(f"{size}x{size} {name}: 2D list {list_value:,.2f}, cells {cells_value:,.2f}")
+
+if __name__ == "__main__":
+    main()
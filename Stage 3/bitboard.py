@@ -0,0 +1,300 @@
+"""
+Module providing a bitboard representation of the board, with shift-and-mask move
+generation and flip computation, and converters to and from the 2D list format
+"""
+
+from functools import lru_cache
+
+# Boards at least this big generate moves from the frontier rather than by shifting whole
+# runs of discs, as the runs cost time in proportion to the board's area
+FRONTIER_MIN_SIZE = 32
+
+# A position is stored as two integers, one for each colour, where bit (x * size + y)
+# is set if that player owns the cell at (x, y). Python integers are arbitrary width,
+# so the same code works for any board size, not only 8x8.
+# The layout is column-major so that walking the bits from lowest to highest visits cells
+# in the same order as the "for x ... for y ..." loops used elsewhere in the game.
+
+@lru_cache(maxsize=None)
+def board_masks(size:int) -> tuple:
+    """
+    Return the masks needed to shift bitboards of a given size without wrapping
+
+    :param size: board dimension
+    :type size: int
+    :return: (full board mask, mask without the last row, mask without the first row)
+    :rtype: tuple
+    """
+    full = (1 << (size * size)) - 1
+    last_row = 0
+    first_row = 0
+    for x in range(size):
+        last_row |= 1 << (x * size + size - 1)
+        first_row |= 1 << (x * size)
+    return (full, full ^ last_row, full ^ first_row)
+
+@lru_cache(maxsize=None)
+def directions(size:int) -> tuple:
+    """
+    Return the shift amount and pre-shift mask for each of the 8 directions
+
+    :param size: board dimension
+    :type size: int
+    :return: tuple of (shift amount, mask) pairs
+    :rtype: tuple
+    """
+    full, not_last_row, not_first_row = board_masks(size)
+    direction_list = []
+    for dx in [-1,0,1]:
+        for dy in [-1,0,1]:
+            # Skip (0,0)
+            if dx == 0 and dy == 0:
+                continue
+            # Moving along y can wrap into the next column, so mask out the edge row first.
+            # Moving along x can only run off either end of the integer, which the
+            # opponent/empty masks throw away for us.
+            if dy == 1:
+                mask = not_last_row
+            elif dy == -1:
+                mask = not_first_row
+            else:
+                mask = full
+            direction_list.append((dx * size + dy, mask))
+    return tuple(direction_list)
+
+def shift(bits:int, amount:int, mask:int) -> int:
+    """
+    Move every bit one step in a direction
+
+    :param bits: bitboard to shift
+    :type bits: int
+    :param amount: signed shift amount from directions()
+    :type amount: int
+    :param mask: pre-shift mask from directions()
+    :type mask: int
+    :return: shifted bitboard (may contain bits beyond the board, callers mask them off)
+    :rtype: int
+    """
+    if amount > 0:
+        return (bits & mask) << amount
+    return (bits & mask) >> -amount
+
+def coord_to_bit(coord:tuple, size:int) -> int:
+    """
+    Return the single-bit mask for a coordinate
+
+    :param coord: (x, y) coordinate
+    :type coord: tuple
+    :param size: board dimension
+    :type size: int
+    :return: bitboard with only that cell set
+    :rtype: int
+    """
+    return 1 << (coord[0] * size + coord[1])
+
+def bit_to_coord(bit:int, size:int) -> tuple:
+    """
+    Return the coordinate of a single-bit mask
+
+    :param bit: bitboard with exactly one bit set
+    :type bit: int
+    :param size: board dimension
+    :type size: int
+    :return: (x, y) coordinate
+    :rtype: tuple
+    """
+    return divmod(bit.bit_length() - 1, size)
+
+def iter_bits(bits:int):
+    """
+    Yield each set bit of a bitboard as its own single-bit mask, lowest first
+
+    :param bits: bitboard
+    :type bits: int
+    """
+    while bits:
+        lowest = bits & -bits
+        yield lowest
+        bits ^= lowest
+
+def board_to_bitboards(board:list) -> tuple:
+    """
+    Convert a 2D list board into (dark, light) bitboards
+
+    :param board: 2D list representing the board
+    :type board: list
+    :return: (dark bitboard, light bitboard)
+    :rtype: tuple
+    """
+    size = len(board)
+    dark, light = 0, 0
+    for x in range(size):
+        for y in range(size):
+            cell = board[y][x]
+            if cell == "Dark ":
+                dark |= 1 << (x * size + y)
+            elif cell == "Light":
+                light |= 1 << (x * size + y)
+    return (dark, light)
+
+def bitboards_to_board(dark:int, light:int, size:int) -> list:
+    """
+    Convert (dark, light) bitboards back into a 2D list board
+
+    :param dark: dark bitboard
+    :type dark: int
+    :param light: light bitboard
+    :type light: int
+    :param size: board dimension
+    :type size: int
+    :return: 2D list representing the board
+    :rtype: list
+    """
+    # Read the bits as strings, lowest bit first, which is much faster than
+    # testing each bit one at a time
+    cells = size * size
+    dark_bits = format(dark, "b").zfill(cells)[::-1]
+    light_bits = format(light, "b").zfill(cells)[::-1]
+    cell_names = {"10" : "Dark ", "01" : "Light", "00" : None}
+    cells = [cell_names[d + l] for d, l in zip(dark_bits, light_bits)]
+    columns = [cells[x * size:(x + 1) * size] for x in range(size)]
+    # Bits are stored a column at a time, the board is a list of rows
+    return [list(row) for row in zip(*columns)]
+
+def split_colour(dark:int, light:int, colour:str) -> tuple:
+    """
+    Order a pair of bitboards from the point of view of the player to move
+
+    :param dark: dark bitboard
+    :param light: light bitboard
+    :param colour: either "Dark " or "Light"
+    :return: (player bitboard, opponent bitboard)
+    :rtype: tuple
+    """
+    if colour == "Light":
+        return (light, dark)
+    return (dark, light)
+
+def legal_moves_mask(player:int, opponent:int, size:int) -> int:
+    """
+    Return a bitboard of every legal move for the player
+
+    :param player: bitboard of the player to move
+    :type player: int
+    :param opponent: bitboard of the other player
+    :type opponent: int
+    :param size: board dimension
+    :type size: int
+    :return: bitboard with a bit set on each legal move
+    :rtype: int
+    """
+    full = board_masks(size)[0]
+    empty = full & ~(player | opponent)
+    moves = 0
+    for amount, mask in directions(size):
+        # Grow a run of opponent tokens starting next to one of the player's tokens
+        run = shift(player, amount, mask) & opponent
+        # A run can be at most size - 2 long, the first step is already done
+        for _ in range(size - 3):
+            run |= shift(run, amount, mask) & opponent
+        # An empty cell at the end of a run is a legal move
+        moves |= shift(run, amount, mask) & empty
+    return moves
+
+def flips_mask(player:int, opponent:int, move:int, size:int) -> int:
+    """
+    Return a bitboard of the opponent tokens flipped by placing a token on move
+
+    :param player: bitboard of the player to move
+    :type player: int
+    :param opponent: bitboard of the other player
+    :type opponent: int
+    :param move: single-bit mask of the placed token
+    :type move: int
+    :param size: board dimension
+    :type size: int
+    :return: bitboard of flipped tokens (0 if the move flips nothing)
+    :rtype: int
+    """
+    flips = 0
+    for amount, mask in directions(size):
+        line = 0
+        cur = shift(move, amount, mask)
+        # Walk along the line while it is made of opponent tokens
+        while cur & opponent:
+            line |= cur
+            cur = shift(cur, amount, mask)
+        # Only flip the line if it is terminated by one of the player's tokens
+        if cur & player:
+            flips |= line
+    return flips
+
+def neighbour_mask(bits:int, size:int) -> int:
+    """
+    Return a bitboard of every cell next to a set cell, in any of the 8 directions
+
+    :param bits: bitboard
+    :type bits: int
+    :param size: board dimension
+    :type size: int
+    :return: bitboard of the neighbouring cells (which may include set cells)
+    :rtype: int
+    """
+    neighbours = 0
+    for amount, mask in directions(size):
+        neighbours |= shift(bits, amount, mask)
+    return neighbours & board_masks(size)[0]
+
+def frontier_mask(player:int, opponent:int, size:int) -> int:
+    """
+    Return the frontier: every empty cell next to at least one token. Only these cells
+    can ever be legal moves.
+
+    :param player: bitboard of one player
+    :type player: int
+    :param opponent: bitboard of the other player
+    :type opponent: int
+    :param size: board dimension
+    :type size: int
+    :return: bitboard of the frontier
+    :rtype: int
+    """
+    occupied = player | opponent
+    return neighbour_mask(occupied, size) & ~occupied
+
+def generate_frontier_moves(player:int, opponent:int, size:int):
+    """
+    Yield every legal move for the player together with the tokens it flips, only
+    trying the empty cells next to an opponent token
+
+    :param player: bitboard of the player to move
+    :type player: int
+    :param opponent: bitboard of the other player
+    :type opponent: int
+    :param size: board dimension
+    :type size: int
+    :return: generator of (single-bit move mask, flips bitboard) pairs
+    """
+    candidates = neighbour_mask(opponent, size) & ~(player | opponent)
+    for move in iter_bits(candidates):
+        flips = flips_mask(player, opponent, move, size)
+        if flips:
+            yield (move, flips)
+
+def generate_moves(player:int, opponent:int, size:int):
+    """
+    Yield every legal move for the player together with the tokens it flips
+
+    :param player: bitboard of the player to move
+    :type player: int
+    :param opponent: bitboard of the other player
+    :type opponent: int
+    :param size: board dimension
+    :type size: int
+    :return: generator of (single-bit move mask, flips bitboard) pairs
+    """
+    if size >= FRONTIER_MIN_SIZE:
+        yield from generate_frontier_moves(player, opponent, size)
+        return
+    for move in iter_bits(legal_moves_mask(player, opponent, size)):
+        yield (move, flips_mask(player, opponent, move, size))
@@ -0,0 +1,62 @@
+"""
+Module providing tables worked out once per board size and shared by every function that
+scans the board: the squares next to each square, and how far each square can see in each
+direction before reaching the edge. With these the scans need no bounds checks.
+Both tables take memory in proportion to the board's area, and only a few sizes are kept.
+"""
+
+from functools import lru_cache
+
+# The 8 directions a line can be drawn in from a cell
+DIRECTIONS = ((-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1))
+
+# Amount of board sizes whose tables are kept at once
+TABLE_CACHE_SIZE = 4
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def ray_table(size:int) -> tuple:
+    """
+    Return the rays from each square of a board size
+
+    :param size: board dimension
+    :type size: int
+    :return: tuple indexed by x * size + y of tuples of rays. Each ray is
+        (dx, dy, step, length): the direction, the same step as a change in x * size + y,
+        and the amount of squares from the square to the edge of the board that way.
+        Directions that leave the board straight away have no ray.
+    :rtype: tuple
+    """
+    # Rays with the same direction and length are the same tuple, so each square only
+    # holds references
+    shared = {}
+    table = []
+    for x in range(size):
+        for y in range(size):
+            rays = []
+            for dx, dy in DIRECTIONS:
+                length = min(size - 1 - x if dx > 0 else x if dx < 0 else size,
+                             size - 1 - y if dy > 0 else y if dy < 0 else size)
+                if length:
+                    ray = (dx, dy, dx * size + dy, length)
+                    rays.append(shared.setdefault(ray, ray))
+            table.append(tuple(rays))
+    return tuple(table)
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def neighbour_table(size:int) -> tuple:
+    """
+    Return the squares next to each square of a board size
+
+    :param size: board dimension
+    :type size: int
+    :return: tuple indexed by x * size + y of tuples of the x * size + y of each neighbour
+    :rtype: tuple
+    """
+    # Take every index from one list, so each square's neighbours share the int objects
+    indexes = list(range(size * size))
+    table = []
+    for x in range(size):
+        for y in range(size):
+            table.append(tuple(indexes[(x + dx) * size + y + dy] for dx, dy in DIRECTIONS
+                               if 0 <= x + dx < size and 0 <= y + dy < size))
+    return tuple(table)
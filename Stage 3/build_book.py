@@ -0,0 +1,82 @@
+"""
+Module for building an opening book by self-play
+
+Build one with:
+    python build_book.py --games 500 --plies 12 --depth 4 --out opening_book.bin
+"""
+
+import argparse
+import random
+import time
+
+from components import initialise_board
+from game_engine import GameState
+from opening_book import write_book
+from search_opponent import Searcher
+from zobrist import position_key
+
+def build_book(games:int, plies:int, depth:int, size:int = 8, seed:int = 0) -> dict:
+    """
+    Collect opening positions by self-play and find the best move in each by searching
+
+    :param games: amount of self-play games
+    :type games: int
+    :param plies: how many moves into each game to collect positions for
+    :type plies: int
+    :param depth: depth to search each position to
+    :type depth: int
+    :param size: board dimension
+    :type size: int
+    :param seed: seed for the random choices in the self-play games
+    :type seed: int
+    :return: dictionary of position key to (move coordinates, score)
+    :rtype: dict
+    """
+    rng = random.Random(seed)
+    searcher = Searcher(endgame_empties=0)
+    entries = {}
+
+    for _ in range(games):
+        game_state = GameState(initialise_board(size), "Dark ")
+        colour = "Dark "
+        for _ in range(plies):
+            moves = searcher.ordered_moves(game_state, colour)
+            if not moves:
+                colour = "Dark " if colour == "Light" else "Light"
+                moves = searcher.ordered_moves(game_state, colour)
+                if not moves:
+                    break
+
+            key = position_key(game_state.hash, colour)
+            if key not in entries:
+                entries[key] = searcher.search_root(game_state, colour, moves, depth)
+
+            # Mostly follow the book's own choice, sometimes branch off to widen it
+            if rng.random() < 0.5:
+                game_state.apply_move(entries[key][0], colour)
+            else:
+                game_state.apply_move(rng.choice(moves), colour)
+            colour = "Dark " if colour == "Light" else "Light"
+
+    return entries
+
+def main() -> None:
+    """
+    Command line entry point for building a book
+    """
+    parser = argparse.ArgumentParser(description="Build an Othello opening book by self-play")
+    parser.add_argument("--games", type=int, default=200, help="number of self-play games")
+    parser.add_argument("--plies", type=int, default=12, help="moves per game to store")
+    parser.add_argument("--depth", type=int, default=4, help="search depth per position")
+    parser.add_argument("--size", type=int, default=8, help="board size")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--out", default="opening_book.bin", help="file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    entries = build_book(args.games, args.plies, args.depth, args.size, args.seed)
+    write_book(args.out, args.size, entries)
+    print(f"Wrote {len(entries)} positions to {args.out} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
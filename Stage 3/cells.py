@@ -0,0 +1,177 @@
+"""
+Module providing the compact cell encoding used inside GameState: the board held as one
+flat bytearray of small ints, indexed x * size + y like the bitboards, rather than a list
+of lists of "Dark "/"Light" strings. Strings are only made when a 2D list board is asked for.
+"""
+
+from board_tables import ray_table
+
+EMPTY = 0
+DARK = 1
+LIGHT = 2
+
+# Cell value for each colour string, and back again
+CELL_VALUES = {None : EMPTY, "Dark " : DARK, "Light" : LIGHT}
+CELL_NAMES = (None, "Dark ", "Light")
+
+# Turn cells into "0"/"1" digits for one colour, to read a bitboard straight out of them
+DARK_DIGITS = bytes.maketrans(b"\x00\x01\x02", b"010")
+LIGHT_DIGITS = bytes.maketrans(b"\x00\x01\x02", b"001")
+# And back from a bitboard's digits to each colour's cell value
+DARK_FROM_DIGITS = bytes.maketrans(b"01", b"\x00\x01")
+LIGHT_FROM_DIGITS = bytes.maketrans(b"01", b"\x00\x02")
+
+def encode_board(board:list) -> bytearray:
+    """
+    Convert a 2D list board into cells
+
+    :param board: 2D list representing the board
+    :type board: list
+    :return: bytearray of cell values, indexed x * size + y
+    :rtype: bytearray
+    """
+    size = len(board)
+    cells = bytearray(size * size)
+    for y, row in enumerate(board):
+        for x, cell in enumerate(row):
+            if cell is not None:
+                cells[x * size + y] = CELL_VALUES[cell]
+    return cells
+
+def decode_board(cells:bytearray, size:int) -> list:
+    """
+    Convert cells back into a 2D list board
+
+    :param cells: bytearray of cell values, indexed x * size + y
+    :type cells: bytearray
+    :param size: board dimension
+    :type size: int
+    :return: 2D list representing the board
+    :rtype: list
+    """
+    names = [CELL_NAMES[cell] for cell in cells]
+    columns = [names[x * size:(x + 1) * size] for x in range(size)]
+    # Cells are stored a column at a time, the board is a list of rows
+    return [list(row) for row in zip(*columns)]
+
+def cells_to_bitboards(cells:bytearray) -> tuple:
+    """
+    Convert cells into (dark, light) bitboards
+
+    :param cells: bytearray of cell values, indexed x * size + y
+    :type cells: bytearray
+    :return: (dark bitboard, light bitboard)
+    :rtype: tuple
+    """
+    # The digits are lowest bit first, int() wants them highest first
+    return (int(cells.translate(DARK_DIGITS)[::-1], 2),
+            int(cells.translate(LIGHT_DIGITS)[::-1], 2))
+
+def bitboards_to_cells(dark:int, light:int, size:int) -> bytearray:
+    """
+    Convert (dark, light) bitboards into cells
+
+    :param dark: dark bitboard
+    :type dark: int
+    :param light: light bitboard
+    :type light: int
+    :param size: board dimension
+    :type size: int
+    :return: bytearray of cell values, indexed x * size + y
+    :rtype: bytearray
+    """
+    squares = size * size
+    # Digits lowest bit first, one per cell, turned into that colour's cell values
+    dark_cells = format(dark, "b").zfill(squares)[::-1].encode().translate(DARK_FROM_DIGITS)
+    light_cells = format(light, "b").zfill(squares)[::-1].encode().translate(LIGHT_FROM_DIGITS)
+    # No cell is in both, so adding them byte by byte never carries
+    return bytearray((int.from_bytes(dark_cells, "little")
+                      + int.from_bytes(light_cells, "little")).to_bytes(squares, "little"))
+
+def flipped_cells(cells:bytearray, size:int, player:int, index:int) -> list:
+    """
+    List the cells a move would flip by scanning each ray from the placed token
+
+    :param cells: bytearray of cell values, not changed
+    :type cells: bytearray
+    :param size: board dimension
+    :type size: int
+    :param player: cell value of the player placing the token
+    :type player: int
+    :param index: index of the placed token
+    :type index: int
+    :return: list of indexes that would be flipped
+    :rtype: list
+    """
+    opponent = DARK + LIGHT - player
+    flipped = []
+    for _, _, step, length in ray_table(size)[index]:
+        # Only a line starting with an opponent token can flip anything
+        if cells[index + step] != opponent:
+            continue
+        for cell_index in range(index + 2 * step, index + step * (length + 1), step):
+            cell = cells[cell_index]
+            if cell == EMPTY:
+                break
+            if cell == player:
+                # Everything between the placed token and this one is flipped
+                flipped.extend(range(index + step, cell_index, step))
+                break
+    return flipped
+
+def count_flipped_cells(cells:bytearray, size:int, player:int, index:int) -> int:
+    """
+    Count the cells a move would flip, without listing them
+
+    :param cells: bytearray of cell values, not changed
+    :type cells: bytearray
+    :param size: board dimension
+    :type size: int
+    :param player: cell value of the player placing the token
+    :type player: int
+    :param index: index of the placed token
+    :type index: int
+    :return: amount of cells that would be flipped
+    :rtype: int
+    """
+    opponent = DARK + LIGHT - player
+    total = 0
+    for _, _, step, length in ray_table(size)[index]:
+        if cells[index + step] != opponent:
+            continue
+        for line_length in range(1, length):
+            cell = cells[index + step * (line_length + 1)]
+            if cell == EMPTY:
+                break
+            if cell == player:
+                total += line_length
+                break
+    return total
+
+def legal_cell(cells:bytearray, size:int, player:int, index:int) -> bool:
+    """
+    Check whether placing a token on an empty cell would flip anything, stopping at the
+    first line that does
+
+    :param cells: bytearray of cell values, not changed
+    :type cells: bytearray
+    :param size: board dimension
+    :type size: int
+    :param player: cell value of the player placing the token
+    :type player: int
+    :param index: index of the empty cell
+    :type index: int
+    :return: whether the move is legal
+    :rtype: bool
+    """
+    opponent = DARK + LIGHT - player
+    for _, _, step, length in ray_table(size)[index]:
+        if cells[index + step] != opponent:
+            continue
+        for cell_index in range(index + 2 * step, index + step * (length + 1), step):
+            cell = cells[cell_index]
+            if cell == EMPTY:
+                break
+            if cell == player:
+                return True
+    return False
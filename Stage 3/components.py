@@ -3,6 +3,7 @@ Module providing initialisation functions for board and methods to print and che
 """
 
 from colorama import Fore
+from bitboard import board_to_bitboards, coord_to_bit, flips_mask, split_colour
 
 def initialise_board(size:int = 8) -> list:
     """
@@ -84,60 +85,17 @@ def legal_move(colour:str, coord:tuple, board:list) -> bool:
     # Initialise variables
     x = coord[0]
     y = coord[1]
-    opponent = "Dark " if colour == "Light" else "Light"
     board_size = len(board)
 
-    # Check whether coordinate is empty
-    try:
-        if board[y][x] is not None:
-            return False
-    except IndexError:
-        raise IndexError from None
-
-    # Check whether coordinate outflanks at least once peice
-    # Go through each direction to check there is at least one line containing at,
-    # least one opposing peice followed by one player peice
-    for dx in [-1,0,1]:
-        for dy in [-1,0,1]:
-
-            # Skip (0,0)
-            if dx == 0 and dy == 0:
-                continue
-
-            neighbour_x = x + dx
-            neighbour_y = y + dy
-
-
-            # Skip if out of bounrs
-            if not (0 <= neighbour_x < board_size and 0 <= neighbour_y < board_size):
-                continue
+    # Check whether coordinate is on the board
+    if not (0 <= x < board_size and 0 <= y < board_size):
+        raise IndexError
 
-            # Skip if next token is not opponent's peice
-            if board[neighbour_y][neighbour_x] != opponent:
-                continue
-
-            # At this stage we know the next token in the line is an opponent peice
-            # Go through, and check if its a string of opponent peices
-            # AND terminated by player's peice
-            next_x = neighbour_x
-            next_y = neighbour_y
-
-            # Continue going until we meet a break case
-            while True:
-                next_x += dx
-                next_y += dy
-
-                # Break if out of bounds:
-                if not (0 <= next_x < board_size and 0 <= next_y < board_size):
-                    break
-
-                # Break if no token
-                if board[next_y][next_x] is None:
-                    break
+    # Check whether coordinate is empty
+    if board[y][x] is not None:
+        return False
 
-                # If the next peice belongs to player then we have a legal move!
-                if board[next_y][next_x] == colour:
-                    # print(f"Found legal for ({x},{y}) with line ({dx},{dy})")
-                    return True # yay!
-    # If we go through all possible lines without a hit, no legal moves!
-    return False
+    # Check whether coordinate outflanks at least one peice, using the bitboard engine:
+    # the move is legal if placing a token there would flip anything
+    player, opponent = split_colour(*board_to_bitboards(board), colour)
+    return flips_mask(player, opponent, coord_to_bit(coord, board_size), board_size) != 0
@@ -0,0 +1,216 @@
+"""
+Module containing an exact endgame solver. Once only a few empty squares are left the
+whole rest of the game can be searched, so the AI can play perfectly
+"""
+
+import time
+
+from game_engine import GameState
+from zobrist import EXACT, LOWER, UPPER, TranspositionTable, position_key
+
+# Search AI switches to the solver at this many empty squares. Pure Python solves
+# around 10-12 empties within a second; raise it for slower, stronger play.
+DEFAULT_ENDGAME_EMPTIES = 10
+
+# Below this many empties, skip the move ordering and table and just try every square
+FAST_PATH_EMPTIES = 4
+
+class SolverTimeout(Exception):
+    """
+    Raised inside the solver when its time budget has run out
+    """
+
+def quadrant(coords:tuple, size:int) -> int:
+    """
+    Return which quarter of the board a square is in (0 to 3)
+    """
+    return (coords[0] >= size // 2) * 2 + (coords[1] >= size // 2)
+
+def parity_order(game_state:GameState, moves:list) -> list:
+    """
+    Order moves so that those in a quarter of the board with an odd number of empty
+    squares come first, then corners before other squares. Playing into odd regions
+    tends to leave the last move in each region to us.
+
+    :param game_state: position the moves are from
+    :type game_state: GameState
+    :param moves: list of move coordinates
+    :type moves: list
+    :return: the moves, best first
+    :rtype: list
+    """
+    size = game_state.size
+    region_empties = [0, 0, 0, 0]
+    for coords in game_state.empties:
+        region_empties[quadrant(coords, size)] += 1
+
+    def key(coords):
+        even_region = region_empties[quadrant(coords, size)] % 2 == 0
+        corner = coords[0] in (0, size - 1) and coords[1] in (0, size - 1)
+        return (even_region, not corner)
+
+    return sorted(moves, key=key)
+
+class EndgameSolver:
+    """
+    Exact negamax search to the end of the game.
+    In exact mode scores are the final disc difference, in win/loss/draw mode they are
+    only 1, 0 or -1, which lets the search prune far more.
+    """
+    def __init__(self, exact:bool = True, time_limit:float | None = None,
+                 table:TranspositionTable | None = None,
+                 fast_path_empties:int = FAST_PATH_EMPTIES) -> None:
+        self.exact = exact
+        self.time_limit = time_limit
+        self.table = table if table is not None else TranspositionTable()
+        self.fast_path_empties = fast_path_empties
+        self.deadline = float("inf")
+        self.nodes = 0
+
+    def final_score(self, game_state:GameState, colour:str) -> int:
+        """
+        Score a finished game from the point of view of colour
+        """
+        opponent = "Dark " if colour == "Light" else "Light"
+        discs = game_state.counts[colour] - game_state.counts[opponent]
+        if self.exact:
+            return discs
+        return (discs > 0) - (discs < 0)
+
+    def fast_negamax(self, game_state:GameState, colour:str, alpha:int, beta:int,
+                     passed:bool = False) -> int:
+        """
+        Solver for the last few empties: no table or ordering, just try each frontier square
+        """
+        self.nodes += 1
+        opponent = "Dark " if colour == "Light" else "Light"
+        best_score = None
+        for coords in sorted(game_state.frontier):
+            if not game_state.count_flipped(colour, coords):
+                continue
+            game_state.make_move(coords, colour)
+            score = -self.fast_negamax(game_state, opponent, -beta, -alpha)
+            game_state.unmake_move()
+            if best_score is None or score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score is None:
+            if passed or not game_state.empties:
+                return self.final_score(game_state, colour)
+            return -self.fast_negamax(game_state, opponent, -beta, -alpha, True)
+        return best_score
+
+    def negamax(self, game_state:GameState, colour:str, alpha:int, beta:int,
+                passed:bool = False) -> int:
+        """
+        Score a position exactly by searching to the end of the game
+
+        :param game_state: position to solve, restored before returning
+        :type game_state: GameState
+        :param colour: player to move
+        :type colour: str
+        :param alpha: lowest score colour is already guaranteed
+        :type alpha: int
+        :param beta: highest score the opponent will allow
+        :type beta: int
+        :param passed: whether the previous player had to pass
+        :type passed: bool
+        :return: score from the point of view of colour
+        :rtype: int
+        """
+        if len(game_state.empties) <= self.fast_path_empties:
+            return self.fast_negamax(game_state, colour, alpha, beta, passed)
+
+        self.nodes += 1
+        if time.perf_counter() > self.deadline:
+            raise SolverTimeout
+
+        key = position_key(game_state.hash, colour)
+        table_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            _, bound, entry_score, table_move = entry
+            if bound == EXACT:
+                return entry_score
+            if bound == LOWER and entry_score >= beta:
+                return entry_score
+            if bound == UPPER and entry_score <= alpha:
+                return entry_score
+
+        opponent = "Dark " if colour == "Light" else "Light"
+        moves = parity_order(game_state, [coords for coords, _ in game_state.legal_moves(colour)])
+        if table_move in moves:
+            moves.remove(table_move)
+            moves.insert(0, table_move)
+
+        if not moves:
+            if passed:
+                return self.final_score(game_state, colour)
+            return -self.negamax(game_state, opponent, -beta, -alpha, True)
+
+        original_alpha = alpha
+        best_score = None
+        best_move = None
+        for coords in moves:
+            game_state.make_move(coords, colour)
+            try:
+                score = -self.negamax(game_state, opponent, -beta, -alpha)
+            finally:
+                game_state.unmake_move()
+            if best_score is None or score > best_score:
+                best_score = score
+                best_move = coords
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, len(game_state.empties), bound, best_score, best_move)
+        return best_score
+
+    def solve(self, game_state:GameState, colour:str) -> tuple:
+        """
+        Find the best move and its exact result
+
+        :param game_state: position to solve, restored before returning
+        :type game_state: GameState
+        :param colour: player to move
+        :type colour: str
+        :return: (score for colour, best move or None if colour must pass)
+        :rtype: tuple
+        """
+        self.nodes = 0
+        if self.time_limit is not None:
+            self.deadline = time.perf_counter() + self.time_limit
+
+        opponent = "Dark " if colour == "Light" else "Light"
+        moves = parity_order(game_state, [coords for coords, _ in game_state.legal_moves(colour)])
+        if not moves:
+            return (self.negamax(game_state, colour, -float("inf"), float("inf")), None)
+
+        # Win/loss/draw scores only ever lie in [-1, 1]
+        alpha = -float("inf") if self.exact else -1
+        beta = float("inf") if self.exact else 1
+        best_move = moves[0]
+        for coords in moves:
+            game_state.make_move(coords, colour)
+            try:
+                score = -self.negamax(game_state, opponent, -beta, -alpha)
+            finally:
+                game_state.unmake_move()
+            if score > alpha:
+                alpha = score
+                best_move = coords
+            if alpha >= beta:
+                break
+        return (alpha, best_move)
@@ -2,7 +2,23 @@
 Module containing main game loop
 """
 
+import struct
+
 from components import initialise_board, legal_move, print_board
+from bitboard import bit_to_coord, board_to_bitboards, coord_to_bit, flips_mask
+from bitboard import generate_moves, iter_bits, split_colour
+from board_tables import neighbour_table, ray_table
+from cells import CELL_NAMES, CELL_VALUES, DARK, EMPTY, LIGHT, bitboards_to_cells
+from cells import cells_to_bitboards, count_flipped_cells, decode_board, encode_board
+from cells import flipped_cells, legal_cell
+from zobrist import move_hash_delta, zobrist_keys
+
+# Version byte at the start of GameState.to_bytes output
+BINARY_VERSION = 2
+# Header of GameState.to_bytes output: version, board size, flags. Version 1 had a
+# single byte for the size, so couldn't hold boards of 256 or more.
+BINARY_HEADER = struct.Struct("<BHB")
+BINARY_HEADER_V1 = struct.Struct("<BBB")
 
 def cli_coords_input() -> tuple:
     """
@@ -38,35 +54,99 @@ def outflanked(board:list, colour:str, coords:list) -> list:
     :rtype: list
     """
     size = len(board)
-    for dx in [-1,0,1]:
-        for dy in [-1,0,1]:
+    player, opponent = split_colour(*board_to_bitboards(board), colour)
+    flips = flips_mask(player, opponent, coord_to_bit(coords, size), size)
 
-            # Skip if no dx or dy
-            if dx == dy and dx == 0:
-                continue
+    # Write each flipped token back into the 2D list
+    for bit in iter_bits(flips):
+        x, y = bit_to_coord(bit, size)
+        board[y][x] = colour
 
-            cur_coords = [coords[0] + dx, coords[1] + dy]
-            line_coords = []
-            flip_line = False
+    return board
 
-            while 0 <= cur_coords[0] < size and 0 <= cur_coords[1] < size:
-                cur_token = board[cur_coords[1]][cur_coords[0]]
-                if cur_token is None:
-                    break
+def legal_moves(board:list, colour:str):
+    """
+    Yield every legal move for a player along with the tokens that it flips,
+    computed in one sweep of the board
 
-                elif cur_token == colour:
-                    flip_line = True
-                    break
+    :param board: 2D list representing board
+    :type board: list
+    :param colour: string representing the player
+    :type colour: str
+    :return: generator of ((x, y), [flipped coordinates]) pairs, ordered by x then y
+    """
+    size = len(board)
+    player, opponent = split_colour(*board_to_bitboards(board), colour)
+    for move, flips in generate_moves(player, opponent, size):
+        yield (bit_to_coord(move, size), [bit_to_coord(bit, size) for bit in iter_bits(flips)])
 
-                line_coords.append(cur_coords.copy()) # prevent just same thing being appended
-                cur_coords[0] += dx
-                cur_coords[1] += dy
+def count_flipped(board:list, colour:str, coords:tuple) -> int:
+    """
+    Count the tokens a move would flip, straight from a scan of each line.
+    The board is not copied or changed.
 
-            if flip_line and line_coords:
-                for x, y in line_coords:
-                    board[y][x] = colour
+    :param board: 2D list representing board
+    :type board: list
+    :param colour: colour of player placing the token
+    :type colour: str
+    :param coords: coordinates of the placed token
+    :type coords: tuple
+    :return: amount of tokens flipped by the move
+    :rtype: int
+    """
+    size = len(board)
+    x, y = coords
+    opponent = "Dark " if colour == "Light" else "Light"
+    total = 0
+    for dx, dy, _, length in ray_table(size)[x * size + y]:
+        ray_x, ray_y = x + dx, y + dy
+        if board[ray_y][ray_x] != opponent:
+            continue
+        # Count the opponent tokens along the line
+        for line_length in range(1, length):
+            ray_x += dx
+            ray_y += dy
+            cur_token = board[ray_y][ray_x]
+            if cur_token is None:
+                break
+            if cur_token == colour:
+                # Line is terminated by the player, so all of it is flipped
+                total += line_length
+                break
+    return total
 
-    return board
+def flipped_by(board:list, colour:str, coords:tuple) -> list:
+    """
+    List the tokens a move would flip by scanning each line from the placed token.
+    The board is not changed.
+
+    :param board: 2D list representing board
+    :type board: list
+    :param colour: colour of player placing the token
+    :type colour: str
+    :param coords: coordinates of the placed token
+    :type coords: tuple
+    :return: list of (x, y) coordinates that would be flipped
+    :rtype: list
+    """
+    size = len(board)
+    x, y = coords
+    opponent = "Dark " if colour == "Light" else "Light"
+    flipped = []
+    for dx, dy, _, length in ray_table(size)[x * size + y]:
+        ray_x, ray_y = x + dx, y + dy
+        if board[ray_y][ray_x] != opponent:
+            continue
+        for line_length in range(1, length):
+            ray_x += dx
+            ray_y += dy
+            cur_token = board[ray_y][ray_x]
+            if cur_token is None:
+                break
+            if cur_token == colour:
+                flipped.extend((x + dx * i, y + dy * i) for i in range(1, line_length + 1))
+                break
+    return flipped
 
 def has_legal_move(board, colour) -> bool:
     """
@@ -77,15 +157,8 @@ def has_legal_move(board, colour) -> bool:
     :return: boolean representing if the player has a possible move
     :rtype: bool
     """
-    # count_checked = 0
-    for x in range(len(board)):
-        for y in range(len(board)):
-            if board[y][x] is None:
-                # count_checked += 1
-                if legal_move(colour, (x,y), board):
-                    return True
-    # print(f"Counted {count_checked}, no legals")
-    return False
+    # Only the first move is ever generated
+    return next(legal_moves(board, colour), None) is not None
 
 def check_win(board:list) -> list:
     """
@@ -96,14 +169,20 @@ def check_win(board:list) -> list:
     :return: a list containing a tuple with scores (Light, black) and a winner
     :rtype: list
     """
-    light_tokens, black_tokens = 0, 0
-    for row in board:
-        for cell in row:
-            if cell == "Dark ":
-                black_tokens += 1
-            elif cell == "Light":
-                light_tokens += 1
+    dark, light = board_to_bitboards(board)
+    return declare_winner(light.bit_count(), dark.bit_count())
 
+def declare_winner(light_tokens:int, black_tokens:int) -> tuple:
+    """
+    Given the amount of counters each player has, decide who has won
+
+    :param light_tokens: amount of light counters
+    :type light_tokens: int
+    :param black_tokens: amount of dark counters
+    :type black_tokens: int
+    :return: a tuple containing a tuple with scores (Light, black) and a winner
+    :rtype: tuple
+    """
     winner = None
     if black_tokens > light_tokens:
         winner = "Dark "
@@ -118,11 +197,271 @@ class GameState:
     """
     Class for storing game state details and utility for transfering to and from JSON
     (with typing because I miss java)
+
+    The position is held as compact cells (see cells.py), and the board property builds
+    the 2D list of strings only when it is read, for saving and for the web page.
     """
-    def __init__(self, board:list, cur_player:str, finished:bool=False) -> None:
-        self.board = board
+    def __init__(self, board:list, cur_player:str, finished:bool=False,
+                 history:list | None = None) -> None:
+        self.size = len(board)
+        self.cells = encode_board(board)
         self.cur_player = cur_player
         self.finished = finished
+        # Every move applied so far, as ((x, y), colour)
+        self.history = list(history) if history is not None else []
+        # Moves made with make_move, so that they can be taken back with unmake_move
+        self.undo_stack = []
+        self.recount()
+
+    @classmethod
+    def from_cells(cls: type["GameState"], cells:bytes, size:int, cur_player:str,
+                   finished:bool = False, history:list | None = None) -> "GameState":
+        """
+        Build a game straight from cells, without going through a 2D list board
+
+        :param cells: cell values indexed x * size + y, copied
+        :type cells: bytes
+        :param size: board dimension
+        :type size: int
+        :return: the game
+        :rtype: GameState
+        """
+        game_state = cls.__new__(cls)
+        game_state.size = size
+        game_state.cells = bytearray(cells)
+        game_state.cur_player = cur_player
+        game_state.finished = finished
+        game_state.history = list(history) if history is not None else []
+        game_state.undo_stack = []
+        game_state.recount()
+        return game_state
+
+    def copy(self) -> "GameState":
+        """
+        Return a separate copy of the game, for searching without touching this one
+        """
+        return GameState.from_cells(self.cells, self.size, self.cur_player, self.finished,
+                                    self.history)
+
+    @property
+    def board(self) -> list:
+        """
+        The board as a new 2D list of strings. Changing it doesn't change the game.
+        """
+        return decode_board(self.cells, self.size)
+
+    def recount(self) -> None:
+        """
+        Rebuild the disc counters, empty-square set, frontier and Zobrist hash from the cells.
+        Only needs calling if the cells are changed without apply_move.
+        """
+        size = self.size
+        cells = self.cells
+        keys = zobrist_keys(size)
+        cell_keys = (None, keys["Dark "], keys["Light"])
+        neighbours = neighbour_table(size)
+        board_hash = 0
+        self.empties = set()
+        # Amount of tokens next to each square, indexed x * size + y
+        self.touching = [0] * (size * size)
+        # One pass over the cells for the empties, hash and neighbour counts together
+        for index, cell in enumerate(cells):
+            if cell == EMPTY:
+                self.empties.add(divmod(index, size))
+            else:
+                board_hash ^= cell_keys[cell][index]
+                for neighbour in neighbours[index]:
+                    self.touching[neighbour] += 1
+        self.counts = {"Dark " : cells.count(DARK), "Light" : cells.count(LIGHT)}
+        self.hash = board_hash
+        # The empty squares next to at least one token, the only squares that can be moves
+        self.frontier = {(x, y) for x, y in self.empties if self.touching[x * size + y]}
+
+    def apply_move(self, coords:tuple, colour:str) -> list:
+        """
+        Place a token, flip the tokens it outflanks and update the counters
+
+        :param coords: coordinates of the placed token
+        :type coords: tuple
+        :param colour: colour of the player making the move
+        :type colour: str
+        :return: list of (x, y) coordinates that were flipped
+        :rtype: list
+        """
+        opponent = "Dark " if colour == "Light" else "Light"
+        size = self.size
+        cells = self.cells
+        player = CELL_VALUES[colour]
+        index = coords[0] * size + coords[1]
+        flipped_indexes = flipped_cells(cells, size, player, index)
+
+        cells[index] = player
+        for flip in flipped_indexes:
+            cells[flip] = player
+        flipped = [divmod(flip, size) for flip in flipped_indexes]
+
+        self.empties.discard(tuple(coords))
+        # Flips don't change which squares are empty, only the placed token moves the frontier
+        self.frontier.discard(tuple(coords))
+        for neighbour in neighbour_table(size)[index]:
+            self.touching[neighbour] += 1
+            if cells[neighbour] == EMPTY:
+                self.frontier.add(divmod(neighbour, size))
+        self.counts[colour] += 1 + len(flipped)
+        self.counts[opponent] -= len(flipped)
+        self.hash ^= move_hash_delta(size, coords, colour, flipped)
+        self.history.append((tuple(coords), colour))
+        return flipped
+
+    def make_move(self, coords:tuple, colour:str) -> list:
+        """
+        Apply a move and record it on the undo stack so it can be taken back
+
+        :param coords: coordinates of the placed token
+        :type coords: tuple
+        :param colour: colour of the player making the move
+        :type colour: str
+        :return: list of (x, y) coordinates that were flipped
+        :rtype: list
+        """
+        flipped = self.apply_move(coords, colour)
+        self.undo_stack.append((tuple(coords), colour, flipped))
+        return flipped
+
+    def unmake_move(self) -> None:
+        """
+        Take back the last move made with make_move, restoring the board and counters exactly
+        """
+        coords, colour, flipped = self.undo_stack.pop()
+        self.history.pop()
+        opponent = "Dark " if colour == "Light" else "Light"
+        size = self.size
+        cells = self.cells
+        index = coords[0] * size + coords[1]
+
+        cells[index] = EMPTY
+        opponent_value = CELL_VALUES[opponent]
+        for x, y in flipped:
+            cells[x * size + y] = opponent_value
+
+        self.empties.add(coords)
+        # Empty neighbours stay on the frontier only if another token still touches them
+        for neighbour in neighbour_table(size)[index]:
+            self.touching[neighbour] -= 1
+            if not self.touching[neighbour]:
+                self.frontier.discard(divmod(neighbour, size))
+        if self.touching[index]:
+            self.frontier.add(coords)
+        self.counts[colour] -= 1 + len(flipped)
+        self.counts[opponent] += len(flipped)
+        self.hash ^= move_hash_delta(size, coords, colour, flipped)
+
+    def cell(self, coords:tuple) -> str | None:
+        """
+        Return the colour on a square, or None if it is empty
+        """
+        return CELL_NAMES[self.cells[coords[0] * self.size + coords[1]]]
+
+    def legal_move(self, colour:str, coords:tuple) -> bool:
+        """
+        Check whether a move is legal, like legal_move on a 2D list board
+
+        :param colour: colour of player placing the token
+        :type colour: str
+        :param coords: coordinates to check
+        :type coords: tuple
+        :return: whether the move is legal
+        :rtype: bool
+        :raises IndexError: if the coordinates are off the board
+        """
+        x, y = coords
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError
+        index = x * self.size + y
+        return (self.cells[index] == EMPTY
+                and legal_cell(self.cells, self.size, CELL_VALUES[colour], index))
+
+    def flip_counts(self, colour:str) -> dict:
+        """
+        The amount of tokens flipped by every legal move, like possible_flip_counts on a
+        2D list board
+
+        :param colour: string representing the player
+        :type colour: str
+        :return: dictionary of coordinates to number of tokens flipped, ordered by x then y
+        :rtype: dict
+        """
+        size = self.size
+        player = CELL_VALUES[colour]
+        flip_counts = {}
+        for coords in sorted(self.frontier):
+            flipped = count_flipped_cells(self.cells, size, player, coords[0] * size + coords[1])
+            if flipped:
+                flip_counts[coords] = flipped
+        return flip_counts
+
+    def count_flipped(self, colour:str, coords:tuple) -> int:
+        """
+        Count the tokens a move would flip, like count_flipped on a 2D list board
+
+        :param colour: colour of player placing the token
+        :type colour: str
+        :param coords: coordinates of the placed token
+        :type coords: tuple
+        :return: amount of tokens flipped by the move
+        :rtype: int
+        """
+        return count_flipped_cells(self.cells, self.size, CELL_VALUES[colour],
+                                   coords[0] * self.size + coords[1])
+
+    def legal_moves(self, colour:str):
+        """
+        Yield every legal move for a player along with the tokens it flips,
+        only looking at the frontier
+
+        :param colour: string representing the player
+        :type colour: str
+        :return: generator of ((x, y), [flipped coordinates]) pairs, ordered by x then y
+        """
+        size = self.size
+        player = CELL_VALUES[colour]
+        for coords in sorted(self.frontier):
+            flipped = flipped_cells(self.cells, size, player, coords[0] * size + coords[1])
+            if flipped:
+                yield (coords, [divmod(flip, size) for flip in flipped])
+
+    def has_legal_move(self, colour:str) -> bool:
+        """
+        Check if there is a possible move for a given player
+
+        :param colour: string representing the player
+        :type colour: str
+        :return: boolean representing if the player has a possible move
+        :rtype: bool
+        """
+        size = self.size
+        player = CELL_VALUES[colour]
+        for x, y in self.frontier:
+            if legal_cell(self.cells, size, player, x * size + y):
+                return True
+        return False
+
+    def score(self) -> tuple:
+        """
+        Return the amount of counters each player has and who is winning, like check_win,
+        but from the counters rather than a scan of the board
+
+        :return: a tuple containing a tuple with scores (Light, black) and a winner
+        :rtype: tuple
+        """
+        return declare_winner(self.counts["Light"], self.counts["Dark "])
+
+    @property
+    def version(self) -> int:
+        """
+        Version number of the position, which goes up by one with every move applied
+        """
+        return len(self.history)
 
     def to_dict(self) -> dict:
         """
@@ -131,7 +470,8 @@ class GameState:
         return {
             "board" : self.board,
             "cur_player" : self.cur_player,
-            "finished" : self.finished
+            "finished" : self.finished,
+            "history" : [[x, y, colour] for (x, y), colour in self.history]
         }
 
     @classmethod # Not to do with the instance: to do with the class.
@@ -142,18 +482,93 @@ class GameState:
         :param cls: class for data to be loaded into
         :param data: dictionary
         """
-        return cls(data["board"], data["cur_player"], data["finished"])
+        # Saves from before the move history was kept don't have one
+        history = [((x, y), colour) for x, y, colour in data.get("history", [])]
+        return cls(data["board"], data["cur_player"], data["finished"], history)
+
+    def to_bytes(self) -> bytes:
+        """
+        Return the position as a compact binary string: a version byte, the board size
+        as two bytes, a flags byte (bit 0 set if Light is to move, bit 1 set if finished),
+        then the dark and light bitboards. An 8x8 board takes 20 bytes.
+        The move history is not included.
 
-def simple_game_loop() -> None:
+        :raises ValueError: if the board is too big for the size field
+        """
+        size = self.size
+        if size > 0xFFFF:
+            raise ValueError(f"A {size}x{size} board is too large for the binary format")
+        mask_bytes = (size * size + 7) // 8
+        dark, light = cells_to_bitboards(self.cells)
+        flags = (self.cur_player == "Light") | (self.finished << 1)
+        return (BINARY_HEADER.pack(BINARY_VERSION, size, flags)
+                + dark.to_bytes(mask_bytes, "little")
+                + light.to_bytes(mask_bytes, "little"))
+
+    @classmethod
+    def from_bytes(cls: type["GameState"], data:bytes) -> "GameState":
+        """
+        Initialise GameState class from the output of to_bytes, in this or the
+        previous version of the format
+
+        :param cls: class for data to be loaded into
+        :param data: binary string
+        :raises ValueError: if the data isn't a GameState in a known version of the format
+        """
+        headers = {1 : BINARY_HEADER_V1, BINARY_VERSION : BINARY_HEADER}
+        header = headers.get(data[0] if data else None)
+        if header is None or len(data) < header.size:
+            raise ValueError("Unrecognised GameState binary format")
+        _, size, flags = header.unpack_from(data)
+        mask_bytes = (size * size + 7) // 8
+        if len(data) != header.size + 2 * mask_bytes:
+            raise ValueError("GameState binary data is the wrong length")
+        dark = int.from_bytes(data[header.size:header.size + mask_bytes], "little")
+        light = int.from_bytes(data[header.size + mask_bytes:], "little")
+        if dark & light or (dark | light) >> (size * size):
+            raise ValueError("GameState binary data has overlapping or off-board tokens")
+        cur_player = "Light" if flags & 1 else "Dark "
+        # Straight into cells, the board is never built as a 2D list
+        return cls.from_cells(bitboards_to_cells(dark, light, size), size, cur_player,
+                              bool(flags & 2))
+
+def play_move(game_state:GameState, coords:tuple, colour:str) -> dict:
+    """
+    Apply a move and describe the change, so that a client can update just those cells.
+    Used for both the Flask /move response and the WebSocket move messages.
+
+    :param game_state: the game to play the move in
+    :type game_state: GameState
+    :param coords: coordinates of the placed token
+    :type coords: tuple
+    :param colour: colour of the player making the move
+    :type colour: str
+    :return: dictionary of the colour, placed token and flipped tokens
+    :rtype: dict
+    """
+    flipped = game_state.apply_move(coords, colour)
+    return {
+        "colour" : colour,
+        "placed" : list(coords),
+        "flipped" : [list(flip) for flip in flipped]
+    }
+
+def simple_game_loop(size:int = 8) -> None:
     """
     Simple game loop for intermediate manual testing through CLI
+
+    :param size: board dimension (default 8)
+    :type size: int
     """
     # Start the game with a welcome message:
     print( "#" * 27 + "\n" + "#" + " Welcome to Othello game " +"#" + "\n"+ "#" * 27 )
 
     # Initialise variables for game
-    cur_board = initialise_board()
-    move_counter = 60
+    cur_board = initialise_board(size)
+    # Every square except the four starting ones can be filled
+    move_counter = size * size - 4
+    # Set to Light so that Dark goes first
+    cur_player = "Light"
 
     # iterate for as long as the game lasts
     while move_counter > 0:
@@ -163,8 +578,8 @@ def simple_game_loop() -> None:
         # If neither player has possible turns, quit the loop:
         if not (black_has_legal or light_has_legal):
             break
-        # By default, Dark goes first:
-        if move_counter % 2 == 0 and black_has_legal:
+        # Players take turns, unless the next player has no move and has to pass
+        if (cur_player == "Light" and black_has_legal) or not light_has_legal:
             cur_player = "Dark "
         else:
             cur_player = "Light"
@@ -172,20 +587,19 @@ def simple_game_loop() -> None:
         # Display info to CLI
         print_board(cur_board)
         print(f"{move_counter} turns left\n{cur_player} is up")
-        for x1 in range(8):
-            for y1 in range(8):
-                if legal_move(cur_player, (x1,y1), cur_board):
-                    print(f"({y1}, {x1}) legal for {cur_player}")
+        possible_moves = dict(legal_moves(cur_board, cur_player))
+        for x1, y1 in possible_moves:
+            print(f"({y1}, {x1}) legal for {cur_player}")
 
         # Get current player to make their move:
         move_made = False
         while not move_made:
             move_coords = cli_coords_input()
-            move_possible = legal_move(cur_player, move_coords, cur_board)
-            if move_possible:
+            if move_coords in possible_moves:
                 print("Move is possible")
-                cur_board[move_coords[1]][move_coords[0]] = cur_player
-                cur_board = outflanked(cur_board, cur_player, move_coords)
+                # Flips are already known from generating the moves
+                for x, y in [move_coords] + possible_moves[move_coords]:
+                    cur_board[y][x] = cur_player
                 move_made = True
             else:
                 print("Invalid move")
@@ -0,0 +1,176 @@
+"""
+Module for keeping many games at once, each under its own game id. Live games are kept
+in memory, and every change is also written through to a persistent backend
+"""
+
+import json
+import os
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+
+from components import initialise_board
+from game_engine import GameState
+
+def new_game_id() -> str:
+    """
+    Return a new random game id
+    """
+    return uuid.uuid4().hex
+
+def valid_game_id(game_id:str | None) -> bool:
+    """
+    Check a game id looks like one from new_game_id, so it is safe to use in file names
+    """
+    return isinstance(game_id, str) and len(game_id) == 32 and game_id.isalnum()
+
+class JsonFileBackend:
+    """
+    Backend storing each game as its own JSON file in a directory
+    """
+    def __init__(self, directory:str = "saves") -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, game_id:str) -> str:
+        """
+        Return the file a game is saved in
+        """
+        return os.path.join(self.directory, f"{game_id}.json")
+
+    def load(self, game_id:str) -> GameState | None:
+        """
+        Load a game, or return None if there is no save for it
+        """
+        try:
+            with open(self.path(game_id), "r", encoding="UTF-8") as f:
+                return GameState.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, game_id:str, game_state:GameState) -> None:
+        """
+        Save a game. The file is written to the side and renamed over the old one, so a
+        reader in another process never sees half a file. Each save gets its own temporary
+        file, so two threads saving the same game don't write over each other's.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{game_id}.", suffix=".tmp")
+        try:
+            with open(fd, "w", encoding="UTF-8") as f:
+                json_str = json.dumps(game_state.to_dict(), indent=4)
+                f.write(json_str)
+            os.replace(temp_path, self.path(game_id))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def delete(self, game_id:str) -> None:
+        """
+        Delete the save for a game, if there is one
+        """
+        try:
+            os.remove(self.path(game_id))
+        except FileNotFoundError:
+            pass
+
+class GameStore:
+    """
+    Game states keyed by game id. Up to max_live recently used games are kept in memory,
+    and any backend with load/save/delete methods keeps them all on disk.
+
+    The in-memory copies belong to this process. When several processes serve the same
+    games without sticky sessions, use max_live=0 so every request reads the backend.
+    Within a process, hold game_lock(game_id) while changing a game. A backend with an
+    on_conflict attribute reports saves it had to drop, and the in-memory copy of that
+    game is forgotten so the next request reads the backend's.
+    """
+    def __init__(self, backend=None, max_live:int = 1000) -> None:
+        self.backend = backend if backend is not None else JsonFileBackend()
+        self.max_live = max_live
+        self.live = OrderedDict()
+        self.lock = threading.Lock()
+        # One lock per game being played, dropped once nothing holds it
+        self.game_locks = weakref.WeakValueDictionary()
+        if hasattr(self.backend, "on_conflict"):
+            self.backend.on_conflict = self.forget
+
+    def game_lock(self, game_id:str | None) -> threading.Lock:
+        """
+        Return the lock for a game, so that only one thread changes it at a time
+        """
+        with self.lock:
+            game_lock = self.game_locks.get(game_id)
+            if game_lock is None:
+                game_lock = threading.Lock()
+                self.game_locks[game_id] = game_lock
+            return game_lock
+
+    def remember(self, game_id:str, game_state:GameState) -> None:
+        """
+        Keep a game in memory, forgetting the least recently used one if there are too many
+        """
+        if self.max_live <= 0:
+            return
+        with self.lock:
+            self.live[game_id] = game_state
+            self.live.move_to_end(game_id)
+            while len(self.live) > self.max_live:
+                self.live.popitem(last=False)
+
+    def forget(self, game_id:str) -> None:
+        """
+        Drop a game from memory, so it is read from the backend next time
+        """
+        with self.lock:
+            self.live.pop(game_id, None)
+
+    def get(self, game_id:str | None) -> GameState | None:
+        """
+        Return the game for an id, or None if there is no such game
+
+        :param game_id: id of the game
+        :type game_id: str | None
+        :return: the game state
+        :rtype: GameState | None
+        """
+        if not valid_game_id(game_id):
+            return None
+        with self.lock:
+            game_state = self.live.get(game_id)
+            if game_state is not None:
+                self.live.move_to_end(game_id)
+                return game_state
+        game_state = self.backend.load(game_id)
+        if game_state is not None:
+            self.remember(game_id, game_state)
+        return game_state
+
+    def new_game(self, size:int = 8) -> tuple:
+        """
+        Start a new game with Dark to move
+
+        :param size: board dimension
+        :type size: int
+        :return: (game id, game state)
+        :rtype: tuple
+        """
+        game_id = new_game_id()
+        game_state = GameState(board=initialise_board(size), cur_player="Dark ")
+        self.save(game_id, game_state)
+        return (game_id, game_state)
+
+    def save(self, game_id:str, game_state:GameState) -> None:
+        """
+        Write a game through to the backend and keep it in memory
+        """
+        self.backend.save(game_id, game_state)
+        self.remember(game_id, game_state)
+
+    def delete(self, game_id:str) -> None:
+        """
+        Forget a game everywhere
+        """
+        self.forget(game_id)
+        self.backend.delete(game_id)
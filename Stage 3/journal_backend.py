@@ -0,0 +1,166 @@
+"""
+Module providing an append-only journal backend for the game store. Each move is appended
+to the game's file as a few bytes, with a full snapshot of the position every so often,
+so a save never rewrites the whole board and the file holds the whole game history
+"""
+
+import os
+import struct
+
+from game_engine import GameState
+
+# Move record: tag, x, y, colour (0 for Dark, 1 for Light)
+MOVE_RECORD = struct.Struct("<cHHB")
+# Moves in older journals, whose 1 byte coordinates only fit boards up to 256x256
+MOVE_RECORD_V1 = struct.Struct("<cBBB")
+# Snapshot record header: tag, number of moves before the snapshot, length of the position
+SNAPSHOT_HEADER = struct.Struct("<cII")
+# Snapshots in older journals, whose 2 byte length only fits boards up to about 360x360
+SNAPSHOT_HEADER_V1 = struct.Struct("<cIH")
+
+MOVE_TAG = b"N"
+MOVE_TAG_V1 = b"M"
+MOVE_RECORDS = {MOVE_TAG : MOVE_RECORD, MOVE_TAG_V1 : MOVE_RECORD_V1}
+SNAPSHOT_TAG = b"P"
+SNAPSHOT_TAG_V1 = b"S"
+SNAPSHOT_HEADERS = {SNAPSHOT_TAG : SNAPSHOT_HEADER, SNAPSHOT_TAG_V1 : SNAPSHOT_HEADER_V1}
+
+def read_journal(path:str) -> tuple:
+    """
+    Read every record in a journal file. A record cut short at the end of the file
+    (from a crash part way through a write) is ignored, and the offset returned is where
+    it starts, so the next write can cut it off.
+
+    :param path: journal file
+    :type path: str
+    :return: (list of ((x, y), colour) moves, last snapshot's move count, last snapshot bytes,
+        offset just past the last complete record)
+    :rtype: tuple
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    moves = []
+    snapshot_ply, snapshot = 0, None
+    offset = 0
+    while offset < len(data):
+        tag = data[offset:offset + 1]
+        if tag in MOVE_RECORDS and offset + MOVE_RECORDS[tag].size <= len(data):
+            _, x, y, colour = MOVE_RECORDS[tag].unpack_from(data, offset)
+            moves.append(((x, y), "Light" if colour else "Dark "))
+            offset += MOVE_RECORDS[tag].size
+        elif tag in SNAPSHOT_HEADERS and offset + SNAPSHOT_HEADERS[tag].size <= len(data):
+            _, ply, length = SNAPSHOT_HEADERS[tag].unpack_from(data, offset)
+            start = offset + SNAPSHOT_HEADERS[tag].size
+            if start + length > len(data):
+                break
+            snapshot_ply, snapshot = ply, data[start:start + length]
+            offset = start + length
+        else:
+            break
+    return (moves, snapshot_ply, snapshot, offset)
+
+class JournalBackend:
+    """
+    Backend storing each game as an append-only journal file in a directory.
+    A snapshot is written when a game is first saved, every snapshot_every moves after
+    that, and whenever the player to move or finished flag changes. Loading reads the
+    latest snapshot and replays the moves after it.
+
+    Like the in-memory part of GameStore, the count of moves already written is kept per
+    process, so one game should be saved by one process at a time.
+    """
+    def __init__(self, directory:str = "saves", snapshot_every:int = 16,
+                 fsync:bool = False) -> None:
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        # game id to (moves written, moves at last snapshot, (cur_player, finished),
+        # offset just past the last complete record)
+        self.written = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, game_id:str) -> str:
+        """
+        Return the file a game is journalled in
+        """
+        return os.path.join(self.directory, f"{game_id}.log")
+
+    def load(self, game_id:str) -> GameState | None:
+        """
+        Load a game from its latest snapshot and the moves after it, or return None if
+        there is no journal for it
+        """
+        try:
+            moves, snapshot_ply, snapshot, end = read_journal(self.path(game_id))
+        except FileNotFoundError:
+            return None
+        if snapshot is None:
+            return None
+
+        game_state = GameState.from_bytes(snapshot)
+        game_state.history = moves[:snapshot_ply]
+        for coords, colour in moves[snapshot_ply:]:
+            game_state.apply_move(coords, colour)
+
+        self.written[game_id] = (len(moves), snapshot_ply,
+                                 (game_state.cur_player, game_state.finished), end)
+        return game_state
+
+    def save(self, game_id:str, game_state:GameState) -> None:
+        """
+        Append the moves made since the last save, and a snapshot if one is due. Anything
+        after the last complete record, left by a write cut short, is cut off first.
+        """
+        written = self.written.get(game_id)
+        if written is None and os.path.exists(self.path(game_id)):
+            # Saved by an earlier run of the program: find out what is already there
+            moves, snapshot_ply, snapshot, end = read_journal(self.path(game_id))
+            flags = None
+            if snapshot is not None:
+                snapshot_state = GameState.from_bytes(snapshot)
+                flags = (snapshot_state.cur_player, snapshot_state.finished)
+            written = (len(moves), snapshot_ply, flags, end)
+
+        history = game_state.history
+        flags = (game_state.cur_player, game_state.finished)
+        records = []
+
+        if written is None or len(history) < written[0]:
+            # New game, or history that doesn't follow on from the journal: start again
+            mode = "wb"
+            moves_written, snapshot_ply, snapshot_flags, end = 0, None, None, 0
+        else:
+            mode = "r+b"
+            moves_written, snapshot_ply, snapshot_flags, end = written
+
+        for (x, y), colour in history[moves_written:]:
+            records.append(MOVE_RECORD.pack(MOVE_TAG, x, y, colour == "Light"))
+
+        if (snapshot_ply is None or flags != snapshot_flags
+                or len(history) - snapshot_ply >= self.snapshot_every):
+            position = game_state.to_bytes()
+            records.append(SNAPSHOT_HEADER.pack(SNAPSHOT_TAG, len(history), len(position)))
+            records.append(position)
+            snapshot_ply, snapshot_flags = len(history), flags
+
+        data = b"".join(records)
+        with open(self.path(game_id), mode) as f:
+            f.seek(end)
+            f.truncate()
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.written[game_id] = (len(history), snapshot_ply, snapshot_flags, end + len(data))
+
+    def delete(self, game_id:str) -> None:
+        """
+        Delete the journal for a game, if there is one
+        """
+        self.written.pop(game_id, None)
+        try:
+            os.remove(self.path(game_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,115 @@
+"""
+Module for writing and reading an opening book: a sorted binary file mapping position
+hashes to the best move found for them, read through mmap so it costs nothing to load
+and is shared between processes by the operating system.
+Books are built by build_book.py.
+"""
+
+import mmap
+import os
+import struct
+
+from zobrist import hash_board, position_key
+
+BOOK_MAGIC = b"OTHB"
+BOOK_VERSION = 1
+
+# magic, version, board size, record count
+HEADER = struct.Struct("<4sBBI")
+# position key, move square (x * size + y), score
+RECORD = struct.Struct("<QHh")
+
+def write_book(path:str, size:int, entries:dict) -> None:
+    """
+    Write book entries to a file, sorted by key
+
+    :param path: file to write
+    :type path: str
+    :param size: board dimension the book is for
+    :type size: int
+    :param entries: dictionary of position key to (move coordinates, score)
+    :type entries: dict
+    """
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, size, len(entries)))
+        for key in sorted(entries):
+            (x, y), score = entries[key]
+            # Clamp so that solved endgame scores still fit in 16 bits
+            score = max(-32768, min(32767, score))
+            f.write(RECORD.pack(key, x * size + y, score))
+
+class OpeningBook:
+    """
+    Read-only view of a book file, searched with a binary search over the mapped file
+    """
+    def __init__(self, path:str) -> None:
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {BOOK_VERSION} opening book")
+
+    def close(self) -> None:
+        """
+        Unmap the file
+        """
+        self.data.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup_key(self, key:int) -> tuple | None:
+        """
+        Find the entry for a position key
+
+        :param key: position hash from zobrist.position_key
+        :type key: int
+        :return: (move coordinates, score), or None if the position isn't in the book
+        :rtype: tuple | None
+        """
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            mid_key, square, score = RECORD.unpack_from(self.data, HEADER.size + mid * RECORD.size)
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return (divmod(square, self.size), score)
+        return None
+
+    def lookup(self, board:list, colour:str) -> tuple | None:
+        """
+        Find the book move for a position
+
+        :param board: 2D list representing the board
+        :type board: list
+        :param colour: player to move
+        :type colour: str
+        :return: coordinates of the book move, or None if the position isn't in the book
+        :rtype: tuple | None
+        """
+        if len(board) != self.size:
+            return None
+        entry = self.lookup_key(position_key(hash_board(board), colour))
+        if entry is None:
+            return None
+        return entry[0]
+
+# Book used by the search AI, if one has been built next to this module
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+_default_book = None
+
+def default_book() -> OpeningBook | None:
+    """
+    Open the default book the first time it is asked for
+
+    :return: the book at DEFAULT_BOOK_PATH, or None if there isn't one
+    :rtype: OpeningBook | None
+    """
+    global _default_book
+    if _default_book is None and os.path.exists(DEFAULT_BOOK_PATH):
+        _default_book = OpeningBook(DEFAULT_BOOK_PATH)
+    return _default_book
@@ -0,0 +1,186 @@
+"""
+Module for running the search AI across several processes, by splitting up the moves at
+the root of the search between a pool of workers
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from endgame import DEFAULT_ENDGAME_EMPTIES
+from game_engine import GameState
+from opening_book import OpeningBook
+from search_opponent import DEFAULT_TIME_LIMIT, WIN_SCORE, SearchTimeout, Searcher
+from search_opponent import order_moves, other_colour, shortcut_move
+
+# Each worker process keeps one Searcher, so its transposition table lives between tasks
+_worker_searcher = None
+
+def search_root_move(cells:bytes, size:int, colour:str, coords:tuple, depth:int,
+                     deadline:float | None) -> tuple | None:
+    """
+    Search one root move to a fixed depth. Runs inside a worker process, and may have sat
+    in the pool's queue for a while first, so the time limit is an absolute deadline.
+
+    :param cells: cells of the board before the move, see cells.py
+    :type cells: bytes
+    :param size: board dimension
+    :type size: int
+    :param colour: player making the root move
+    :type colour: str
+    :param coords: the root move to search
+    :type coords: tuple
+    :param depth: depth to search to, counting the root move
+    :type depth: int
+    :param deadline: time.time() to give up at, or None for no limit
+    :type deadline: float | None
+    :return: (score for colour, nodes searched), or None if time ran out
+    :rtype: tuple | None
+    """
+    global _worker_searcher
+    if deadline is not None and time.time() >= deadline:
+        # Time ran out while the task was queued, don't start it
+        return None
+    if _worker_searcher is None:
+        _worker_searcher = Searcher()
+    searcher = _worker_searcher
+    searcher.nodes = 0
+    # Wall clock time is shared between processes, the searcher checks its own clock
+    searcher.deadline = (float("inf") if deadline is None
+                         else time.perf_counter() + deadline - time.time())
+
+    game_state = GameState.from_cells(cells, size, colour)
+    game_state.make_move(coords, colour)
+    try:
+        score = -searcher.negamax(game_state, other_colour(colour), depth - 1,
+                                  -float("inf"), float("inf"))
+    except SearchTimeout:
+        return None
+    return (score, searcher.nodes)
+
+class ParallelSearcher:
+    """
+    Search AI that shares the root moves out between a pool of worker processes.
+    With one worker everything runs in the calling process, in a fixed order.
+    Like Searcher, positions in the opening book are answered straight from it, and with
+    endgame_empties or fewer empty squares left the exact endgame solver is tried first,
+    in the calling process.
+    """
+    def __init__(self, workers:int | None = None, time_limit:float = DEFAULT_TIME_LIMIT,
+                 max_depth:int = 64, endgame_empties:int = DEFAULT_ENDGAME_EMPTIES,
+                 book:OpeningBook | None = None) -> None:
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.endgame_empties = endgame_empties
+        self.book = book
+        self.nodes = 0
+        self.pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def search_depth(self, game_state:GameState, colour:str, moves:list, depth:int,
+                     deadline:float | None) -> list | None:
+        """
+        Search every root move to one depth
+
+        :return: list of scores in the same order as moves, or None if time ran out
+        :rtype: list | None
+        """
+        if deadline is None:
+            time_left = wall_deadline = None
+        else:
+            time_left = deadline - time.perf_counter()
+            wall_deadline = time.time() + time_left
+
+        # Workers are sent the cells, the smallest form of the position
+        cells, size = bytes(game_state.cells), game_state.size
+        if self.pool is None:
+            results = [search_root_move(cells, size, colour, coords, depth, wall_deadline)
+                       for coords in moves]
+        else:
+            futures = [self.pool.submit(search_root_move, cells, size, colour, coords, depth,
+                                        wall_deadline)
+                       for coords in moves]
+            _, not_done = wait(futures, timeout=time_left)
+            if not_done:
+                # Drop the tasks still queued, so the next search doesn't wait behind them.
+                # Running tasks stop at the deadline by themselves.
+                for future in not_done:
+                    future.cancel()
+                return None
+            results = [future.result() for future in futures]
+
+        if None in results:
+            return None
+        self.nodes += sum(nodes for _, nodes in results)
+        return [score for score, _ in results]
+
+    def search(self, board:list, colour:str, depth:int | None = None,
+               time_limit:float | None = None) -> tuple | None:
+        """
+        Choose a move for colour. With depth given, search to exactly that depth with no
+        time limit, which gives the same answer for any number of workers. Otherwise deepen
+        until the time budget runs out, playing from the book if it knows the position and
+        solving the endgame exactly when it is near.
+
+        :param board: 2D list representing the board state, not changed
+        :type board: list
+        :param colour: player to move
+        :type colour: str
+        :param depth: fixed depth to search to, or None to use the time budget
+        :type depth: int | None
+        :param time_limit: seconds to search for this time, or None for self.time_limit
+        :type time_limit: float | None
+        :return: coordinates of the chosen move, or None if there are no legal moves
+        :rtype: tuple | None
+        """
+        return self.search_state(GameState(board, colour), colour, depth, time_limit)
+
+    def search_state(self, game_state:GameState, colour:str, depth:int | None = None,
+                     time_limit:float | None = None) -> tuple | None:
+        """
+        Choose a move like search, straight from a game rather than a 2D list board.
+        The game is not changed.
+        """
+        self.nodes = 0
+        moves = order_moves(game_state, colour)
+        if not moves:
+            return None
+
+        if depth is not None:
+            depths = [depth]
+            deadline = None
+        else:
+            depths = range(1, self.max_depth + 1)
+            time_limit = self.time_limit if time_limit is None else time_limit
+            deadline = time.perf_counter() + time_limit
+
+            # Play from the book, or solve the endgame, before sharing out any moves
+            shortcut = shortcut_move(game_state.copy(), colour, moves, self.book,
+                                     self.endgame_empties, time_limit)
+            if shortcut is not None:
+                return shortcut
+
+        best_move = moves[0]
+        for cur_depth in depths:
+            scores = self.search_depth(game_state, colour, moves, cur_depth, deadline)
+            if scores is None:
+                break
+
+            # Ties go to the move searched first, so the result doesn't depend on timing
+            best_score = max(scores)
+            best_move = moves[scores.index(best_score)]
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+            if abs(best_score) >= WIN_SCORE or cur_depth >= len(game_state.empties):
+                break
+
+        return best_move
@@ -0,0 +1,171 @@
+"""
+Module for perft: counting every position reachable in exactly N moves. The counts check
+move generation and flipping are right (they must match known values), and the time taken
+is the standard measure of engine speed in nodes per second.
+
+Run with:
+    python perft.py --depth 8 --workers 4
+    python perft.py --depth 6 --load saves/<game id>.json
+
+A pass counts as a move. A game that has finished counts as one position at the depth it
+ends, so counts past the first possible game end depend on that choice.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from components import initialise_board
+from game_engine import GameState
+from search_opponent import other_colour
+from zobrist import position_key
+
+# Node counts from the 8x8 starting board for depths 1 to 8
+KNOWN_COUNTS = (4, 12, 56, 244, 1396, 8200, 55092, 390216)
+
+def perft(game_state:GameState, colour:str, depth:int, cache:dict | None = None,
+          passed:bool = False) -> int:
+    """
+    Count the positions reached after exactly depth moves
+
+    :param game_state: position to count from, restored before returning
+    :type game_state: GameState
+    :param colour: player to move
+    :type colour: str
+    :param depth: amount of moves to look ahead
+    :type depth: int
+    :param cache: dictionary to keep subtree counts in, keyed by position hash, or None
+        to count every subtree from scratch
+    :type cache: dict | None
+    :param passed: whether the last move was a pass
+    :type passed: bool
+    :return: amount of positions
+    :rtype: int
+    """
+    if depth == 0:
+        return 1
+    if cache is not None:
+        key = (position_key(game_state.hash, colour), depth, passed)
+        nodes = cache.get(key)
+        if nodes is not None:
+            return nodes
+
+    moves = [coords for coords, _ in game_state.legal_moves(colour)]
+    if not moves:
+        # Two passes in a row end the game
+        nodes = 1 if passed else perft(game_state, other_colour(colour), depth - 1, cache, True)
+    else:
+        nodes = 0
+        for coords in moves:
+            game_state.make_move(coords, colour)
+            nodes += perft(game_state, other_colour(colour), depth - 1, cache)
+            game_state.unmake_move()
+
+    if cache is not None:
+        cache[key] = nodes
+    return nodes
+
+def perft_subtree(board:list, colour:str, depth:int, use_cache:bool) -> int:
+    """
+    Count the positions below one root move. Runs inside a worker process.
+    """
+    return perft(GameState(board, colour), colour, depth, {} if use_cache else None)
+
+def divide(game_state:GameState, colour:str, depth:int, workers:int = 1,
+           use_cache:bool = True) -> dict:
+    """
+    Count the positions below each root move, sharing the root moves out between
+    processes when there is more than one worker
+
+    :param game_state: position to count from, restored before returning
+    :type game_state: GameState
+    :param colour: player to move
+    :type colour: str
+    :param depth: amount of moves to look ahead, at least 1
+    :type depth: int
+    :param workers: amount of processes
+    :type workers: int
+    :param use_cache: whether to cache subtree counts by position hash
+    :type use_cache: bool
+    :return: dictionary of root move (None for a pass) to its count
+    :rtype: dict
+    """
+    moves = [coords for coords, _ in game_state.legal_moves(colour)]
+    if not moves:
+        return {None : perft(game_state, colour, depth, {} if use_cache else None)}
+
+    # Positions after each root move, for the workers to count from
+    tasks = []
+    for coords in moves:
+        game_state.make_move(coords, colour)
+        tasks.append((coords, [row.copy() for row in game_state.board]))
+        game_state.unmake_move()
+
+    if workers <= 1:
+        cache = {} if use_cache else None
+        counts = {}
+        for coords, board in tasks:
+            counts[coords] = perft(GameState(board, other_colour(colour)), other_colour(colour),
+                                   depth - 1, cache)
+        return counts
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {coords: executor.submit(perft_subtree, board, other_colour(colour),
+                                           depth - 1, use_cache)
+                   for coords, board in tasks}
+        return {coords: future.result() for coords, future in futures.items()}
+
+def perft_counts(game_state:GameState, colour:str, max_depth:int, workers:int = 1,
+                 use_cache:bool = True) -> list:
+    """
+    Count the positions at each depth from 1 to max_depth, and time each count
+
+    :return: list of (depth, nodes, seconds)
+    :rtype: list
+    """
+    results = []
+    for depth in range(1, max_depth + 1):
+        start = time.perf_counter()
+        nodes = sum(divide(game_state, colour, depth, workers, use_cache).values())
+        results.append((depth, nodes, time.perf_counter() - start))
+    return results
+
+def main() -> None:
+    """
+    Command line entry point for perft
+    """
+    parser = argparse.ArgumentParser(description="Count Othello positions to a given depth")
+    parser.add_argument("--depth", type=int, default=6, help="deepest count")
+    parser.add_argument("--size", type=int, default=8, help="board size, if not loading a game")
+    parser.add_argument("--load", default=None, help="saved game (JSON) to count from")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to use")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="count every subtree in full, for a fair nodes/s figure")
+    parser.add_argument("--divide", action="store_true", help="show the count for each root move")
+    args = parser.parse_args()
+
+    if args.load is not None:
+        with open(args.load, "r", encoding="UTF-8") as f:
+            game_state = GameState.from_dict(json.load(f))
+    else:
+        game_state = GameState(initialise_board(args.size), "Dark ")
+    colour = game_state.cur_player
+    use_cache = not args.no_cache
+
+    for depth, nodes, seconds in perft_counts(game_state, colour, args.depth,
+                                              args.workers, use_cache):
+        check = ""
+        if args.load is None and args.size == 8 and depth <= len(KNOWN_COUNTS):
+            check = "ok" if nodes == KNOWN_COUNTS[depth - 1] else "WRONG"
+        nodes_per_second = nodes / max(seconds, 1e-9)
+        print(f"{depth:>3}{nodes:>14,}{seconds:>10.3f}s{nodes_per_second:>14,.0f} nodes/s  {check}")
+
+    if args.divide:
+        counts = divide(game_state, colour, args.depth, args.workers, use_cache)
+        for coords, nodes in counts.items():
+            print(f"{'pass' if coords is None else coords}: {nodes:,}")
+
+if __name__ == "__main__":
+    main()
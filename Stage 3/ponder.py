@@ -0,0 +1,258 @@
+"""
+Module for pondering: working out the hard AI's replies on the player's time. While the
+player thinks, a background pool searches the positions after their most likely moves,
+and the replies are cached by position so the AI can answer at once if one is played
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Executor, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from multiprocessing.sharedctypes import RawArray
+
+from game_engine import GameState
+from opening_book import default_book
+from search_opponent import DEFAULT_TIME_LIMIT, SearchTimeout, Searcher, order_moves
+from zobrist import position_key
+
+# Amount of searches that can have their own stop time at once. Slots are reused in turn,
+# by which point the search that had one before has long finished.
+STOP_SLOTS = 4096
+
+# Seconds between a search's stop time and when its result is given up on, for the result
+# to come back from the pool
+RESULT_MARGIN = 0.05
+
+# Amount of nodes searched between looks at the stop time
+STOP_CHECK_NODES = 256
+
+# time.time() each search must stop by, shared with the pool's processes. Set by
+# share_stop_times, inside every process that runs searches.
+_stop_times = None
+
+def share_stop_times(stop_times) -> None:
+    """
+    Give a process the stop times of the searches it runs. Used as the pool's initializer.
+    """
+    global _stop_times
+    _stop_times = stop_times
+
+class PonderSearcher(Searcher):
+    """
+    Searcher that also stops once the stop time in its slot has passed, so a search can
+    be cut short from outside its process. Its best move so far is still returned.
+    """
+    def __init__(self, slot:int, time_limit:float) -> None:
+        super().__init__(time_limit, book=default_book())
+        self.slot = slot
+        self.stopped = False
+
+    def check_time(self) -> None:
+        """
+        Stop the search if the time budget has run out or it has been told to stop
+        """
+        if not self.nodes % STOP_CHECK_NODES and time.time() > _stop_times[self.slot]:
+            self.stopped = True
+            raise SearchTimeout
+        super().check_time()
+
+def ponder_reply(cells:bytes, size:int, time_limit:float, slot:int) -> tuple | None:
+    """
+    Search the AI's reply to a position. Runs in the background pool, and may have waited
+    in its queue, so the time limit only starts once the search does.
+
+    :param cells: cells of the board after the player's move, see cells.py
+    :type cells: bytes
+    :param size: board dimension
+    :type size: int
+    :param time_limit: seconds the search may take
+    :type time_limit: float
+    :param slot: index of the search's stop time
+    :type slot: int
+    :return: (coordinates of the AI's move, whether the search was stopped early),
+        or None if it was stopped before it started
+    :rtype: tuple | None
+    """
+    if time.time() >= _stop_times[slot]:
+        return None
+    searcher = PonderSearcher(slot, time_limit)
+    ai_move = searcher.search(GameState.from_cells(cells, size, "Light"), "Light")
+    return (ai_move, searcher.stopped)
+
+class Ponderer:
+    """
+    Background search of the AI's replies to the player's likely next moves.
+    Only the hard AI is pondered, the normal AI already answers at once.
+
+    Replies are cached by the position after the player's move, so it doesn't matter
+    which game or move order reached it. Pondering for a game stops any of that game's
+    earlier candidates, whether they have started or not.
+    """
+    def __init__(self, workers:int = 1, candidates:int = 4, max_cached:int = 10000,
+                 time_limit:float = DEFAULT_TIME_LIMIT, executor:Executor | None = None) -> None:
+        self.workers = workers
+        self.candidates = candidates
+        self.max_cached = max_cached
+        self.time_limit = time_limit
+        self.executor = executor
+        self.cache = OrderedDict()
+        # Position key to (future, stop time slot), for searches that haven't finished
+        self.in_flight = {}
+        self.stop_times = RawArray("d", STOP_SLOTS)
+        self.next_slot = 0
+        # Game id to the position keys last pondered for it
+        self.pondering = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> Executor:
+        """
+        Start the background pool the first time it is needed
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=share_stop_times,
+                                                initargs=(self.stop_times,))
+        else:
+            # A pool given to us runs searches in this process, or shares its memory
+            share_stop_times(self.stop_times)
+        return self.executor
+
+    def stop(self, key:int) -> None:
+        """
+        Stop a search, whether it has started or is still queued
+        """
+        with self.lock:
+            future, slot = self.in_flight.get(key, (None, None))
+        if future is not None:
+            self.stop_times[slot] = 0.0
+            future.cancel()
+
+    def remember(self, key:int, ai_move:tuple | None) -> None:
+        """
+        Cache a reply, forgetting the least recently used one if there are too many
+        """
+        with self.lock:
+            self.cache[key] = ai_move
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+
+    def finished(self, key:int, future) -> None:
+        """
+        Move a finished background search into the cache
+        """
+        with self.lock:
+            if self.in_flight.get(key, (None,))[0] is future:
+                del self.in_flight[key]
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        ai_move, stopped = future.result()
+        # A search cut short only had part of its time, so its move isn't kept
+        if not stopped:
+            self.remember(key, tuple(ai_move) if ai_move is not None else None)
+
+    def ponder(self, game_id:str, game_state:GameState) -> None:
+        """
+        Start searching the replies to the player's most likely moves. Called once it is
+        the player's turn.
+
+        :param game_id: id of the game, so its earlier candidates can be dropped
+        :type game_id: str
+        :param game_state: the game, with Dark to move. Restored before returning.
+        :type game_state: GameState
+        """
+        executor = self.start()
+        keys = []
+        for coords in order_moves(game_state, "Dark ")[:self.candidates]:
+            game_state.make_move(coords, "Dark ")
+            try:
+                key = position_key(game_state.hash, "Light")
+                if not game_state.has_legal_move("Light"):
+                    continue
+                keys.append(key)
+                with self.lock:
+                    if key in self.cache or key in self.in_flight:
+                        continue
+                cells = bytes(game_state.cells)
+            finally:
+                game_state.unmake_move()
+
+            with self.lock:
+                slot = self.next_slot
+                self.next_slot = (slot + 1) % STOP_SLOTS
+            self.stop_times[slot] = float("inf")
+            future = executor.submit(ponder_reply, cells, game_state.size, self.time_limit, slot)
+            with self.lock:
+                self.in_flight[key] = (future, slot)
+            future.add_done_callback(lambda done, key=key: self.finished(key, done))
+
+        with self.lock:
+            previous = self.pondering.get(game_id, [])
+            self.pondering[game_id] = keys
+        for key in previous:
+            if key not in keys:
+                self.stop(key)
+
+    def take(self, game_state:GameState, game_id:str | None = None,
+             time_limit:float | None = None) -> tuple | None:
+        """
+        Return the pondered reply for a position with Light to move. The game's other
+        candidates are stopped, since the player didn't make those moves. A search for the
+        position that hasn't finished is told to stop within time_limit and its best move
+        so far is used, as it had a head start on a new one. That includes a search still
+        queued, which starts once the stopped candidates make way for it.
+
+        :param game_state: the game after the player's move
+        :type game_state: GameState
+        :param game_id: id of the game, to stop its other candidates
+        :type game_id: str | None
+        :param time_limit: most seconds to wait, defaults to the pondering time limit
+        :type time_limit: float | None
+        :return: the AI's move, or None if the position wasn't pondered
+        :rtype: tuple | None
+        """
+        key = position_key(game_state.hash, "Light")
+        with self.lock:
+            found = key in self.cache
+            ai_move = self.cache.get(key)
+            future, slot = self.in_flight.get(key, (None, None))
+            stale = [other for other in self.pondering.pop(game_id, []) if other != key]
+        for other in stale:
+            self.stop(other)
+
+        if not found and future is not None:
+            wait = self.time_limit if time_limit is None else min(self.time_limit, time_limit)
+            if wait > RESULT_MARGIN:
+                # The search keeps its own time limit from when it started, and now has
+                # to be done by the time we stop waiting too
+                self.stop_times[slot] = min(self.stop_times[slot],
+                                            time.time() + wait - RESULT_MARGIN)
+                try:
+                    result = future.result(timeout=wait)
+                    if result is not None:
+                        ai_move, found = result[0], True
+                except (CancelledError, FutureTimeout):
+                    pass
+            if not found:
+                self.stop(key)
+
+        # Check the move, in case two positions happen to share a hash
+        if found and ai_move is not None and game_state.legal_move("Light", ai_move):
+            self.hits += 1
+            return tuple(ai_move)
+        self.misses += 1
+        return None
+
+    def close(self) -> None:
+        """
+        Stop the background pool, and every search it is running
+        """
+        with self.lock:
+            keys = list(self.in_flight)
+        for key in keys:
+            self.stop(key)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,366 @@
+"""
+Functions for the search based 'hard' AI opponent. It looks ahead using negamax with
+alpha-beta pruning, deepening one ply at a time until its time budget runs out
+"""
+
+import time
+
+from game_engine import GameState
+from zobrist import EXACT, LOWER, UPPER, TranspositionTable, position_key
+from endgame import DEFAULT_ENDGAME_EMPTIES, EndgameSolver, SolverTimeout
+from opening_book import OpeningBook, default_book
+
+# Default amount of seconds the AI may think for on each move
+DEFAULT_TIME_LIMIT = 1.0
+
+# Score given to a finished game, bigger than anything evaluate() can return
+WIN_SCORE = 10000
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget has run out
+    """
+
+def other_colour(colour:str) -> str:
+    """
+    Return the opponent of a given colour
+    """
+    return "Dark " if colour == "Light" else "Light"
+
+def corner_squares(size:int) -> tuple:
+    """
+    Return the four corner coordinates of a board
+    """
+    return ((0, 0), (0, size - 1), (size - 1, 0), (size - 1, size - 1))
+
+def move_order_key(coords:tuple, size:int) -> int:
+    """
+    Rough guess of how good a square is, used to search the likely best moves first.
+    Corners are best, edges are good and squares next to a corner are bad.
+
+    :param coords: coordinates of the move
+    :type coords: tuple
+    :param size: board dimension
+    :type size: int
+    :return: sort key, lower is searched first
+    :rtype: int
+    """
+    x, y = coords
+    edge_x = x in (0, size - 1)
+    edge_y = y in (0, size - 1)
+    if edge_x and edge_y:
+        return 0
+    near_x = x in (1, size - 2)
+    near_y = y in (1, size - 2)
+    if (edge_x or near_x) and (edge_y or near_y):
+        return 3
+    if edge_x or edge_y:
+        return 1
+    return 2
+
+def order_moves(game_state:GameState, colour:str, first:tuple | None = None) -> list:
+    """
+    Return the legal move coordinates for colour, most promising first
+
+    :param game_state: position to generate moves for
+    :type game_state: GameState
+    :param colour: player to move
+    :type colour: str
+    :param first: move to put at the front, such as the best move from the table
+    :type first: tuple | None
+    :return: list of move coordinates
+    :rtype: list
+    """
+    size = game_state.size
+    moves = [coords for coords, _ in game_state.legal_moves(colour)]
+    moves.sort(key=lambda coords: move_order_key(coords, size))
+    if first in moves:
+        moves.remove(first)
+        moves.insert(0, first)
+    return moves
+
+def evaluate(game_state:GameState, colour:str) -> int:
+    """
+    Heuristic score of a position from the point of view of colour.
+    Combines corners held, mobility and the disc count.
+
+    :param game_state: position to score
+    :type game_state: GameState
+    :param colour: player to score for
+    :type colour: str
+    :return: score, higher is better for colour
+    :rtype: int
+    """
+    opponent = other_colour(colour)
+
+    corners = 0
+    for coords in corner_squares(game_state.size):
+        cell = game_state.cell(coords)
+        if cell == colour:
+            corners += 1
+        elif cell == opponent:
+            corners -= 1
+
+    mobility = 0
+    for coords in game_state.frontier:
+        if game_state.count_flipped(colour, coords):
+            mobility += 1
+        if game_state.count_flipped(opponent, coords):
+            mobility -= 1
+
+    discs = game_state.counts[colour] - game_state.counts[opponent]
+    return 25 * corners + 5 * mobility + discs
+
+def shortcut_move(game_state:GameState, colour:str, moves:list, book:OpeningBook | None,
+                  endgame_empties:int, time_limit:float) -> tuple | None:
+    """
+    Find a move without searching: straight from the book if it knows the position, or
+    by solving the game exactly when it is near the end
+
+    :param game_state: position to move from, restored before returning
+    :type game_state: GameState
+    :param colour: player to move
+    :type colour: str
+    :param moves: the legal moves
+    :type moves: list
+    :param book: opening book, or None to skip it
+    :type book: OpeningBook | None
+    :param endgame_empties: most empty squares to try solving the game with
+    :type endgame_empties: int
+    :param time_limit: seconds of the whole move's budget, the solver takes half of it
+    :type time_limit: float
+    :return: coordinates of the move, or None if the position still needs searching
+    :rtype: tuple | None
+    """
+    if book is not None:
+        entry = book.lookup_key(position_key(game_state.hash, colour))
+        # Check the move, in case two positions happen to share a hash
+        if entry is not None and entry[0] in moves:
+            return entry[0]
+
+    # Near the end of the game, try to solve it exactly with half of the time budget,
+    # leaving the rest for the normal search if that doesn't finish
+    if len(game_state.empties) <= endgame_empties:
+        solver = EndgameSolver(time_limit=time_limit / 2)
+        try:
+            return solver.solve(game_state, colour)[1]
+        except SolverTimeout:
+            pass
+    return None
+
+class Searcher:
+    """
+    Negamax search with alpha-beta pruning over a GameState, using make_move/unmake_move.
+    Results are shared through a transposition table, so a Searcher (or its table) can be
+    reused between moves. Positions in the opening book are answered straight from it,
+    and with endgame_empties or fewer empty squares left the exact endgame solver is used.
+    """
+    def __init__(self, time_limit:float = DEFAULT_TIME_LIMIT, max_depth:int = 64,
+                 table:TranspositionTable | None = None,
+                 endgame_empties:int = DEFAULT_ENDGAME_EMPTIES,
+                 book:OpeningBook | None = None) -> None:
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.endgame_empties = endgame_empties
+        self.book = book
+        self.table = table if table is not None else TranspositionTable()
+        self.deadline = float("inf")
+        self.nodes = 0
+
+    def check_time(self) -> None:
+        """
+        Stop the search if the time budget has run out
+        """
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+    def ordered_moves(self, game_state:GameState, colour:str, first:tuple | None = None) -> list:
+        """
+        Return the legal move coordinates for colour, most promising first
+
+        :param first: move to put at the front, such as the best move from the table
+        """
+        return order_moves(game_state, colour, first)
+
+    def final_score(self, game_state:GameState, colour:str) -> int:
+        """
+        Score a finished game from the point of view of colour
+        """
+        discs = game_state.counts[colour] - game_state.counts[other_colour(colour)]
+        if discs > 0:
+            return WIN_SCORE + discs
+        if discs < 0:
+            return -WIN_SCORE + discs
+        return 0
+
+    def negamax(self, game_state:GameState, colour:str, depth:int,
+                alpha:int, beta:int, passed:bool = False) -> int:
+        """
+        Score a position by searching depth moves ahead
+
+        :param game_state: position to search, restored before returning
+        :type game_state: GameState
+        :param colour: player to move
+        :type colour: str
+        :param depth: how many moves ahead to look
+        :type depth: int
+        :param alpha: lowest score colour is already guaranteed
+        :type alpha: int
+        :param beta: highest score the opponent will allow
+        :type beta: int
+        :param passed: whether the previous player had to pass
+        :type passed: bool
+        :return: score from the point of view of colour
+        :rtype: int
+        """
+        self.nodes += 1
+        self.check_time()
+
+        if depth == 0:
+            return evaluate(game_state, colour)
+
+        # See if this position has already been searched deeply enough
+        key = position_key(game_state.hash, colour)
+        table_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            entry_depth, bound, entry_score, table_move = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return entry_score
+                if bound == LOWER and entry_score >= beta:
+                    return entry_score
+                if bound == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        moves = self.ordered_moves(game_state, colour, table_move)
+
+        # No moves: either pass, or the game is over if the opponent passed too
+        if not moves:
+            if passed:
+                return self.final_score(game_state, colour)
+            return -self.negamax(game_state, other_colour(colour), depth - 1, -beta, -alpha, True)
+
+        original_alpha = alpha
+        best_score = -float("inf")
+        best_move = None
+        for coords in moves:
+            game_state.make_move(coords, colour)
+            try:
+                score = -self.negamax(game_state, other_colour(colour), depth - 1, -beta, -alpha)
+            finally:
+                game_state.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = coords
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break # The opponent will never allow this line
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, bound, best_score, best_move)
+        return best_score
+
+    def search_root(self, game_state:GameState, colour:str, moves:list, depth:int) -> tuple:
+        """
+        Search each root move to a fixed depth
+
+        :return: (best move, its score)
+        :rtype: tuple
+        """
+        alpha = -float("inf")
+        best_move = moves[0]
+        for coords in moves:
+            game_state.make_move(coords, colour)
+            try:
+                score = -self.negamax(game_state, other_colour(colour), depth - 1,
+                                      -float("inf"), -alpha)
+            finally:
+                game_state.unmake_move()
+            if score > alpha:
+                alpha = score
+                best_move = coords
+        return (best_move, alpha)
+
+    def search(self, game_state:GameState, colour:str) -> tuple | None:
+        """
+        Search deeper and deeper until the time budget runs out, then return the best
+        move from the deepest search that finished
+
+        :param game_state: position to search, restored before returning
+        :type game_state: GameState
+        :param colour: player to move
+        :type colour: str
+        :return: coordinates of the chosen move, or None if there are no legal moves
+        :rtype: tuple | None
+        """
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_limit
+        self.table.new_search()
+
+        moves = self.ordered_moves(game_state, colour)
+        if not moves:
+            return None
+
+        # Play from the book, or solve the endgame, if either gives a move
+        shortcut = shortcut_move(game_state, colour, moves, self.book, self.endgame_empties,
+                                 self.time_limit)
+        if shortcut is not None:
+            return shortcut
+
+        # Always have an answer, even if the first search doesn't finish in time
+        best_move = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            try:
+                best_move, score = self.search_root(game_state, colour, moves, depth)
+            except SearchTimeout:
+                break
+
+            # Search the best move first next time, for better pruning
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+            # No point going deeper once the result is known or the board is full
+            if abs(score) >= WIN_SCORE or depth >= len(game_state.empties):
+                break
+
+        return best_move
+
+def choose_search_move(board:list, colour:str, time_limit:float = DEFAULT_TIME_LIMIT) -> tuple | None:
+    """
+    Choose a move for colour by searching ahead within a time budget
+
+    :param board: 2D list representing the board state, not changed
+    :type board: list
+    :param colour: string representing who's turn it is
+    :type colour: str
+    :param time_limit: seconds the search may take
+    :type time_limit: float
+    :return: the coordinates of the chosen move, or None if there are no legal moves
+    :rtype: tuple | None
+    """
+    return search_move(GameState(board, colour), colour, time_limit)
+
+def search_move(game_state:GameState, colour:str,
+                time_limit:float = DEFAULT_TIME_LIMIT) -> tuple | None:
+    """
+    Choose a move like choose_search_move, straight from a game rather than a 2D list board
+
+    :param game_state: the game, not changed
+    :type game_state: GameState
+    :param colour: string representing who's turn it is
+    :type colour: str
+    :param time_limit: seconds the search may take
+    :type time_limit: float
+    :return: the coordinates of the chosen move, or None if there are no legal moves
+    :rtype: tuple | None
+    """
+    # Search on a copy so the real game is never touched
+    return Searcher(time_limit, book=default_book()).search(game_state.copy(), colour)
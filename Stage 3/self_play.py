@@ -0,0 +1,327 @@
+"""
+Module for playing many AI against AI games without a user, across a pool of processes,
+and streaming each finished game to a results file. Used to check the AIs haven't got
+weaker and to measure how many games per second the engine can play.
+
+Run with:
+    python self_play.py --games 200 --dark greedy --light search:2 --workers 4 --out results.jsonl
+
+Policies are "greedy" (the normal AI, choose_move), "random" and "search:<depth>".
+"""
+
+import argparse
+import json
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ai_opponent import choose_move
+from components import initialise_board
+from game_engine import GameState, check_win
+from search_opponent import Searcher
+
+# Binary results file: magic, version, board size
+RESULTS_MAGIC = b"OTHS"
+RESULTS_VERSION = 1
+RESULTS_HEADER = struct.Struct("<4sBB")
+# One game: game number, seed, Dark's score, Light's score, whether the policies swapped
+# sides, amount of moves, seconds taken
+GAME_RECORD = struct.Struct("<IIHHBHd")
+# One move: x, y, colour (0 for Dark, 1 for Light)
+MOVE_RECORD = struct.Struct("<BBB")
+
+def random_policy(game_state:GameState, colour:str, moves:dict, previous_flipped:int,
+                  rng:random.Random) -> tuple:
+    """
+    Pick any legal move
+    """
+    return rng.choice(sorted(moves))
+
+def greedy_policy(game_state:GameState, colour:str, moves:dict, previous_flipped:int,
+                  rng:random.Random) -> tuple:
+    """
+    Pick a move the same way as the normal AI
+    """
+    flip_counts = {coords: len(flipped) for coords, flipped in moves.items()}
+    return choose_move(previous_flipped, flip_counts)
+
+def make_policy(name:str):
+    """
+    Build a policy from its name. A policy is called with the game, the colour to move,
+    a dictionary of legal moves to the tokens they flip, the amount of tokens the other
+    player's last move flipped and a random generator, and returns the move to make.
+
+    :param name: "random", "greedy" or "search:<depth>"
+    :type name: str
+    :return: the policy
+    :raises ValueError: if the name isn't a known policy
+    """
+    if name == "random":
+        return random_policy
+    if name == "greedy":
+        return greedy_policy
+    if name.startswith("search"):
+        _, _, depth = name.partition(":")
+        # Fixed depth rather than a time limit, so results don't depend on machine speed
+        searcher = Searcher(float("inf"), max_depth=int(depth or 2), endgame_empties=0)
+        return lambda game_state, colour, moves, previous_flipped, rng: \
+            searcher.search(game_state, colour)
+    raise ValueError(f"Unknown policy {name}")
+
+def play_game(dark:str, light:str, seed:int, size:int = 8) -> dict:
+    """
+    Play one game between two policies
+
+    :param dark: name of the policy playing Dark
+    :type dark: str
+    :param light: name of the policy playing Light
+    :type light: str
+    :param seed: seed for the policies' random choices
+    :type seed: int
+    :param size: board dimension
+    :type size: int
+    :return: dictionary of the moves, final scores, winner and seconds taken
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    policies = {"Dark " : make_policy(dark), "Light" : make_policy(light)}
+    game_state = GameState(initialise_board(size), "Dark ")
+    colour = "Dark "
+    previous_flipped = 0
+    passed = False
+
+    while True:
+        moves = dict(game_state.legal_moves(colour))
+        if not moves:
+            # Game ends if neither player can go
+            if passed:
+                break
+            passed = True
+            colour = "Dark " if colour == "Light" else "Light"
+            continue
+        passed = False
+        coords = policies[colour](game_state, colour, moves, previous_flipped, rng)
+        previous_flipped = len(game_state.apply_move(coords, colour))
+        colour = "Dark " if colour == "Light" else "Light"
+
+    (light_score, dark_score), winner = check_win(game_state.board)
+    return {
+        "dark" : dark,
+        "light" : light,
+        "seed" : seed,
+        "moves" : [[x, y, colour] for (x, y), colour in game_state.history],
+        "score" : {"Dark " : dark_score, "Light" : light_score},
+        "winner" : winner,
+        "seconds" : time.perf_counter() - start
+    }
+
+def play_numbered_game(args:tuple) -> dict:
+    """
+    Play game number n of a batch. Runs inside a worker process.
+
+    :param args: (n, policy a, policy b, seed of the batch, board size, swap sides)
+    :type args: tuple
+    :return: the game, as from play_game, with its number
+    :rtype: dict
+    """
+    number, policy_a, policy_b, seed, size, swap = args
+    if swap and number % 2:
+        result = play_game(policy_b, policy_a, seed + number, size)
+    else:
+        result = play_game(policy_a, policy_b, seed + number, size)
+    result["game"] = number
+    return result
+
+class JsonlSink:
+    """
+    Writes one JSON line per game
+    """
+    def __init__(self, path:str) -> None:
+        self.file = open(path, "w", encoding="UTF-8")
+
+    def write(self, result:dict) -> None:
+        """
+        Write a game
+        """
+        self.file.write(json.dumps(result) + "\n")
+
+    def close(self) -> None:
+        """
+        Close the file
+        """
+        self.file.close()
+
+class BinarySink:
+    """
+    Writes games as fixed size records followed by their moves. Policy names aren't
+    stored, only whether the two policies swapped sides in that game.
+    """
+    def __init__(self, path:str, size:int = 8) -> None:
+        self.file = open(path, "wb")
+        self.file.write(RESULTS_HEADER.pack(RESULTS_MAGIC, RESULTS_VERSION, size))
+        self.first_dark = None
+
+    def write(self, result:dict) -> None:
+        """
+        Write a game
+        """
+        if self.first_dark is None:
+            self.first_dark = result["dark"]
+        self.file.write(GAME_RECORD.pack(
+            result["game"], result["seed"], result["score"]["Dark "], result["score"]["Light"],
+            result["dark"] != self.first_dark, len(result["moves"]), result["seconds"]))
+        self.file.write(b"".join(MOVE_RECORD.pack(x, y, colour == "Light")
+                                 for x, y, colour in result["moves"]))
+
+    def close(self) -> None:
+        """
+        Close the file
+        """
+        self.file.close()
+
+def read_binary_results(path:str) -> list:
+    """
+    Read a file written by BinarySink
+
+    :param path: results file
+    :type path: str
+    :return: list of dictionaries with the game number, seed, scores, swapped flag and moves
+    :rtype: list
+    :raises ValueError: if the file isn't a results file
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, _ = RESULTS_HEADER.unpack_from(data, 0)
+    if magic != RESULTS_MAGIC or version != RESULTS_VERSION:
+        raise ValueError(f"{path} is not a version {RESULTS_VERSION} results file")
+
+    results = []
+    offset = RESULTS_HEADER.size
+    while offset < len(data):
+        game, seed, dark_score, light_score, swapped, count, seconds = \
+            GAME_RECORD.unpack_from(data, offset)
+        offset += GAME_RECORD.size
+        move_data = data[offset:offset + count * MOVE_RECORD.size]
+        moves = [[x, y, "Light" if colour else "Dark "]
+                 for x, y, colour in MOVE_RECORD.iter_unpack(move_data)]
+        offset += count * MOVE_RECORD.size
+        results.append({
+            "game" : game,
+            "seed" : seed,
+            "score" : {"Dark " : dark_score, "Light" : light_score},
+            "swapped" : bool(swapped),
+            "moves" : moves,
+            "seconds" : seconds
+        })
+    return results
+
+def simulate(games:int, policy_a:str, policy_b:str, workers:int | None = None, seed:int = 0,
+             size:int = 8, swap:bool = True, sink=None):
+    """
+    Play a batch of games across a pool of processes, yielding each game as it finishes
+    in game order, and writing it to the sink if there is one
+
+    :param games: amount of games
+    :type games: int
+    :param policy_a: policy playing Dark in even numbered games
+    :type policy_a: str
+    :param policy_b: policy playing Light in even numbered games
+    :type policy_b: str
+    :param workers: amount of processes, 1 plays everything in this process
+    :type workers: int | None
+    :param seed: game n is played with seed + n
+    :type seed: int
+    :param size: board dimension
+    :type size: int
+    :param swap: whether the policies swap sides in odd numbered games
+    :type swap: bool
+    :param sink: object with a write method taking each game
+    :return: generator of games, as from play_game
+    """
+    # Check the names here rather than failing inside a worker
+    make_policy(policy_a)
+    make_policy(policy_b)
+    tasks = ((number, policy_a, policy_b, seed, size, swap) for number in range(games))
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        results = map(play_numbered_game, tasks)
+        for result in results:
+            if sink is not None:
+                sink.write(result)
+            yield result
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        # Hand out games in chunks, so short games don't spend their time on messaging
+        chunksize = max(1, games // (workers * 8))
+        for result in executor.map(play_numbered_game, tasks, chunksize=chunksize):
+            if sink is not None:
+                sink.write(result)
+            yield result
+
+def summarise(results:list, seconds:float) -> dict:
+    """
+    Count the wins for each policy and the games played per second
+
+    :param results: games from simulate
+    :type results: list
+    :param seconds: wall clock time the batch took
+    :type seconds: float
+    :return: dictionary of wins per policy, draws, games and games per second
+    :rtype: dict
+    """
+    wins = {}
+    draws = 0
+    for result in results:
+        wins.setdefault(result["dark"], 0)
+        wins.setdefault(result["light"], 0)
+        if result["winner"] == "Draw":
+            draws += 1
+        elif result["winner"] == "Dark ":
+            wins[result["dark"]] += 1
+        else:
+            wins[result["light"]] += 1
+    return {
+        "games" : len(results),
+        "wins" : wins,
+        "draws" : draws,
+        "games_per_second" : len(results) / seconds if seconds > 0 else 0.0
+    }
+
+def main() -> None:
+    """
+    Command line entry point for running a batch of games
+    """
+    parser = argparse.ArgumentParser(description="Play Othello AIs against each other")
+    parser.add_argument("--games", type=int, default=100, help="number of games")
+    parser.add_argument("--dark", default="greedy", help="policy playing Dark first")
+    parser.add_argument("--light", default="random", help="policy playing Light first")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use")
+    parser.add_argument("--size", type=int, default=8, help="board size")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--no-swap", action="store_true", help="don't swap sides each game")
+    parser.add_argument("--out", default=None, help="results file (.jsonl or .bin)")
+    args = parser.parse_args()
+
+    sink = None
+    if args.out is not None:
+        if args.out.endswith(".bin"):
+            sink = BinarySink(args.out, args.size)
+        else:
+            sink = JsonlSink(args.out)
+
+    start = time.perf_counter()
+    try:
+        results = list(simulate(args.games, args.dark, args.light, args.workers, args.seed,
+                                args.size, not args.no_swap, sink))
+    finally:
+        if sink is not None:
+            sink.close()
+    print(json.dumps(summarise(results, time.perf_counter() - start), indent=4))
+
+if __name__ == "__main__":
+    main()
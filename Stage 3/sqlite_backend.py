@@ -0,0 +1,245 @@
+"""
+Module providing a SQLite backend for the game store. Games and their moves are kept as
+rows in a WAL mode database, and saves are coalesced and committed in batches.
+Each game row holds its amount of moves, and a save only goes through if the row still
+has the amount this process loaded, so a save from a stale copy is never written.
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from game_engine import GameState
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    board TEXT NOT NULL,
+    cur_player TEXT NOT NULL,
+    finished INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    plies INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS moves (
+    game_id TEXT NOT NULL,
+    ply INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    colour TEXT NOT NULL,
+    PRIMARY KEY (game_id, ply)
+);
+CREATE INDEX IF NOT EXISTS games_updated ON games (updated);
+"""
+
+class SqliteBackend:
+    """
+    Backend storing games in SQLite. Saves wait in memory until batch_size games are
+    waiting or flush_interval seconds have passed, and a game saved several times in
+    between is only written once. A background thread writes out quiet periods, and
+    anything left is written when the interpreter exits. Saves still waiting are lost if
+    the process is killed, so flush_interval is how much play can be lost.
+
+    A save of a game that another process has moved on since this one loaded it is
+    dropped rather than written over the newer game, and counted in conflicts. Saves are
+    written after the request that made them has finished, so on_conflict, if set, is
+    called with the game id instead, for the caller to drop its stale copy.
+
+    Each thread gets its own connection, opened the first time it is needed.
+    """
+    def __init__(self, path:str = "othello.db", batch_size:int = 32,
+                 flush_interval:float = 0.5) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # Held for a whole flush, so an older batch can never be written after a newer one
+        self.flush_lock = threading.Lock()
+        # game id to (game row, list of move rows) waiting to be written
+        self.pending = {}
+        # game id to number of moves in its row when this process last read or wrote it,
+        # so only new moves are inserted and stale saves can be spotted
+        self.saved_plies = {}
+        # Amount of saves dropped because the game had moved on in the database
+        self.conflicts = 0
+        self.on_conflict = None
+        self.last_flush = time.monotonic()
+        self.flusher_pid = None
+        self.closed = False
+        self.connection().executescript(SCHEMA)
+        self.add_plies_column()
+        atexit.register(self.flush)
+
+    def add_plies_column(self) -> None:
+        """
+        Add the plies column to a games table made before it existed, filled in from the
+        moves table
+        """
+        connection = self.connection()
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(games)")]
+        if "plies" in columns:
+            return
+        with connection:
+            connection.execute("ALTER TABLE games ADD COLUMN plies INTEGER NOT NULL DEFAULT 0")
+            connection.execute("UPDATE games SET plies = "
+                               "(SELECT COUNT(*) FROM moves WHERE moves.game_id = games.game_id)")
+
+    def start_flusher(self) -> None:
+        """
+        Start the background thread that writes saves left waiting, once per process
+        """
+        if self.flusher_pid == os.getpid():
+            return
+        self.flusher_pid = os.getpid()
+        threading.Thread(target=self.flush_loop, daemon=True).start()
+
+    def flush_loop(self) -> None:
+        """
+        Write waiting saves every flush_interval seconds until the backend is closed
+        """
+        while not self.closed:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's connection, opening it if needed (or if this is a new
+        process that inherited the object from its parent)
+        """
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode NORMAL is still safe against corruption, just not power loss
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def load(self, game_id:str) -> GameState | None:
+        """
+        Load a game, or return None if there is no save for it
+        """
+        # Anything still waiting to be written is newer than the database
+        self.flush()
+        connection = self.connection()
+        # Read the row and its moves in one transaction, so another process's save
+        # can't land in between
+        with connection:
+            connection.execute("BEGIN")
+            row = connection.execute(
+                "SELECT board, cur_player, finished, plies FROM games WHERE game_id = ?",
+                (game_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            moves = connection.execute(
+                "SELECT x, y, colour FROM moves WHERE game_id = ? AND ply < ? ORDER BY ply",
+                (game_id, row[3])
+            ).fetchall()
+        history = [((x, y), colour) for x, y, colour in moves]
+        with self.lock:
+            self.saved_plies[game_id] = row[3]
+        return GameState(json.loads(row[0]), row[1], bool(row[2]), history)
+
+    def save(self, game_id:str, game_state:GameState) -> None:
+        """
+        Queue a game to be written, and write the queue if it is due
+        """
+        game_row = (json.dumps(game_state.board), game_state.cur_player,
+                    int(game_state.finished), time.time(), len(game_state.history))
+        move_rows = [(game_id, ply, x, y, colour)
+                     for ply, ((x, y), colour) in enumerate(game_state.history)]
+        self.start_flusher()
+        with self.lock:
+            self.pending[game_id] = (game_row, move_rows)
+            due = (len(self.pending) >= self.batch_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write every waiting save in one transaction
+        """
+        with self.flush_lock:
+            self.write_pending()
+
+    def write_pending(self) -> None:
+        """
+        Take the waiting saves and write them. Only called with flush_lock held.
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.last_flush = time.monotonic()
+            saved_plies = dict(self.saved_plies)
+        if not pending:
+            return
+
+        written = []
+        stale = []
+        connection = self.connection()
+        with connection:
+            for game_id, (game_row, game_moves) in pending.items():
+                base_plies = saved_plies.get(game_id)
+                if base_plies is None:
+                    # A game this process hasn't read, only new if there is no row yet
+                    cursor = connection.execute(
+                        "INSERT OR IGNORE INTO games "
+                        "(board, cur_player, finished, updated, plies, game_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", game_row + (game_id,))
+                    base_plies = 0
+                else:
+                    cursor = connection.execute(
+                        "UPDATE games SET board = ?, cur_player = ?, finished = ?, updated = ?, "
+                        "plies = ? WHERE game_id = ? AND plies = ?",
+                        game_row + (game_id, base_plies))
+                if cursor.rowcount != 1:
+                    stale.append(game_id)
+                    continue
+                # Moves past the ones already written, replacing any left by a dropped game
+                connection.executemany(
+                    "INSERT OR REPLACE INTO moves (game_id, ply, x, y, colour) "
+                    "VALUES (?, ?, ?, ?, ?)", game_moves[base_plies:])
+                connection.execute("DELETE FROM moves WHERE game_id = ? AND ply >= ?",
+                                   (game_id, len(game_moves)))
+                written.append((game_id, len(game_moves)))
+
+        with self.lock:
+            for game_id, plies in written:
+                self.saved_plies[game_id] = plies
+            for game_id in stale:
+                # Read the game again before saving it next time
+                self.saved_plies.pop(game_id, None)
+            self.conflicts += len(stale)
+        if self.on_conflict is not None:
+            for game_id in stale:
+                self.on_conflict(game_id)
+
+    def delete(self, game_id:str) -> None:
+        """
+        Delete a game and its moves
+        """
+        with self.lock:
+            self.pending.pop(game_id, None)
+            self.saved_plies.pop(game_id, None)
+        connection = self.connection()
+        with connection:
+            connection.execute("DELETE FROM games WHERE game_id = ?", (game_id,))
+            connection.execute("DELETE FROM moves WHERE game_id = ?", (game_id,))
+
+    def close(self) -> None:
+        """
+        Write anything still waiting, stop the background thread and close this thread's
+        connection
+        """
+        self.closed = True
+        self.flush()
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
@@ -2,10 +2,40 @@
 Module containing tests for core game logic
 """
 
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from game_engine import initialise_board, legal_move, outflanked
-from game_engine import has_legal_move
+from game_engine import GameState, check_win, count_flipped, flipped_by, has_legal_move, legal_moves
 from ai_opponent import choose_move, possible_flip_counts
+from search_opponent import Searcher, choose_search_move, order_moves
+from parallel_search import ParallelSearcher, search_root_move
+from endgame import EndgameSolver, parity_order
+from opening_book import OpeningBook, write_book
+from build_book import build_book
+from game_store import GameStore, JsonFileBackend
+from sqlite_backend import SqliteBackend
+from journal_backend import MOVE_RECORD, MOVE_RECORD_V1, SNAPSHOT_HEADER_V1, JournalBackend
+from ponder import Ponderer
+import batch_moves
+from benchmark import compare, position_corpus, random_position, run_suite
+from perft import KNOWN_COUNTS, divide, perft, perft_counts
+from self_play import BinarySink, JsonlSink, play_game, read_binary_results, simulate, summarise
+from async_server import GameServer, accept_key, encode_frame, read_frame
+from zobrist import ENTRY_BYTES, EXACT, TranspositionTable, hash_board, position_key
+from bitboard import bit_to_coord, bitboards_to_board, board_to_bitboards, coord_to_bit
+from bitboard import flips_mask, iter_bits, legal_moves_mask, split_colour
+from bitboard import frontier_mask, generate_frontier_moves
+from board_tables import neighbour_table, ray_table
+from cells import CELL_VALUES, bitboards_to_cells, cells_to_bitboards, count_flipped_cells
+from cells import decode_board, encode_board, flipped_cells, legal_cell
 
 # Test the initialise_board function
 class TestInitialiseBoard(unittest.TestCase):
@@ -254,4 +284,1578 @@ class TestAiOpponent(unittest.TestCase):
             ]
         ai_move = choose_move(1, possible_flip_counts(board, "Light"))
         self.assertIsNone(ai_move)
-        
\ No newline at end of file
+        
+class TestBitboard(unittest.TestCase):
+    """
+    Test cases for the bitboard engine
+    """
+
+    def test_round_trip(self):
+        """
+        Test a board survives conversion to bitboards and back
+        """
+        board = [
+            [None, "Dark ", "Light", None, None],
+            ["Light", None, None, "Dark ", None],
+            [None, None, "Dark ", None, None],
+            [None, "Light", None, None, "Light"],
+            ["Dark ", None, None, None, None]
+        ]
+        dark, light = board_to_bitboards(board)
+        self.assertEqual(bitboards_to_board(dark, light, 5), board)
+
+    def test_initial_moves(self):
+        """
+        Test the legal move mask on the initial board has the four expected moves
+        """
+        board = initialise_board()
+        dark, light = board_to_bitboards(board)
+        moves = legal_moves_mask(dark, light, 8)
+        move_coords = {bit_to_coord(bit, 8) for bit in iter_bits(moves)}
+        self.assertEqual(move_coords, {(2,3), (3,2), (4,5), (5,4)})
+
+    def test_no_wrap(self):
+        """
+        Test that lines do not wrap around from one edge of the board to the other
+        """
+        board = [
+            [None, None, None, "Light"],
+            [None, None, None, "Dark "],
+            [None, None, None, None],
+            [None, None, None, None]
+        ]
+        dark, light = board_to_bitboards(board)
+        self.assertEqual(legal_moves_mask(dark, light, 4), 0)
+        self.assertFalse(legal_move("Dark ", (2,3), board))
+
+    def test_flips_mask(self):
+        """
+        Test the flip mask contains every outflanked token and nothing else
+        """
+        board = [
+            ["Light", "Dark ", "Dark ", None],
+            [None, None, None, None],
+            [None, None, None, None],
+            [None, None, None, None]
+        ]
+        light, dark = split_colour(*board_to_bitboards(board), "Light")
+        flips = flips_mask(light, dark, coord_to_bit((3,0), 4), 4)
+        self.assertEqual(flips, coord_to_bit((1,0), 4) | coord_to_bit((2,0), 4))
+
+class TestLegalMoves(unittest.TestCase):
+    """
+    Test cases for the legal_moves generator
+    """
+
+    def test_initial(self):
+        """
+        Test the generator gives the four opening moves, each flipping one token
+        """
+        board = initialise_board()
+        moves = dict(legal_moves(board, "Dark "))
+        self.assertEqual(moves, {
+            (2,3) : [(3,3)],
+            (3,2) : [(3,3)],
+            (4,5) : [(4,4)],
+            (5,4) : [(4,4)]
+        })
+
+    def test_multi_flip(self):
+        """
+        Test a move flipping in several directions reports every flipped token
+        """
+        board = [
+            [None, None, "Light", None, None],
+            [None, "Light", "Dark ", "Light", None],
+            ["Light", "Dark ", None, "Dark ", "Light"],
+            [None, "Light", "Dark ", "Light", None],
+            [None, None, "Light", None, None]
+        ]
+        moves = dict(legal_moves(board, "Light"))
+        self.assertEqual(sorted(moves[(2,2)]), [(1,2), (2,1), (2,3), (3,2)])
+
+    def test_matches_legal_move(self):
+        """
+        Test the generator agrees with legal_move on every cell
+        """
+        board = [
+            [None, "Light", "Dark ", None, None],
+            [None, "Dark ", "Light", "Light", None],
+            ["Dark ", "Light", "Light", None, None],
+            [None, None, "Dark ", None, None],
+            [None, None, None, None, None]
+        ]
+        moves = dict(legal_moves(board, "Dark "))
+        for x in range(5):
+            for y in range(5):
+                self.assertEqual((x,y) in moves, legal_move("Dark ", (x,y), board))
+
+class TestCountFlipped(unittest.TestCase):
+    """
+    Test cases for the count_flipped kernel
+    """
+
+    def test_multi_flip(self):
+        """
+        Test a move flipping in several directions counts every token
+        """
+        board = [
+            [None, None, "Light", None, None],
+            [None, "Light", "Dark ", "Light", None],
+            ["Light", "Dark ", None, "Dark ", "Light"],
+            [None, "Light", "Dark ", "Light", None],
+            [None, None, "Light", None, None]
+        ]
+        self.assertEqual(count_flipped(board, "Light", (2,2)), 4)
+
+    def test_unterminated_line(self):
+        """
+        Test a line of opponent tokens running off the board is not counted
+        """
+        board = [
+            [None, "Light", "Light", "Light"],
+            [None, "Light", None, None],
+            [None, None, "Dark ", None],
+            [None, None, None, None]
+        ]
+        self.assertEqual(count_flipped(board, "Dark ", (0,0)), 1)
+
+    def test_board_unchanged(self):
+        """
+        Test counting does not change the board
+        """
+        board = initialise_board()
+        count_flipped(board, "Dark ", (2,3))
+        self.assertEqual(board, initialise_board())
+
+class TestGameState(unittest.TestCase):
+    """
+    Test cases for the GameState counters
+    """
+
+    def test_initial_counts(self):
+        """
+        Test the counters of a new game
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        self.assertEqual(game_state.counts, {"Dark " : 2, "Light" : 2})
+        self.assertEqual(len(game_state.empties), 60)
+        self.assertEqual(game_state.score(), check_win(game_state.board))
+
+    def test_apply_move(self):
+        """
+        Test applying a move updates the board, counters and empty squares
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        flipped = game_state.apply_move((2,3), "Dark ")
+        self.assertEqual(flipped, [(3,3)])
+        self.assertEqual(game_state.board[3][2], "Dark ")
+        self.assertEqual(game_state.board[3][3], "Dark ")
+        self.assertEqual(game_state.counts, {"Dark " : 4, "Light" : 1})
+        self.assertNotIn((2,3), game_state.empties)
+        self.assertEqual(game_state.score(), check_win(game_state.board))
+
+    def test_legal_moves_match(self):
+        """
+        Test the GameState move generator agrees with the board move generator
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        game_state.apply_move((2,3), "Dark ")
+        for colour in ["Dark ", "Light"]:
+            self.assertEqual(
+                [(coords, sorted(flipped)) for coords, flipped in game_state.legal_moves(colour)],
+                [(coords, sorted(flipped)) for coords, flipped in legal_moves(game_state.board, colour)]
+            )
+            self.assertTrue(game_state.has_legal_move(colour))
+
+    def test_version(self):
+        """
+        Test the version goes up with each move and down when one is taken back
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        self.assertEqual(game_state.version, 0)
+        game_state.make_move((2,3), "Dark ")
+        self.assertEqual(game_state.version, 1)
+        game_state.unmake_move()
+        self.assertEqual(game_state.version, 0)
+
+    def test_from_dict(self):
+        """
+        Test counters are rebuilt when loading from a dictionary
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        game_state.apply_move((2,3), "Dark ")
+        loaded = GameState.from_dict(game_state.to_dict())
+        self.assertEqual(loaded.counts, game_state.counts)
+        self.assertEqual(loaded.empties, game_state.empties)
+
+class TestMakeUnmake(unittest.TestCase):
+    """
+    Test cases for make_move and unmake_move
+    """
+
+    def test_unmake_restores(self):
+        """
+        Test unmaking a move puts the board and counters back exactly
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        game_state.make_move((2,3), "Dark ")
+        game_state.unmake_move()
+        self.assertEqual(game_state.board, initialise_board())
+        self.assertEqual(game_state.counts, {"Dark " : 2, "Light" : 2})
+        self.assertEqual(len(game_state.empties), 60)
+        self.assertEqual(game_state.undo_stack, [])
+
+    def test_unmake_sequence(self):
+        """
+        Test a sequence of moves can be unmade in reverse order
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        snapshots = []
+        colour = "Dark "
+        for _ in range(6):
+            snapshots.append(([row.copy() for row in game_state.board], dict(game_state.counts)))
+            coords, _ = next(game_state.legal_moves(colour))
+            game_state.make_move(coords, colour)
+            colour = "Dark " if colour == "Light" else "Light"
+        for board, counts in reversed(snapshots):
+            game_state.unmake_move()
+            self.assertEqual(game_state.board, board)
+            self.assertEqual(game_state.counts, counts)
+
+    def test_frontier(self):
+        """
+        Test the frontier kept up to date by each move and unmove matches one worked out
+        from scratch
+        """
+        rng = random.Random(4)
+        game_state = GameState(initialise_board(), "Dark ")
+        self.assertEqual(game_state.frontier, {(x, y) for x in range(2, 6) for y in range(2, 6)}
+                         - {(3, 3), (3, 4), (4, 3), (4, 4)})
+        colour = "Dark "
+        frontiers = []
+        while game_state.has_legal_move("Dark ") or game_state.has_legal_move("Light"):
+            moves = [coords for coords, _ in game_state.legal_moves(colour)]
+            if moves:
+                frontiers.append(set(game_state.frontier))
+                game_state.make_move(rng.choice(moves), colour)
+                fresh = GameState([row.copy() for row in game_state.board], colour)
+                self.assertEqual(game_state.frontier, fresh.frontier)
+            colour = "Dark " if colour == "Light" else "Light"
+        for frontier in reversed(frontiers):
+            game_state.unmake_move()
+            self.assertEqual(game_state.frontier, frontier)
+
+class TestSearchOpponent(unittest.TestCase):
+    """
+    Test functionality of the search based AI opponent
+    """
+
+    def test_returns_legal(self):
+        """
+        Test that the search returns a legal move and leaves the board alone
+        """
+        board = initialise_board()
+        ai_move = choose_search_move(board, "Light", time_limit=0.2)
+        self.assertTrue(legal_move("Light", ai_move, board))
+        self.assertEqual(board, initialise_board())
+
+    def test_takes_corner(self):
+        """
+        Test the search takes a free corner
+        """
+        board = initialise_board()
+        board[0][0] = None
+        board[0][1] = "Dark "
+        board[0][2] = "Light"
+        ai_move = choose_search_move(board, "Light", time_limit=0.2)
+        self.assertEqual(ai_move, (0,0))
+
+    def test_time_budget(self):
+        """
+        Test the search answers within its time budget, even with no time at all
+        """
+        board = initialise_board()
+        start = time.perf_counter()
+        ai_move = choose_search_move(board, "Light", time_limit=0.3)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(legal_move("Light", ai_move, board))
+        self.assertTrue(legal_move("Light", choose_search_move(board, "Light", 0), board))
+
+    def test_no_moves(self):
+        """
+        Test none is returned when there are no moves
+        """
+        board = [
+                [None, None, None, None],
+                [None, None, None, None],
+                [None, None, None, None],
+                [None, None, None, None]
+            ]
+        self.assertIsNone(choose_search_move(board, "Light"))
+
+    def test_must_pass(self):
+        """
+        Test the search gives no move for a player who must pass, but does for their opponent
+        """
+        board = [
+            ["Dark ", "Dark ", "Dark ", "Dark "],
+            ["Dark ", "Light", "Light", None],
+            ["Dark ", "Light", "Light", "Dark "],
+            [None, "Dark ", "Dark ", "Dark "]
+        ]
+        searcher = Searcher(time_limit=1.0)
+        game_state = GameState(board, "Light")
+        self.assertIsNone(searcher.search(game_state, "Light"))
+        self.assertIsNotNone(searcher.search(game_state, "Dark "))
+
+class TestZobrist(unittest.TestCase):
+    """
+    Test cases for Zobrist hashing and the transposition table
+    """
+
+    def test_incremental_hash(self):
+        """
+        Test the hash kept by GameState matches hashing the board from scratch
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        colour = "Dark "
+        for _ in range(8):
+            coords, _ = next(game_state.legal_moves(colour))
+            game_state.make_move(coords, colour)
+            self.assertEqual(game_state.hash, hash_board(game_state.board))
+            colour = "Dark " if colour == "Light" else "Light"
+        for _ in range(8):
+            game_state.unmake_move()
+        self.assertEqual(game_state.hash, hash_board(initialise_board()))
+
+    def test_side_to_move(self):
+        """
+        Test the same board with a different player to move has a different key
+        """
+        board_hash = hash_board(initialise_board())
+        self.assertNotEqual(position_key(board_hash, "Dark "), position_key(board_hash, "Light"))
+
+    def test_store_and_probe(self):
+        """
+        Test an entry can be read back and the counters are updated
+        """
+        table = TranspositionTable()
+        self.assertIsNone(table.probe(1234))
+        table.store(1234, 3, EXACT, 17, (2,3))
+        self.assertEqual(table.probe(1234), (3, EXACT, 17, (2,3)))
+        self.assertEqual(table.stats()["hits"], 1)
+        self.assertEqual(table.stats()["misses"], 1)
+
+    def test_memory_cap(self):
+        """
+        Test the table never grows past its cap and keeps the deeper entry on a collision
+        """
+        table = TranspositionTable(max_bytes=ENTRY_BYTES * 4)
+        self.assertEqual(table.capacity, 4)
+        table.store(1, 5, EXACT, 0, None)
+        table.store(5, 2, EXACT, 0, None)
+        self.assertEqual(table.probe(1), (5, EXACT, 0, None))
+        self.assertEqual(len(table.slots), 4)
+        # Entries from an earlier search are always replaced
+        table.new_search()
+        table.store(5, 2, EXACT, 0, None)
+        self.assertIsNotNone(table.probe(5))
+
+    def test_search_uses_table(self):
+        """
+        Test the search gets hits from the table
+        """
+        searcher = Searcher(time_limit=0.3)
+        searcher.search(GameState(initialise_board(), "Dark "), "Dark ")
+        self.assertGreater(searcher.table.stats()["hits"], 0)
+
+class TestParallelSearch(unittest.TestCase):
+    """
+    Test cases for the root-split parallel search
+    """
+
+    def test_single_worker_deterministic(self):
+        """
+        Test a single worker gives the same move every time and leaves the board alone
+        """
+        board = initialise_board()
+        board[3][2] = "Dark "
+        board[3][3] = "Dark "
+        searcher = ParallelSearcher(1)
+        first = searcher.search(board, "Light", depth=3)
+        self.assertEqual(searcher.search(board, "Light", depth=3), first)
+        self.assertTrue(legal_move("Light", first, board))
+        self.assertEqual(board[3][4], "Dark ")
+
+    def test_workers_agree(self):
+        """
+        Test a pool of workers picks the same move as one worker at a fixed depth
+        """
+        board = initialise_board()
+        board[3][2] = "Dark "
+        board[3][3] = "Dark "
+        single = ParallelSearcher(1).search(board, "Light", depth=3)
+        pool = ParallelSearcher(2)
+        try:
+            self.assertEqual(pool.search(board, "Light", depth=3), single)
+        finally:
+            pool.close()
+
+    def test_no_moves(self):
+        """
+        Test none is returned when there are no moves
+        """
+        board = [[None] * 4 for _ in range(4)]
+        self.assertIsNone(ParallelSearcher(1).search(board, "Light"))
+
+    def test_timeout_frees_pool(self):
+        """
+        Test a timed out search leaves no work behind in the pool
+        """
+        board, colour = random_position(20, 3)
+        pool = ParallelSearcher(2, time_limit=0.3)
+        try:
+            pool.search(board, colour)
+            start = time.perf_counter()
+            pool.pool.submit(int).result()
+            self.assertLess(time.perf_counter() - start, 0.2)
+        finally:
+            pool.close()
+
+    def test_expired_task(self):
+        """
+        Test a root move whose deadline passed while queued isn't searched
+        """
+        cells = bytes(GameState(initialise_board(), "Dark ").cells)
+        self.assertIsNone(search_root_move(cells, 8, "Dark ", (2, 3), 3, time.time() - 1))
+
+class TestEndgame(unittest.TestCase):
+    """
+    Test cases for the exact endgame solver
+    """
+
+    def setUp(self):
+        """
+        A 4x4 position with four empty squares left
+        """
+        self.board = [
+            ["Dark ", "Light", "Light", None],
+            ["Dark ", "Dark ", "Light", None],
+            ["Dark ", "Light", "Dark ", "Light"],
+            [None, "Light", "Light", None]
+        ]
+
+    def brute_force(self, game_state, colour, passed=False):
+        """
+        Plain minimax of the final disc difference, with no pruning
+        """
+        opponent = "Dark " if colour == "Light" else "Light"
+        moves = [coords for coords, _ in game_state.legal_moves(colour)]
+        if not moves:
+            if passed:
+                return game_state.counts[colour] - game_state.counts[opponent]
+            return -self.brute_force(game_state, opponent, True)
+        best = None
+        for coords in moves:
+            game_state.make_move(coords, colour)
+            score = -self.brute_force(game_state, opponent)
+            game_state.unmake_move()
+            best = score if best is None else max(best, score)
+        return best
+
+    def test_exact_matches_brute_force(self):
+        """
+        Test the exact score matches a full minimax, with and without the fast path
+        """
+        game_state = GameState(self.board, "Dark ")
+        expected = self.brute_force(game_state, "Dark ")
+        for fast_path in [0, 4]:
+            solver = EndgameSolver(fast_path_empties=fast_path)
+            self.assertEqual(solver.solve(game_state, "Dark ")[0], expected)
+        self.assertEqual(game_state.board, self.board)
+
+    def test_win_loss_draw(self):
+        """
+        Test win/loss/draw mode gives the sign of the exact score
+        """
+        game_state = GameState(self.board, "Light")
+        exact_score = EndgameSolver().solve(game_state, "Light")[0]
+        wld_score = EndgameSolver(exact=False, fast_path_empties=0).solve(game_state, "Light")[0]
+        self.assertEqual(wld_score, (exact_score > 0) - (exact_score < 0))
+
+    def test_parity_order(self):
+        """
+        Test moves in a region with an odd number of empties come first
+        """
+        board = [[None] * 4 for _ in range(4)]
+        board[0][0] = "Dark "
+        game_state = GameState(board, "Dark ")
+        # Top-left quarter has 3 empties, the rest have 4
+        self.assertEqual(parity_order(game_state, [(3,3), (1,1)]), [(1,1), (3,3)])
+
+    def test_search_uses_solver(self):
+        """
+        Test the search AI picks a move the solver agrees is best in the endgame
+        """
+        game_state = GameState(self.board, "Dark ")
+        best_score = EndgameSolver().solve(game_state, "Dark ")[0]
+        ai_move = Searcher(time_limit=1.0).search(game_state, "Dark ")
+        game_state.make_move(ai_move, "Dark ")
+        self.assertEqual(-EndgameSolver().solve(game_state, "Light")[0], best_score)
+
+    def test_parallel_search_uses_solver(self):
+        """
+        Test the parallel search solves the endgame before sharing out any moves
+        """
+        game_state = GameState(self.board, "Dark ")
+        best_score = EndgameSolver().solve(game_state, "Dark ")[0]
+        searcher = ParallelSearcher(1, time_limit=1.0)
+        ai_move = searcher.search_state(game_state, "Dark ")
+        self.assertEqual(searcher.nodes, 0)
+        self.assertEqual(game_state.board, self.board)
+        game_state.make_move(ai_move, "Dark ")
+        self.assertEqual(-EndgameSolver().solve(game_state, "Light")[0], best_score)
+
+class TestOpeningBook(unittest.TestCase):
+    """
+    Test cases for writing, reading and playing from an opening book
+    """
+
+    def setUp(self):
+        """
+        Build a small book in a temporary directory
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "book.bin")
+        self.entries = build_book(games=3, plies=4, depth=2, seed=1)
+        write_book(self.path, 8, self.entries)
+        self.book = OpeningBook(self.path)
+
+    def tearDown(self):
+        self.book.close()
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        """
+        Test every entry written can be found again
+        """
+        self.assertEqual(len(self.book), len(self.entries))
+        for key, entry in self.entries.items():
+            self.assertEqual(self.book.lookup_key(key), entry)
+        self.assertIsNone(self.book.lookup_key(12345))
+
+    def test_book_moves_legal(self):
+        """
+        Test the book move for the starting position is legal
+        """
+        board = initialise_board()
+        book_move = self.book.lookup(board, "Dark ")
+        self.assertTrue(legal_move("Dark ", book_move, board))
+
+    def test_search_plays_book_move(self):
+        """
+        Test the search AI plays the book move without searching
+        """
+        board = initialise_board()
+        searcher = Searcher(book=self.book)
+        self.assertEqual(searcher.search(GameState(board, "Dark "), "Dark "),
+                         self.book.lookup(board, "Dark "))
+        self.assertEqual(searcher.nodes, 0)
+
+    def test_parallel_search_plays_book_move(self):
+        """
+        Test the parallel search plays the book move without sharing out any moves
+        """
+        board = initialise_board()
+        searcher = ParallelSearcher(1, book=self.book)
+        self.assertEqual(searcher.search(board, "Dark "), self.book.lookup(board, "Dark "))
+        self.assertEqual(searcher.nodes, 0)
+
+    def test_bad_file(self):
+        """
+        Test a file that is not a book is rejected
+        """
+        with open(self.path, "wb") as f:
+            f.write(b"not a book at all")
+        with self.assertRaises(ValueError):
+            OpeningBook(self.path)
+
+class TestGameStore(unittest.TestCase):
+    """
+    Test cases for the per-game store
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = JsonFileBackend(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_games_separate(self):
+        """
+        Test a move in one game does not change another
+        """
+        store = GameStore(self.backend)
+        first_id, first = store.new_game()
+        second_id, _ = store.new_game()
+        first.apply_move((2,3), "Dark ")
+        store.save(first_id, first)
+        self.assertEqual(store.get(first_id).board[3][2], "Dark ")
+        self.assertIsNone(store.get(second_id).board[3][2])
+
+    def test_eviction(self):
+        """
+        Test games pushed out of memory are loaded back from the backend
+        """
+        store = GameStore(self.backend, max_live=2)
+        game_ids = [store.new_game()[0] for _ in range(3)]
+        self.assertEqual(len(store.live), 2)
+        self.assertNotIn(game_ids[0], store.live)
+        self.assertIsNotNone(store.get(game_ids[0]))
+
+    def test_shared_backend(self):
+        """
+        Test a second store (like another process) sees saves made by the first
+        """
+        store = GameStore(self.backend, max_live=0)
+        other_store = GameStore(self.backend, max_live=0)
+        game_id, game_state = store.new_game()
+        game_state.apply_move((2,3), "Dark ")
+        store.save(game_id, game_state)
+        self.assertEqual(other_store.get(game_id).board, game_state.board)
+
+    def test_delete_and_bad_ids(self):
+        """
+        Test deleted games and invalid ids give None
+        """
+        store = GameStore(self.backend)
+        game_id, _ = store.new_game()
+        store.delete(game_id)
+        self.assertIsNone(store.get(game_id))
+        self.assertIsNone(store.get(None))
+        self.assertIsNone(store.get("../../etc/passwd"))
+
+    def test_concurrent_saves(self):
+        """
+        Test threads saving the same game at once each write a whole file
+        """
+        store = GameStore(self.backend, max_live=0)
+        game_id, game_state = store.new_game()
+        threads = [threading.Thread(target=store.save, args=(game_id, game_state))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(store.get(game_id).board, game_state.board)
+        self.assertEqual(os.listdir(self.directory.name), [f"{game_id}.json"])
+
+    def test_game_lock(self):
+        """
+        Test each game has one lock while it is in use, and games don't share locks
+        """
+        store = GameStore(self.backend)
+        first_id, _ = store.new_game()
+        second_id, _ = store.new_game()
+        first_lock = store.game_lock(first_id)
+        self.assertIs(store.game_lock(first_id), first_lock)
+        self.assertIsNot(store.game_lock(second_id), first_lock)
+
+class TestSqliteBackend(unittest.TestCase):
+    """
+    Test cases for the SQLite game store backend
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "games.db")
+        self.backend = SqliteBackend(self.path, batch_size=4, flush_interval=60)
+
+    def tearDown(self):
+        self.backend.close()
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        """
+        Test a saved game loads back with its board and move list
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        game_state.apply_move((2,3), "Dark ")
+        game_state.apply_move((2,2), "Light")
+        self.backend.save("a" * 32, game_state)
+        loaded = self.backend.load("a" * 32)
+        self.assertEqual(loaded.board, game_state.board)
+        self.assertEqual(loaded.history, [((2,3), "Dark "), ((2,2), "Light")])
+        self.assertIsNone(self.backend.load("b" * 32))
+
+    def test_batched(self):
+        """
+        Test saves wait until the batch is full, and repeated saves are coalesced
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        for _ in range(3):
+            self.backend.save("a" * 32, game_state)
+        self.backend.save("b" * 32, game_state)
+        self.assertEqual(len(self.backend.pending), 2)
+        other = sqlite3.connect(self.path)
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM games").fetchone()[0], 0)
+        for name in "cd":
+            self.backend.save(name * 32, game_state)
+        self.assertEqual(self.backend.pending, {})
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM games").fetchone()[0], 4)
+        other.close()
+
+    def test_wal_and_store(self):
+        """
+        Test the database is in WAL mode and works behind a GameStore
+        """
+        mode = self.backend.connection().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+        store = GameStore(self.backend, max_live=0)
+        game_id, game_state = store.new_game()
+        game_state.apply_move((2,3), "Dark ")
+        store.save(game_id, game_state)
+        store.delete(game_id)
+        self.assertIsNone(store.get(game_id))
+
+    def test_stale_save(self):
+        """
+        Test a save from a copy another process has since moved on from is dropped,
+        leaving the board and move list in step
+        """
+        game_id = "a" * 32
+        self.backend.save(game_id, GameState(initialise_board(), "Dark "))
+        self.backend.flush()
+        other = SqliteBackend(self.path, batch_size=1, flush_interval=60)
+        try:
+            mine = self.backend.load(game_id)
+            theirs = other.load(game_id)
+            theirs.apply_move((2,3), "Dark ")
+            other.save(game_id, theirs)
+            mine.apply_move((3,2), "Dark ")
+            mine.apply_move((2,2), "Light")
+            self.backend.save(game_id, mine)
+            self.backend.flush()
+            self.assertEqual(self.backend.conflicts, 1)
+            loaded = self.backend.load(game_id)
+            self.assertEqual(loaded.board, theirs.board)
+            self.assertEqual(loaded.history, [((2,3), "Dark ")])
+        finally:
+            other.close()
+
+    def test_stale_copy_reloaded(self):
+        """
+        Test a store whose save was dropped reads the game again, and can go on saving it
+        """
+        game_id = "a" * 32
+        other = SqliteBackend(self.path, batch_size=1, flush_interval=60)
+        try:
+            store = GameStore(self.backend)
+            other_store = GameStore(other)
+            store.save(game_id, GameState(initialise_board(), "Dark "))
+            self.backend.flush()
+            mine = store.get(game_id)
+            theirs = other_store.get(game_id)
+            theirs.apply_move((2,3), "Dark ")
+            other_store.save(game_id, theirs)
+            mine.apply_move((3,2), "Dark ")
+            store.save(game_id, mine)
+            self.backend.flush()
+            self.assertEqual(self.backend.conflicts, 1)
+
+            reloaded = store.get(game_id)
+            self.assertIsNot(reloaded, mine)
+            self.assertEqual(reloaded.history, [((2,3), "Dark ")])
+            reloaded.apply_move((2,2), "Light")
+            store.save(game_id, reloaded)
+            self.backend.flush()
+            self.assertEqual(self.backend.conflicts, 1)
+            self.assertEqual(other.load(game_id).history, reloaded.history)
+        finally:
+            other.close()
+
+class TestBinaryFormat(unittest.TestCase):
+    """
+    Test cases for the compact binary GameState format
+    """
+
+    def test_round_trip(self):
+        """
+        Test a game in progress survives encoding and decoding
+        """
+        game_state = GameState(initialise_board(), "Light")
+        game_state.apply_move((2,3), "Dark ")
+        data = game_state.to_bytes()
+        self.assertEqual(len(data), 20)
+        loaded = GameState.from_bytes(data)
+        self.assertEqual(loaded.board, game_state.board)
+        self.assertEqual(loaded.cur_player, "Light")
+        self.assertFalse(loaded.finished)
+        self.assertEqual(loaded.hash, game_state.hash)
+
+    def test_flags_and_sizes(self):
+        """
+        Test the finished flag and other board sizes are kept
+        """
+        for size in [2, 4, 6, 10]:
+            game_state = GameState(initialise_board(size), "Dark ", finished=True)
+            loaded = GameState.from_bytes(game_state.to_bytes())
+            self.assertEqual(loaded.board, initialise_board(size))
+            self.assertEqual(loaded.cur_player, "Dark ")
+            self.assertTrue(loaded.finished)
+
+    def test_large_and_old(self):
+        """
+        Test boards of 256 and more are kept, and version 1 data still loads
+        """
+        game_state = GameState(initialise_board(256), "Light")
+        game_state.apply_move((127, 126), "Light")
+        loaded = GameState.from_bytes(game_state.to_bytes())
+        self.assertEqual(loaded.size, 256)
+        self.assertEqual(loaded.cells, game_state.cells)
+        self.assertEqual(loaded.cur_player, "Light")
+
+        data = GameState(initialise_board(), "Light").to_bytes()
+        old = bytes([1, 8, data[3]]) + data[4:]
+        self.assertEqual(GameState.from_bytes(old).board, initialise_board())
+        self.assertEqual(GameState.from_bytes(old).cur_player, "Light")
+
+    def test_bad_data(self):
+        """
+        Test unknown versions and truncated data are rejected
+        """
+        data = GameState(initialise_board(), "Dark ").to_bytes()
+        with self.assertRaises(ValueError):
+            GameState.from_bytes(bytes([99]) + data[1:])
+        with self.assertRaises(ValueError):
+            GameState.from_bytes(data[:-1])
+        # The same square set in both colours
+        overlapping = bytearray(data)
+        overlapping[4] |= 1
+        overlapping[12] |= 1
+        with self.assertRaises(ValueError):
+            GameState.from_bytes(bytes(overlapping))
+
+class TestJournalBackend(unittest.TestCase):
+    """
+    Test cases for the append-only journal backend
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.game_id = "a" * 32
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play(self, backend, moves):
+        """
+        Play moves from the start, saving after each one
+        """
+        game_state = GameState(initialise_board(), "Dark ")
+        backend.save(self.game_id, game_state)
+        colour = "Dark "
+        for _ in range(moves):
+            coords, _ = next(game_state.legal_moves(colour))
+            game_state.apply_move(coords, colour)
+            backend.save(self.game_id, game_state)
+            colour = "Dark " if colour == "Light" else "Light"
+        return game_state
+
+    def test_replay(self):
+        """
+        Test a game loads back from its snapshots and journal, with its full history
+        """
+        backend = JournalBackend(self.directory.name, snapshot_every=4)
+        game_state = self.play(backend, 10)
+        loaded = JournalBackend(self.directory.name).load(self.game_id)
+        self.assertEqual(loaded.board, game_state.board)
+        self.assertEqual(loaded.history, game_state.history)
+        self.assertEqual(loaded.counts, game_state.counts)
+
+    def test_append_only(self):
+        """
+        Test a save without a snapshot due only appends one small move record
+        """
+        backend = JournalBackend(self.directory.name, snapshot_every=100)
+        game_state = self.play(backend, 3)
+        size_before = os.path.getsize(backend.path(self.game_id))
+        coords, _ = next(game_state.legal_moves("Light"))
+        game_state.apply_move(coords, "Light")
+        backend.save(self.game_id, game_state)
+        self.assertEqual(os.path.getsize(backend.path(self.game_id)) - size_before,
+                         MOVE_RECORD.size)
+
+    def test_torn_write(self):
+        """
+        Test a record cut short by a crash is ignored, and cut off before the next save
+        """
+        backend = JournalBackend(self.directory.name, snapshot_every=100)
+        game_state = self.play(backend, 3)
+        with open(backend.path(self.game_id), "ab") as f:
+            f.write(b"N\x03")
+        backend = JournalBackend(self.directory.name, snapshot_every=100)
+        loaded = backend.load(self.game_id)
+        self.assertEqual(loaded.board, game_state.board)
+
+        colour = "Light"
+        for _ in range(2):
+            coords, _ = next(loaded.legal_moves(colour))
+            loaded.apply_move(coords, colour)
+            backend.save(self.game_id, loaded)
+            colour = "Dark " if colour == "Light" else "Light"
+        reloaded = JournalBackend(self.directory.name).load(self.game_id)
+        self.assertEqual(reloaded.board, loaded.board)
+        self.assertEqual(reloaded.history, loaded.history)
+
+    def test_old_snapshot(self):
+        """
+        Test a journal written with the old snapshot header and position format still loads
+        """
+        data = GameState(initialise_board(), "Dark ").to_bytes()
+        position = bytes([1, 8, data[3]]) + data[4:]
+        backend = JournalBackend(self.directory.name)
+        with open(backend.path(self.game_id), "wb") as f:
+            f.write(SNAPSHOT_HEADER_V1.pack(b"S", 0, len(position)) + position
+                    + MOVE_RECORD_V1.pack(b"M", 2, 3, 0))
+        loaded = backend.load(self.game_id)
+        self.assertEqual(loaded.history, [((2, 3), "Dark ")])
+        self.assertEqual(loaded.cell((3, 3)), "Dark ")
+
+    def test_large_board(self):
+        """
+        Test moves past the 256th row and column are journalled
+        """
+        backend = JournalBackend(self.directory.name)
+        game_state = GameState(initialise_board(300), "Dark ")
+        backend.save(self.game_id, game_state)
+        # The journal keeps whatever moves it is given, so no need to play out to there
+        game_state.apply_move((260, 270), "Dark ")
+        game_state.apply_move((299, 3), "Light")
+        backend.save(self.game_id, game_state)
+        loaded = JournalBackend(self.directory.name).load(self.game_id)
+        self.assertEqual(loaded.history, game_state.history)
+        self.assertEqual(loaded.cells, game_state.cells)
+
+    def test_finished_and_resume(self):
+        """
+        Test the finished flag is kept, and a new process carries on the same journal
+        """
+        backend = JournalBackend(self.directory.name)
+        game_state = self.play(backend, 2)
+        game_state.finished = True
+        JournalBackend(self.directory.name).save(self.game_id, game_state)
+        loaded = backend.load(self.game_id)
+        self.assertTrue(loaded.finished)
+        self.assertEqual(len(loaded.history), 2)
+        backend.delete(self.game_id)
+        self.assertIsNone(backend.load(self.game_id))
+
+# Test the asyncio WebSocket server
+class TestAsyncServer(unittest.TestCase):
+    """
+    Test cases for the async game server
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.executor = ThreadPoolExecutor(2)
+        self.store = GameStore(JsonFileBackend(self.directory.name))
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.directory.cleanup()
+
+    async def connect(self, port):
+        """
+        Open a WebSocket connection to the server
+        """
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        response = await reader.readuntil(b"\r\n\r\n")
+        self.assertIn(b"101", response.split(b"\r\n")[0])
+        return reader, writer
+
+    async def send(self, writer, message):
+        """
+        Send a masked JSON message, as a client must
+        """
+        writer.write(encode_frame(json.dumps(message).encode(), mask=b"\x01\x02\x03\x04"))
+        await writer.drain()
+
+    async def receive(self, reader):
+        """
+        Read the next JSON message from the server
+        """
+        _, _, payload = await asyncio.wait_for(read_frame(reader), 10)
+        return json.loads(payload)
+
+    def run_client(self, client):
+        """
+        Run a client coroutine against a server on a free port
+        """
+        async def run():
+            server = GameServer(self.store, self.executor)
+            listener = await server.serve("127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                return await client(port)
+        return asyncio.run(run())
+
+    def test_accept_key(self):
+        """
+        Test the handshake answer matches the example in RFC 6455
+        """
+        self.assertEqual(accept_key("dGhlIHNhbXBsZSBub25jZQ=="), "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=")
+
+    def test_move_and_ai_reply(self):
+        """
+        Test a move is answered straight away and the AI reply is pushed after it
+        """
+        async def client(port):
+            reader, writer = await self.connect(port)
+            await self.send(writer, {"type" : "new"})
+            game = await self.receive(reader)
+            await self.send(writer, {"type" : "move", "x" : 2, "y" : 3})
+            move = await self.receive(reader)
+            ai_move = await self.receive(reader)
+            your_turn = await self.receive(reader)
+            writer.close()
+            return game, move, ai_move, your_turn
+
+        game, move, ai_move, your_turn = self.run_client(client)
+        self.assertEqual(game["version"], 0)
+        self.assertEqual(move["type"], "move")
+        self.assertEqual(move["changes"][0]["placed"], [2, 3])
+        self.assertEqual(move["changes"][0]["flipped"], [[3, 3]])
+        self.assertEqual(ai_move["type"], "ai_move")
+        self.assertEqual(ai_move["changes"][0]["colour"], "Light")
+        self.assertEqual(your_turn["version"], 2)
+        self.assertEqual(len(self.store.get(game["game_id"]).history), 2)
+
+    def test_illegal_move_and_resume(self):
+        """
+        Test an illegal move is refused, and a saved game can be resumed
+        """
+        async def client(port):
+            reader, writer = await self.connect(port)
+            await self.send(writer, {"type" : "new"})
+            game = await self.receive(reader)
+            await self.send(writer, {"type" : "move", "x" : 0, "y" : 0})
+            error = await self.receive(reader)
+            writer.close()
+
+            reader, writer = await self.connect(port)
+            await self.send(writer, {"type" : "resume", "game_id" : game["game_id"]})
+            resumed = await self.receive(reader)
+            writer.close()
+            return game, error, resumed
+
+        game, error, resumed = self.run_client(client)
+        self.assertEqual(error, {"type" : "error", "message" : "Illegal move"})
+        self.assertEqual(resumed["game_id"], game["game_id"])
+
+    def test_not_an_object(self):
+        """
+        Test a JSON message that isn't an object gets an error and keeps the connection
+        """
+        async def client(port):
+            reader, writer = await self.connect(port)
+            await self.send(writer, [1, 2])
+            error = await self.receive(reader)
+            await self.send(writer, {"type" : "new"})
+            game = await self.receive(reader)
+            writer.close()
+            return error, game
+
+        error, game = self.run_client(client)
+        self.assertEqual(error["type"], "error")
+        self.assertEqual(game["type"], "game")
+
+    def test_shared_game(self):
+        """
+        Test a second connection to a game can't move while the AI is thinking for the first
+        """
+        # Hold up the executor so the AI stays thinking until released
+        release = threading.Event()
+        for _ in range(2):
+            self.executor.submit(release.wait)
+
+        async def client(port):
+            reader, writer = await self.connect(port)
+            await self.send(writer, {"type" : "new"})
+            game = await self.receive(reader)
+            other_reader, other_writer = await self.connect(port)
+            await self.send(other_writer, {"type" : "resume", "game_id" : game["game_id"]})
+            await self.receive(other_reader)
+
+            await self.send(writer, {"type" : "move", "x" : 2, "y" : 3})
+            await self.receive(reader)
+            await self.send(other_writer, {"type" : "move", "x" : 4, "y" : 5})
+            error = await self.receive(other_reader)
+            release.set()
+            ai_move = await self.receive(reader)
+            await self.receive(reader)
+            writer.close()
+            other_writer.close()
+            return game, error, ai_move
+
+        game, error, ai_move = self.run_client(client)
+        self.assertEqual(error, {"type" : "error", "message" : "AI is thinking"})
+        self.assertEqual(ai_move["type"], "ai_move")
+        self.assertEqual(self.store.get(game["game_id"]).counts, {"Dark " : 3, "Light" : 3})
+
+    def test_not_websocket(self):
+        """
+        Test plain HTTP requests are turned away
+        """
+        async def client(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            return response
+
+        self.assertTrue(self.run_client(client).startswith(b"HTTP/1.1 404"))
+
+# Test pondering on the player's time
+class TestPonder(unittest.TestCase):
+    """
+    Test cases for Ponderer
+    """
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(1)
+        self.ponderer = Ponderer(candidates=4, time_limit=0.05, executor=self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_cached_reply(self):
+        """
+        Test each pondered position has a legal reply waiting once the player moves into it
+        """
+        game_state = GameState(initialise_board(8), "Dark ")
+        self.ponderer.ponder("game", game_state)
+        self.executor.shutdown(wait=True)
+        self.assertEqual(game_state.version, 0)
+        self.assertEqual(len(self.ponderer.cache), 4)
+
+        game_state.apply_move((2, 3), "Dark ")
+        ai_move = self.ponderer.take(game_state)
+        self.assertTrue(legal_move("Light", ai_move, game_state.board))
+        self.assertEqual(self.ponderer.hits, 1)
+
+    def test_miss(self):
+        """
+        Test a position that wasn't pondered gives no reply
+        """
+        game_state = GameState(initialise_board(8), "Dark ")
+        game_state.apply_move((2, 3), "Dark ")
+        self.assertIsNone(self.ponderer.take(game_state))
+        self.assertEqual(self.ponderer.misses, 1)
+
+    def test_queued_stopped(self):
+        """
+        Test the game's other candidates are cancelled when the player moves, and a reply
+        that never gets to start is only waited on for the time given
+        """
+        # Keep the single worker busy so every candidate stays queued
+        release = threading.Event()
+        self.executor.submit(release.wait)
+        game_state = GameState(initialise_board(8), "Dark ")
+        self.ponderer.ponder("game", game_state)
+        futures = [future for future, _ in self.ponderer.in_flight.values()]
+        game_state.apply_move((2, 3), "Dark ")
+        start = time.perf_counter()
+        self.assertIsNone(self.ponderer.take(game_state, "game", 0.1))
+        self.assertLess(time.perf_counter() - start, 0.15)
+        release.set()
+        self.assertTrue(all(future.cancelled() for future in futures))
+
+    def test_queued_behind_stale(self):
+        """
+        Test a reply queued behind another candidate gets to run once that candidate is
+        stopped, and its move so far is used when the time given runs out
+        """
+        ponderer = Ponderer(candidates=2, time_limit=5.0, executor=self.executor)
+        game_state = GameState(initialise_board(8), "Dark ")
+        ponderer.ponder("game", game_state)
+        (first, _), (second, _) = ponderer.in_flight.values()
+        game_state.apply_move(order_moves(game_state, "Dark ")[1], "Dark ")
+        time.sleep(0.1)
+        self.assertTrue(first.running())
+        start = time.perf_counter()
+        ai_move = ponderer.take(game_state, "game", 0.3)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertTrue(game_state.legal_move("Light", ai_move))
+        self.assertEqual(ponderer.hits, 1)
+        self.assertTrue(second.done())
+        # The stopped searches only had part of their time, so aren't cached
+        self.assertEqual(len(ponderer.cache), 0)
+
+    def test_stale_stopped(self):
+        """
+        Test pondering again stops the searches from the game's previous turn
+        """
+        ponderer = Ponderer(candidates=1, time_limit=5.0, executor=self.executor)
+        game_state = GameState(initialise_board(8), "Dark ")
+        ponderer.ponder("game", game_state)
+        (future, _), = ponderer.in_flight.values()
+        time.sleep(0.05)
+        game_state.apply_move((2, 3), "Dark ")
+        game_state.apply_move((2, 2), "Light")
+        start = time.perf_counter()
+        ponderer.ponder("game", game_state)
+        future.result(timeout=1.0)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        ponderer.close()
+
+    def test_cache_limit(self):
+        """
+        Test the cache forgets the least recently used replies
+        """
+        ponderer = Ponderer(max_cached=2, executor=self.executor)
+        for key in range(3):
+            ponderer.remember(key, (0, key))
+        self.assertEqual(list(ponderer.cache), [1, 2])
+
+# Test the self-play simulator
+class TestSelfPlay(unittest.TestCase):
+    """
+    Test cases for the self-play simulator
+    """
+
+    def test_play_game(self):
+        """
+        Test a game is played to the end with scores matching its moves
+        """
+        result = play_game("greedy", "random", seed=3)
+        game_state = GameState(initialise_board(8), "Dark ")
+        for x, y, colour in result["moves"]:
+            self.assertTrue(legal_move(colour, (x, y), game_state.board))
+            game_state.apply_move((x, y), colour)
+        self.assertFalse(game_state.has_legal_move("Dark "))
+        self.assertFalse(game_state.has_legal_move("Light"))
+        (light_score, dark_score), winner = check_win(game_state.board)
+        self.assertEqual(result["score"], {"Dark " : dark_score, "Light" : light_score})
+        self.assertEqual(result["winner"], winner)
+
+    def test_repeatable(self):
+        """
+        Test the same seed plays the same game
+        """
+        self.assertEqual(play_game("random", "search:1", seed=5)["moves"],
+                         play_game("random", "search:1", seed=5)["moves"])
+
+    def test_sinks(self):
+        """
+        Test a batch is written to both kinds of file, swapping sides each game
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl_path = os.path.join(directory, "results.jsonl")
+            sink = JsonlSink(jsonl_path)
+            results = list(simulate(4, "greedy", "random", workers=1, sink=sink))
+            sink.close()
+            with open(jsonl_path, "r", encoding="UTF-8") as f:
+                self.assertEqual([json.loads(line) for line in f], results)
+            self.assertEqual([result["dark"] for result in results],
+                             ["greedy", "random", "greedy", "random"])
+
+            binary_path = os.path.join(directory, "results.bin")
+            sink = BinarySink(binary_path)
+            for result in results:
+                sink.write(result)
+            sink.close()
+            read_back = read_binary_results(binary_path)
+            self.assertEqual([game["moves"] for game in read_back],
+                             [result["moves"] for result in results])
+            self.assertEqual([game["swapped"] for game in read_back], [False, True, False, True])
+
+        summary = summarise(results, 1.0)
+        self.assertEqual(summary["games"], 4)
+        self.assertEqual(sum(summary["wins"].values()) + summary["draws"], 4)
+
+    def test_unknown_policy(self):
+        """
+        Test an unknown policy name is refused straight away
+        """
+        with self.assertRaises(ValueError):
+            list(simulate(1, "greedy", "nonsense", workers=1))
+
+# Test batched move generation
+@unittest.skipUnless(batch_moves.np is not None, "NumPy is not installed")
+class TestBatchMoves(unittest.TestCase):
+    """
+    Test cases for batch_moves, checked against legal_move and count_flipped
+    """
+
+    def test_against_legal_move(self):
+        """
+        Test legal moves and flip counts match the single board functions on random positions
+        """
+        for size in (6, 8):
+            positions = [random_position(moves % (size * size - 4), moves, size)[0]
+                         for moves in range(60)]
+            cells = batch_moves.encode_boards(positions)
+            for colour in ("Dark ", "Light"):
+                counts = batch_moves.batch_flip_counts(cells, colour)
+                legal = batch_moves.batch_legal_moves(cells, colour)
+                for n, board in enumerate(positions):
+                    for y in range(size):
+                        for x in range(size):
+                            expected = legal_move(colour, (x, y), board)
+                            self.assertEqual(bool(legal[n, y, x]), expected)
+                            if expected:
+                                self.assertEqual(counts[n, y, x],
+                                                 count_flipped(board, colour, (x, y)))
+
+    def test_bitboards(self):
+        """
+        Test the uint64 bitboard batch matches the tensor batch and bitboard.py
+        """
+        positions = [random_position(moves % 60, moves)[0] for moves in range(200)]
+        pairs = [board_to_bitboards(board) for board in positions]
+        dark = batch_moves.np.array([pair[0] for pair in pairs], dtype=batch_moves.np.uint64)
+        light = batch_moves.np.array([pair[1] for pair in pairs], dtype=batch_moves.np.uint64)
+        cells = batch_moves.encode_boards(positions)
+        self.assertTrue((batch_moves.bitboards_to_cells(dark, light) == cells).all())
+
+        masks = batch_moves.batch_legal_masks(dark, light)
+        for mask, (dark_bits, light_bits) in zip(masks, pairs):
+            self.assertEqual(int(mask), legal_moves_mask(dark_bits, light_bits, 8))
+
+# Test the benchmark suite
+class TestBenchmark(unittest.TestCase):
+    """
+    Test cases for the benchmark suite
+    """
+
+    def test_corpus_fixed(self):
+        """
+        Test a corpus is the same every time it is built
+        """
+        self.assertEqual(position_corpus("opening"), position_corpus("opening"))
+        self.assertEqual(len(position_corpus("large16")[0][0]), 16)
+
+    def test_compare(self):
+        """
+        Test only slowdowns beyond the threshold and changed perft counts are regressions
+        """
+        results = run_suite(repeat=1, number=1, perft_depth=2, corpora=("opening",))
+        self.assertEqual(compare(results, results), [])
+
+        baseline = json.loads(json.dumps(results))
+        baseline["ops_per_second"]["opening"]["legal_move"] = \
+            results["ops_per_second"]["opening"]["legal_move"] * 1.05
+        self.assertEqual(compare(results, baseline, threshold=0.1), [])
+        baseline["ops_per_second"]["opening"]["legal_move"] *= 2
+        baseline["perft"]["2"]["nodes"] = 13
+        self.assertEqual(len(compare(results, baseline, threshold=0.1)), 2)
+
+# Test perft
+class TestPerft(unittest.TestCase):
+    """
+    Test cases for perft
+    """
+
+    def test_known_counts(self):
+        """
+        Test the counts from the starting board match the known values, with and without
+        the cache, and the board is left as it was
+        """
+        game_state = GameState(initialise_board(8), "Dark ")
+        for use_cache in (True, False):
+            counts = perft_counts(game_state, "Dark ", 5, use_cache=use_cache)
+            self.assertEqual([nodes for _, nodes, _ in counts], list(KNOWN_COUNTS[:5]))
+        self.assertEqual(game_state.board, initialise_board(8))
+        self.assertEqual(game_state.version, 0)
+
+    def test_passes(self):
+        """
+        Test a pass counts as a move, and two passes end the game
+        """
+        board = [[None] * 4 for _ in range(4)]
+        board[0][0] = "Dark "
+        board[0][1] = "Light"
+        # Dark can play at (2, 0), then Light can't go and nor can Dark
+        game_state = GameState(board, "Dark ")
+        self.assertEqual(perft(game_state, "Dark ", 1), 1)
+        self.assertEqual(perft(game_state, "Dark ", 2), 1)
+        self.assertEqual(perft(game_state, "Dark ", 5), 1)
+        self.assertEqual(divide(game_state, "Light", 2), {None : 1})
+
+    def test_parallel_divide(self):
+        """
+        Test splitting the root moves between processes gives the same counts
+        """
+        game_state = GameState(initialise_board(8), "Dark ")
+        self.assertEqual(divide(game_state, "Dark ", 4, workers=2),
+                         divide(game_state, "Dark ", 4, workers=1, use_cache=False))
+
+# Test large boards and the frontier move generator
+class TestLargeBoards(unittest.TestCase):
+    """
+    Test cases for large boards and frontier move generation
+    """
+
+    def test_frontier_mask(self):
+        """
+        Test the frontier is exactly the empty cells next to a token
+        """
+        board, _ = random_position(10, 2, 10)
+        dark, light = board_to_bitboards(board)
+        frontier = {bit_to_coord(bit, 10) for bit in iter_bits(frontier_mask(dark, light, 10))}
+        expected = set()
+        for x in range(10):
+            for y in range(10):
+                if board[y][x] is None and any(
+                        0 <= x + dx < 10 and 0 <= y + dy < 10 and board[y + dy][x + dx] is not None
+                        for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+                    expected.add((x, y))
+        self.assertEqual(frontier, expected)
+
+    def test_frontier_moves(self):
+        """
+        Test frontier generation finds the same moves and flips as the full board generator
+        """
+        for size in (6, 8, 12):
+            for seed in range(20):
+                board, colour = random_position(seed * 3, seed, size)
+                player, opponent = split_colour(*board_to_bitboards(board), colour)
+                expected = [(move, flips_mask(player, opponent, move, size))
+                            for move in iter_bits(legal_moves_mask(player, opponent, size))]
+                self.assertEqual(list(generate_frontier_moves(player, opponent, size)), expected)
+
+    def test_large_board(self):
+        """
+        Test move generation on a 64x64 board agrees with legal_move
+        """
+        board, colour = random_position(40, 1, 64)
+        moves = dict(legal_moves(board, colour))
+        self.assertTrue(moves)
+        for x in range(64):
+            for y in range(64):
+                self.assertEqual(legal_move(colour, (x, y), board), (x, y) in moves)
+        game_state = GameState(board, colour)
+        self.assertEqual({coords: sorted(flipped) for coords, flipped in game_state.legal_moves(colour)},
+                         {coords: sorted(flipped) for coords, flipped in moves.items()})
+
+# Test the precomputed board tables
+class TestBoardTables(unittest.TestCase):
+    """
+    Test cases for ray_table and neighbour_table
+    """
+
+    def test_rays(self):
+        """
+        Test a corner has three rays to the far edges, and a centre square eight
+        """
+        rays = ray_table(8)
+        self.assertEqual(len(rays[0]), 3)
+        self.assertIn((1, 1, 9, 7), rays[0])
+        self.assertEqual(len(rays[3 * 8 + 3]), 8)
+        self.assertEqual(sum(length for _, _, _, length in rays[3 * 8 + 3]),
+                         3 + 4 + 3 + 4 + 3 + 4 + 3 + 3)
+
+    def test_neighbours(self):
+        """
+        Test neighbours are the first square of each ray
+        """
+        size = 6
+        neighbours = neighbour_table(size)
+        self.assertEqual(set(neighbours[0]), {1, 6, 7})
+        self.assertEqual(len(neighbours[2 * size + 2]), 8)
+        for index, rays in enumerate(ray_table(size)):
+            self.assertEqual(sorted(neighbours[index]), sorted(index + step for _, _, step, _ in rays))
+
+    def test_large_board(self):
+        """
+        Test equal rays on a large board are shared rather than built per square
+        """
+        rays = ray_table(256)
+        self.assertEqual(rays[0], ((0, 1, 1, 255), (1, 0, 256, 255), (1, 1, 257, 255)))
+        # Square (1, 0) shares the (0, 1) ray of the same length
+        self.assertIs(next(ray for ray in rays[256] if ray == rays[0][0]), rays[0][0])
+
+    def test_shared(self):
+        """
+        Test each size is only built once
+        """
+        self.assertIs(ray_table(10), ray_table(10))
+
+# Test the compact cell encoding
+class TestCells(unittest.TestCase):
+    """
+    Test cases for the cell encoding used inside GameState
+    """
+
+    def test_round_trip(self):
+        """
+        Test boards survive being encoded and decoded, and match the bitboards
+        """
+        for size in (4, 8, 10):
+            board, _ = random_position(size * 2, size, size)
+            cells = encode_board(board)
+            self.assertEqual(len(cells), size * size)
+            self.assertEqual(decode_board(cells, size), board)
+            self.assertEqual(cells_to_bitboards(cells), board_to_bitboards(board))
+            self.assertEqual(bitboards_to_cells(*board_to_bitboards(board), len(board)), cells)
+
+    def test_against_board_functions(self):
+        """
+        Test the cell scans agree with legal_move, flipped_by and count_flipped
+        """
+        for seed in range(20):
+            board, colour = random_position(seed * 3, seed)
+            cells = encode_board(board)
+            player = CELL_VALUES[colour]
+            for x in range(8):
+                for y in range(8):
+                    if board[y][x] is not None:
+                        continue
+                    index = x * 8 + y
+                    self.assertEqual(legal_cell(cells, 8, player, index),
+                                     legal_move(colour, (x, y), board))
+                    self.assertEqual(sorted(divmod(flip, 8) for flip in flipped_cells(cells, 8, player, index)),
+                                     sorted(flipped_by(board, colour, (x, y))))
+                    self.assertEqual(count_flipped_cells(cells, 8, player, index),
+                                     count_flipped(board, colour, (x, y)))
+
+    def test_board_is_a_copy(self):
+        """
+        Test GameState keeps its own cells, and hands out the board as strings
+        """
+        board = initialise_board()
+        game_state = GameState(board, "Dark ")
+        game_state.apply_move((2, 3), "Dark ")
+        self.assertEqual(board, initialise_board())
+        self.assertEqual(game_state.board[3][2], "Dark ")
+        self.assertEqual(game_state.cell((2, 3)), "Dark ")
+        game_state.board[3][2] = None
+        self.assertEqual(game_state.cell((2, 3)), "Dark ")
+
+    def test_game_state_moves(self):
+        """
+        Test the GameState move checks agree with legal_move and possible_flip_counts,
+        and copies built from cells are separate games
+        """
+        for seed in range(20):
+            board, colour = random_position(seed * 3, seed)
+            game_state = GameState(board, colour)
+            self.assertEqual(list(game_state.flip_counts(colour).items()),
+                             list(possible_flip_counts(board, colour).items()))
+            for x in range(8):
+                for y in range(8):
+                    self.assertEqual(game_state.legal_move(colour, (x, y)),
+                                     legal_move(colour, (x, y), board))
+            copy = game_state.copy()
+            self.assertEqual((copy.board, copy.hash, copy.frontier),
+                             (game_state.board, game_state.hash, game_state.frontier))
+            self.assertIsNot(copy.cells, game_state.cells)
+        with self.assertRaises(IndexError):
+            game_state.legal_move(colour, (8, 0))
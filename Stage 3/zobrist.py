@@ -0,0 +1,176 @@
+"""
+Module providing Zobrist hashing of boards and a fixed-size transposition table,
+so that any search can recognise positions it has already looked at
+"""
+
+import random
+from functools import lru_cache
+
+# Fixed seed so every process (and every saved file that stores hashes) agrees on the keys
+ZOBRIST_SEED = 0x07E110
+
+# Bound types stored in the transposition table
+EXACT = 0
+LOWER = 1 # The real score is at least the stored score
+UPPER = 2 # The real score is at most the stored score
+
+# Rough size of one table entry in bytes (the entry tuple plus the integers it holds),
+# used to turn a memory cap into a number of slots
+ENTRY_BYTES = 160
+
+@lru_cache(maxsize=None)
+def zobrist_keys(size:int) -> dict:
+    """
+    Return the random 64-bit key for each colour on each square of a board size
+
+    :param size: board dimension
+    :type size: int
+    :return: dictionary of colour to list of keys, indexed by x * size + y
+    :rtype: dict
+    """
+    rng = random.Random(ZOBRIST_SEED + size)
+    return {
+        "Dark " : [rng.getrandbits(64) for _ in range(size * size)],
+        "Light" : [rng.getrandbits(64) for _ in range(size * size)]
+    }
+
+# XORed in when Light is to move
+SIDE_KEY = random.Random(ZOBRIST_SEED).getrandbits(64)
+
+def hash_board(board:list) -> int:
+    """
+    Hash a board from scratch
+
+    :param board: 2D list representing the board
+    :type board: list
+    :return: 64-bit Zobrist hash of the board (not including the side to move)
+    :rtype: int
+    """
+    size = len(board)
+    keys = zobrist_keys(size)
+    board_hash = 0
+    for x in range(size):
+        for y in range(size):
+            cell = board[y][x]
+            if cell is not None:
+                board_hash ^= keys[cell][x * size + y]
+    return board_hash
+
+def move_hash_delta(size:int, coords:tuple, colour:str, flipped:list) -> int:
+    """
+    Return the value to XOR into a board hash to apply (or undo) a move
+
+    :param size: board dimension
+    :type size: int
+    :param coords: coordinates of the placed token
+    :type coords: tuple
+    :param colour: colour of the player making the move
+    :type colour: str
+    :param flipped: coordinates flipped by the move
+    :type flipped: list
+    :return: hash delta
+    :rtype: int
+    """
+    keys = zobrist_keys(size)
+    delta = keys[colour][coords[0] * size + coords[1]]
+    for x, y in flipped:
+        # A flip removes the opponent's token and adds the player's
+        delta ^= keys["Dark "][x * size + y] ^ keys["Light"][x * size + y]
+    return delta
+
+def position_key(board_hash:int, colour:str) -> int:
+    """
+    Combine a board hash with the side to move
+
+    :param board_hash: hash of the board
+    :type board_hash: int
+    :param colour: player to move
+    :type colour: str
+    :return: hash of the position
+    :rtype: int
+    """
+    if colour == "Light":
+        return board_hash ^ SIDE_KEY
+    return board_hash
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results keyed by position hash.
+    Each slot holds one entry of (key, depth, bound, score, best move, generation).
+    The table never grows past the number of slots set by its memory cap.
+    """
+    def __init__(self, max_bytes:int = 16 * 1024 * 1024) -> None:
+        self.capacity = max(1, max_bytes // ENTRY_BYTES)
+        self.slots = [None] * self.capacity
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self) -> None:
+        """
+        Mark entries from earlier searches as old, so they are replaced first
+        """
+        self.generation += 1
+
+    def probe(self, key:int) -> tuple | None:
+        """
+        Look up a position
+
+        :param key: position hash
+        :type key: int
+        :return: (depth, bound, score, best move) if the position is stored, otherwise None
+        :rtype: tuple | None
+        """
+        entry = self.slots[key % self.capacity]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:5]
+        self.misses += 1
+        return None
+
+    def store(self, key:int, depth:int, bound:int, score:int, best_move:tuple | None) -> None:
+        """
+        Store a search result. The slot is replaced if it is empty, holds the same position,
+        comes from an earlier search, or was searched less deeply than the new result.
+
+        :param key: position hash
+        :param depth: depth the position was searched to
+        :param bound: EXACT, LOWER or UPPER
+        :param score: score found
+        :param best_move: best move found, if any
+        """
+        index = key % self.capacity
+        entry = self.slots[index]
+        if entry is not None:
+            if entry[0] != key and entry[5] == self.generation and entry[1] > depth:
+                return
+            if entry[0] != key:
+                self.overwrites += 1
+        self.slots[index] = (key, depth, bound, score, best_move, self.generation)
+        self.stores += 1
+
+    def clear(self) -> None:
+        """
+        Empty the table and reset the counters
+        """
+        self.slots = [None] * self.capacity
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def stats(self) -> dict:
+        """
+        Return the hit/miss counters, for tuning the table size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "capacity" : self.capacity,
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "hit_rate" : self.hits / lookups if lookups else 0.0,
+            "stores" : self.stores,
+            "overwrites" : self.overwrites
+        }